@@ -4,12 +4,10 @@ import argparse # Import the argument parsing library
 from decimal import Decimal, InvalidOperation
 
 # Import the tools and configuration from your other files
-from excel_handler import ExcelHandler
+from xlsx_stream_reader import load_sheet_grid
+from compact_format import is_compact_path, write_compact
 import sheet_parser
-from config import (
-    SHEET_NAME,
-    STOP_EXTRACTION_ON_EMPTY_COLUMN
-)
+from config import SHEET_NAME
 
 # Set up basic logging to see the output from the modules
 logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s')
@@ -22,41 +20,20 @@ def run_final_extraction(input_filepath, output_filepath):
     """
     # --- 1. EXTRACTION ---
     logging.info(f"--- Starting Extraction for {input_filepath} ---")
-    handler = ExcelHandler(input_filepath) # Use the input filepath argument
-    sheet = handler.load_sheet(sheet_name=SHEET_NAME)
-    if not sheet:
+    # Large packing lists are streamed straight from the sheet XML (see config.EXTRACTION_BACKEND)
+    grid = load_sheet_grid(input_filepath, sheet_name=SHEET_NAME) # Use the input filepath argument
+    if grid is None:
         logging.error("Failed to load the sheet. Exiting.")
         return
 
-    all_tables_data = {}
-    last_found_row = 0
-    table_count = 0
-    column_mapping = None
-
-    while True:
-        sheet_parser.HEADER_SEARCH_ROW_RANGE = (last_found_row + 1, sheet.max_row)
-        header_info = sheet_parser.find_and_map_smart_headers(sheet)
-        
-        if not header_info:
-            logging.info("No more valid tables found. Ending search.")
-            break
-
-        header_row, current_mapping = header_info
-        if column_mapping is None:
-            column_mapping = current_mapping
-
-        logging.info(f"Found table {table_count + 1} at row {header_row}")
-
-        extracted_data = sheet_parser.extract_multiple_tables(sheet, [header_row], column_mapping)
-        if extracted_data:
-            table_count += 1
-            all_tables_data[table_count] = extracted_data[1]
-            num_rows_in_table = len(extracted_data[1].get(STOP_EXTRACTION_ON_EMPTY_COLUMN, []))
-            last_found_row = header_row + num_rows_in_table
-        else:
-            break
-            
-    handler.close()
+    # Walk the sheet once to find every table, then extract them all with the
+    # first table's column mapping.
+    segments = sheet_parser.segment_tables(grid)
+    for table_number, (header_row, _, (first_data_row, end_data_row)) in enumerate(segments, start=1):
+        logging.info(f"Found table {table_number} at row {header_row} (data rows {first_data_row}-{end_data_row - 1})")
+    if not segments:
+        logging.info("No valid tables found.")
+    all_tables_data = sheet_parser.extract_segments(grid, segments)
 
     if not all_tables_data:
         logging.warning("Extraction finished, but no data was returned.")
@@ -97,13 +74,20 @@ def run_final_extraction(input_filepath, output_filepath):
 
     final_output = {"raw_data": all_tables_data, "aggregated_summary": aggregated_summary}
 
+    logging.info("--- Aggregation Complete! ---")
+    if is_compact_path(output_filepath):
+        # Compact columnar format (.json.gz): streamed to the file, never built as one string
+        write_compact(final_output, output_filepath)
+        logging.info(f"Summary: {json.dumps(aggregated_summary)}")
+        logging.info(f"Saved compact output to {output_filepath}")
+        return
+
     def json_converter(o):
         if isinstance(o, Decimal): return str(o)
         raise TypeError(f"Object of type {o.__class__.__name__} is not JSON serializable")
 
     output_json = json.dumps(final_output, indent=4, default=json_converter)
 
-    logging.info("--- Aggregation Complete! ---")
     print("\nFinal JSON Output:")
     print(output_json)
 
@@ -121,7 +105,7 @@ if __name__ == "__main__":
     parser.add_argument("input_file", help="Path to the input Excel file (e.g., JF.xlsx).")
     
     # Optional argument for the output file
-    parser.add_argument("-o", "--output", default="output.json", help="Path for the output JSON file (default: output.json).")
+    parser.add_argument("-o", "--output", default="output.json", help="Path for the output JSON file (default: output.json). A '.json.gz' path writes the compact columnar format.")
     
     args = parser.parse_args()
 
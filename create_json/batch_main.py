@@ -0,0 +1,146 @@
+# --- START OF FULL FILE: batch_main.py ---
+# Batch entry point: runs run_invoice_automation over many workbooks in parallel.
+
+import argparse
+import datetime
+import glob
+import json
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+MANIFEST_FILENAME = "batch_manifest.json"
+
+
+def collect_workbooks(inputs: List[str], recursive: bool = False) -> List[Path]:
+    """
+    Expands directories and glob patterns into a sorted, de-duplicated list of .xlsx files.
+    Excel lock files ('~$...') are ignored.
+    """
+    found: Dict[str, Path] = {}
+    for entry in inputs:
+        if os.path.isdir(entry):
+            pattern = os.path.join(entry, "**", "*.xlsx") if recursive else os.path.join(entry, "*.xlsx")
+            matches = glob.glob(pattern, recursive=recursive)
+        else:
+            matches = glob.glob(entry, recursive=recursive)
+            if not matches:
+                logging.warning(f"[collect_workbooks] No files matched '{entry}'.")
+        for match in matches:
+            path = Path(match)
+            if path.is_file() and path.suffix.lower() == ".xlsx" and not path.name.startswith("~$"):
+                found[str(path.resolve())] = path.resolve()
+    return [found[key] for key in sorted(found)]
+
+
+def _init_worker(log_level: int):
+    """Applies the batch log level in each worker (main.py configures DEBUG on import)."""
+    logging.getLogger().setLevel(log_level)
+
+
+def _process_workbook(input_path: str, output_dir: str) -> Dict[str, Any]:
+    """Runs the extraction for one workbook and returns its manifest entry."""
+    # Imported here so each worker process loads the pipeline (and its config) itself.
+    from main import run_invoice_automation
+
+    entry: Dict[str, Any] = {"file": input_path, "output": None, "status": "failed", "tables": 0, "rows": 0, "seconds": 0.0, "error": None}
+    start_time = time.time()
+    try:
+        result = run_invoice_automation(input_excel_override=input_path, output_dir_override=output_dir)
+        if result is not None:
+            tables = result.get("processed_tables_data", {}) or {}
+            entry["status"] = "ok"
+            entry["output"] = str(Path(output_dir) / f"{Path(input_path).stem}.json")
+            entry["tables"] = len(tables)
+            entry["rows"] = sum(len(table.get("amount", []) or []) for table in tables.values() if isinstance(table, dict))
+        else:
+            entry["error"] = "Extraction failed; see log for details."
+    except Exception as e:
+        entry["error"] = f"{type(e).__name__}: {e}"
+    entry["seconds"] = round(time.time() - start_time, 3)
+    return entry
+
+
+def run_batch(inputs: List[str], output_dir: str, workers: Optional[int] = None, recursive: bool = False, log_level: int = logging.WARNING) -> Dict[str, Any]:
+    """
+    Extracts every workbook matched by inputs into output_dir using a process pool,
+    then writes a manifest (batch_manifest.json) with per-file status, table/row
+    counts and timings.
+
+    Returns:
+        The manifest dictionary.
+    """
+    prefix = "[run_batch]"
+    output_path = Path(output_dir).resolve()
+    output_path.mkdir(parents=True, exist_ok=True)
+    workbooks = collect_workbooks(inputs, recursive=recursive)
+    workers = max(1, workers or os.cpu_count() or 1)
+    logging.info(f"{prefix} Found {len(workbooks)} workbook(s). Running with {workers} worker(s).")
+
+    entries: List[Dict[str, Any]] = []
+    to_process: List[Path] = []
+    seen_stems: Dict[str, Path] = {}
+    for workbook in workbooks:
+        # Outputs are named <stem>.json, so a second workbook with the same stem would overwrite the first.
+        if workbook.stem in seen_stems:
+            entries.append({"file": str(workbook), "output": None, "status": "skipped", "tables": 0, "rows": 0, "seconds": 0.0,
+                            "error": f"Duplicate output name '{workbook.stem}.json' (already used by {seen_stems[workbook.stem]})."})
+            continue
+        seen_stems[workbook.stem] = workbook
+        to_process.append(workbook)
+
+    started_at = datetime.datetime.now()
+    batch_start = time.time()
+    if to_process:
+        with ProcessPoolExecutor(max_workers=min(workers, len(to_process)), initializer=_init_worker, initargs=(log_level,)) as executor:
+            futures = {executor.submit(_process_workbook, str(workbook), str(output_path)): workbook for workbook in to_process}
+            for future in as_completed(futures):
+                workbook = futures[future]
+                try:
+                    entry = future.result()
+                except Exception as e: # Worker crashed (e.g. killed or unpicklable result)
+                    entry = {"file": str(workbook), "output": None, "status": "failed", "tables": 0, "rows": 0, "seconds": 0.0, "error": f"{type(e).__name__}: {e}"}
+                entries.append(entry)
+                logging.info(f"{prefix} [{entry['status'].upper()}] {workbook.name} ({entry['seconds']:.2f}s, {entry['tables']} table(s))")
+
+    entries.sort(key=lambda e: e["file"])
+    status_counts: Dict[str, int] = {}
+    for entry in entries:
+        status_counts[entry["status"]] = status_counts.get(entry["status"], 0) + 1
+
+    manifest = {
+        "started_at": started_at.isoformat(),
+        "finished_at": datetime.datetime.now().isoformat(),
+        "workers": workers,
+        "total_seconds": round(time.time() - batch_start, 3),
+        "file_count": len(entries),
+        "status_counts": status_counts,
+        "files": entries,
+    }
+    manifest_path = output_path / MANIFEST_FILENAME
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=4, ensure_ascii=False)
+    logging.info(f"{prefix} Wrote manifest to '{manifest_path}'. Status counts: {status_counts}")
+    return manifest
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Extract JSON data from many Excel invoice files in parallel.")
+    parser.add_argument("inputs", nargs="+", help="Directories and/or glob patterns of .xlsx files (quote globs, e.g. 'data/*.xlsx').")
+    parser.add_argument("--output-dir", required=True, help="Directory for the per-workbook JSON files and the batch manifest.")
+    parser.add_argument("--workers", type=int, default=None, help="Number of worker processes (default: CPU count).")
+    parser.add_argument("--recursive", action="store_true", help="Search directories and '**' globs recursively.")
+    parser.add_argument("--log-level", default="WARNING", help="Log level for the extraction workers (default: WARNING).")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    batch_manifest = run_batch(args.inputs, args.output_dir, workers=args.workers, recursive=args.recursive,
+                               log_level=getattr(logging, args.log_level.upper(), logging.WARNING))
+    failed = batch_manifest["status_counts"].get("failed", 0)
+    print(f"Processed {batch_manifest['file_count']} file(s) in {batch_manifest['total_seconds']:.2f}s: {batch_manifest['status_counts']}")
+    raise SystemExit(1 if failed else 0)
+
+# --- END OF FULL FILE: batch_main.py ---
@@ -0,0 +1,127 @@
+# --- START OF FULL FILE: compact_format.py ---
+# Compact, gzip-compressed intermediate format for the create_json -> invoice_gen handoff.
+#
+# The document is the same structure that would be written as JSON, wrapped as
+#   {"format": "invoice_data_columnar", "version": 1, "data": <document>}
+# and written without indentation. Decimal columns (lists/Table columns of Decimals)
+# are stored as typed numeric columns:
+#   {"$column": "decimal", "exponent": -4, "coefficients": [12500, null, ...]}
+# ("exponents": [...] replaces "exponent" when the exponents differ), so each value
+# decodes back to exactly str(original Decimal), the string plain JSON would hold.
+# Reader: invoice_gen/invoice_data_io.py (load_compact).
+
+import datetime
+import decimal
+import gzip
+import json
+from pathlib import Path
+from typing import Any, Union
+
+from table import Column, DecimalColumn, Table
+
+COMPACT_SUFFIX = ".json.gz"
+COMPACT_FORMAT = "invoice_data_columnar"
+COMPACT_VERSION = 1
+COLUMN_MARKER = "$column"
+
+
+def is_compact_path(path: Union[str, Path]) -> bool:
+    """True if path names a compact data file (selected by the '.json.gz' extension)."""
+    return str(path).lower().endswith(COMPACT_SUFFIX)
+
+
+class _DecimalColumnPayload:
+    """Placeholder for a Decimal column; encoded lazily by _default while json.dump streams."""
+    __slots__ = ('values',)
+
+    def __init__(self, values):
+        self.values = values
+
+    def encode(self) -> dict:
+        if isinstance(self.values, DecimalColumn):
+            coefficients = self.values.coefficients.tolist()
+            exponents = self.values.exponents.tolist()
+            if self.values.missing is not None:
+                coefficients = [None if missing else c for c, missing in zip(coefficients, self.values.missing)]
+        else:
+            coefficients, exponents = [], []
+            for value in self.values:
+                if value is None:
+                    coefficients.append(None)
+                    exponents.append(0)
+                else:
+                    _, _, exponent = value.as_tuple()
+                    coefficients.append(int(value.scaleb(-exponent, context=_EXACT_CONTEXT)))
+                    exponents.append(exponent)
+        present_exponents = {e for c, e in zip(coefficients, exponents) if c is not None}
+        payload = {COLUMN_MARKER: "decimal"}
+        if len(present_exponents) <= 1:
+            payload["exponent"] = present_exponents.pop() if present_exponents else 0
+        else:
+            payload["exponents"] = exponents
+        payload["coefficients"] = coefficients
+        return payload
+
+
+# Wide enough that scaleb never rounds a coefficient
+_EXACT_CONTEXT = decimal.Context(prec=decimal.MAX_PREC)
+
+
+def _is_typed_decimal(value: Any) -> bool:
+    """Finite, non-negative-zero Decimals round-trip through (coefficient, exponent)."""
+    return isinstance(value, decimal.Decimal) and value.is_finite() and not (value.is_zero() and value.is_signed())
+
+
+def _prepare(obj: Any) -> Any:
+    """
+    Walks the document, converting keys to str and replacing Decimal columns with
+    payload placeholders. Values are not copied; lists of other values are walked.
+    """
+    if isinstance(obj, Table):
+        return {str(name): _prepare(column) for name, column in obj.items()}
+    if isinstance(obj, dict):
+        return {str(k): _prepare(v) for k, v in obj.items()}
+    if isinstance(obj, DecimalColumn):
+        return _DecimalColumnPayload(obj)
+    if isinstance(obj, Column):
+        return obj.to_list()
+    if isinstance(obj, list):
+        has_decimal = False
+        for item in obj:
+            if item is None:
+                continue
+            if not _is_typed_decimal(item):
+                break
+            has_decimal = True
+        else:
+            if has_decimal:
+                return _DecimalColumnPayload(obj)
+        if any(isinstance(item, (dict, list, Table, Column)) for item in obj):
+            return [_prepare(item) for item in obj]
+        return obj
+    return obj
+
+
+def _default(obj: Any) -> Any:
+    if isinstance(obj, _DecimalColumnPayload):
+        return obj.encode()
+    if isinstance(obj, (datetime.datetime, datetime.date)):
+        return obj.isoformat()
+    if isinstance(obj, decimal.Decimal):
+        return str(obj)
+    if isinstance(obj, set):
+        return list(obj)
+    raise TypeError(f"Object of type {obj.__class__.__name__} is not JSON serializable")
+
+
+def write_compact(document: Any, output_path: Union[str, Path], compresslevel: int = 6):
+    """
+    Streams document to output_path in the compact format. json.dump writes
+    chunk by chunk into the gzip stream, so the encoded text is never held in
+    memory as one string.
+    """
+    wrapped = {"format": COMPACT_FORMAT, "version": COMPACT_VERSION, "data": _prepare(document)}
+    with gzip.open(output_path, "wt", encoding="utf-8", compresslevel=compresslevel) as f:
+        json.dump(wrapped, f, separators=(",", ":"), default=_default)
+
+# --- END OF FULL FILE: compact_format.py ---
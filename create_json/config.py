@@ -124,6 +124,20 @@ STOP_EXTRACTION_ON_EMPTY_COLUMN = 'item'
 # Safety limit for the number of data rows to read below the header within a table
 MAX_DATA_ROWS_TO_SCAN = 1000
 
+# --- Extraction Backend Configuration ---
+# 'openpyxl' loads the sheet through ExcelHandler; 'xml_stream' reads the sheet XML
+# directly from the .xlsx archive (xlsx_stream_reader.py); 'auto' picks per workbook.
+EXTRACTION_BACKEND = 'auto'
+# In 'auto' mode, sheets whose estimated cost (cells from the <dimension> tag plus the
+# shared-string count) reaches this value use the XML stream reader.
+XML_STREAM_MIN_COST = 100000
+
+# --- Extraction Cache Configuration ---
+# Upper bound (bytes) for the on-disk extraction cache (extraction_cache.py). Least
+# recently used entries are evicted beyond it. Entries are keyed by workbook content
+# and the parser settings in this file, so editing them invalidates old entries.
+EXTRACTION_CACHE_MAX_BYTES = 200 * 1024 * 1024
+
 # --- Data Processing Configuration ---
 # List of canonical header names for columns where values should be distributed
 # CBM processing/distribution depends on the 'cbm' mapping above and if the column contains L*W*H strings
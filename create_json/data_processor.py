@@ -5,8 +5,13 @@ from typing import Dict, List, Any, Optional, Tuple
 import decimal # Use Decimal for precise calculations
 import re
 import pprint
+try:
+    import numpy as np
+except ImportError: # distribute_values falls back to the pure Decimal path
+    np = None
 # Import config values (consider passing as arguments)
 from config import DISTRIBUTION_BASIS_COLUMN # Keep this
+from table import Column, DecimalColumn, FloatColumn, IntColumn, Table
 
 # Set precision for Decimal calculations
 decimal.getcontext().prec = 28 # Default precision, adjust if needed
@@ -14,14 +19,19 @@ decimal.getcontext().prec = 28 # Default precision, adjust if needed
 CBM_DECIMAL_PLACES = decimal.Decimal('0.0001')
 # Define default precision for other distributions (e.g., 4 decimal places)
 DEFAULT_DIST_PRECISION = decimal.Decimal('0.0001')
+# Inputs with more decimal places than this are distributed with the Decimal path
+FIXED_POINT_MAX_SCALE = 12
+# Bound for every int64 intermediate of the fixed-point path (leaves room for 2 * remainder)
+_FIXED_POINT_LIMIT = 2 ** 62
 
 
 class ProcessingError(Exception):
     """Custom exception for data processing errors."""
     pass
 
-def _convert_to_decimal(value: Any, context: str = "") -> Optional[decimal.Decimal]:
-    """Safely convert a value to Decimal, logging errors."""
+def _convert_to_decimal(value: Any, context: str = "", row_index: Optional[int] = None) -> Optional[decimal.Decimal]:
+    """Safely convert a value to Decimal, logging errors.
+    row_index is only formatted into the log message on failure, so hot loops can pass a constant context."""
     prefix = "[_convert_to_decimal]"
     if isinstance(value, decimal.Decimal):
         return value
@@ -34,6 +44,8 @@ def _convert_to_decimal(value: Any, context: str = "") -> Optional[decimal.Decim
         result = decimal.Decimal(value_str)
         return result
     except (decimal.InvalidOperation, TypeError, ValueError) as e:
+        if row_index is not None:
+            context = f"{context} (Table Row index {row_index})"
         logging.warning(f"{prefix} Could not convert '{value}' (Str: '{value_str}') to Decimal {context}: {e}")
         return None
 
@@ -121,11 +133,26 @@ def _calculate_single_cbm(cbm_value: Any, row_index: int) -> Optional[decimal.De
         logging.error(f"{prefix} Unexpected error calculating CBM from '{cbm_str}': {e}. {log_context}", exc_info=True)
         return None
 
+def _column_to_decimals(values, context: str) -> List[Optional[decimal.Decimal]]:
+    """
+    Converts a column (list or Table Column) to Optional[Decimal]. Typed numeric
+    columns convert directly; other values go through _convert_to_decimal, whose
+    row context is only formatted when a conversion fails.
+    """
+    if isinstance(values, (IntColumn, FloatColumn, DecimalColumn)):
+        return values.to_decimals()
+    return [
+        val if val is None or isinstance(val, decimal.Decimal)
+        else _convert_to_decimal(val, context, row_index=i)
+        for i, val in enumerate(values)
+    ]
+
 # process_cbm_column function remains unchanged...
 def process_cbm_column(raw_data: Dict[str, List[Any]]) -> Dict[str, List[Any]]:
     """
     Iterates through the 'cbm' list in raw_data, calculates numeric CBM values
     from strings (L*W*H or LxWxH format), and updates the list in place.
+    raw_data may also be a Table; the new values are then stored as a typed column.
     """
     prefix = "[process_cbm_column]"
     cbm_key = 'cbm' # Canonical name
@@ -136,7 +163,7 @@ def process_cbm_column(raw_data: Dict[str, List[Any]]) -> Dict[str, List[Any]]:
 
     original_cbm_list = raw_data.get(cbm_key) # Get list
     # Check if it's actually a list and not None or empty
-    if not isinstance(original_cbm_list, list):
+    if not isinstance(original_cbm_list, (list, Column)):
          logging.warning(f"{prefix} Key '{cbm_key}' exists but is not a list (Type: {type(original_cbm_list).__name__}). Skipping CBM calculation.")
          return raw_data
     if not original_cbm_list:
@@ -148,8 +175,7 @@ def process_cbm_column(raw_data: Dict[str, List[Any]]) -> Dict[str, List[Any]]:
     num_rows = len(original_cbm_list)
 
     # Process each value in the original list
-    for i in range(num_rows):
-        value = original_cbm_list[i]
+    for i, value in enumerate(original_cbm_list):
         calculated_value = _calculate_single_cbm(value, i) # Calculate volume using the helper
         calculated_cbm_list.append(calculated_value) # Add Decimal or None
 
@@ -158,6 +184,287 @@ def process_cbm_column(raw_data: Dict[str, List[Any]]) -> Dict[str, List[Any]]:
     logging.info(f"{prefix} Finished processing '{cbm_key}' column. List now contains calculated values (Decimals or Nones).")
     return raw_data
 
+def _to_fixed_point(values: List[Optional[decimal.Decimal]]) -> Optional[Tuple[Any, Any, int]]:
+    """
+    Scales a column of Optional[Decimal] to int64 integers sharing one exponent.
+
+    Returns:
+        (scaled_ints, present_mask, scale) with value == scaled_int / 10**scale,
+        or None if a value is not finite or cannot be held exactly in int64.
+    """
+    scale = 0
+    for value in values:
+        if value is None:
+            continue
+        if not value.is_finite():
+            return None
+        exponent = value.as_tuple().exponent
+        if -exponent > scale:
+            scale = -exponent
+    if scale > FIXED_POINT_MAX_SCALE:
+        return None
+    scaled = [0 if value is None else int(value.scaleb(scale)) for value in values]
+    if scaled and max(max(scaled), -min(scaled)) >= _FIXED_POINT_LIMIT:
+        return None
+    present = np.fromiter((value is not None for value in values), dtype=bool, count=len(values))
+    return np.array(scaled, dtype=np.int64), present, scale
+
+
+def _distribute_column_fixed_point(
+    col_name: str,
+    current_col_values_dec: List[Optional[decimal.Decimal]],
+    basis_values_dec: List[Optional[decimal.Decimal]],
+    dist_precision: decimal.Decimal
+) -> Optional[List[decimal.Decimal]]:
+    """
+    Vectorized equivalent of _distribute_column_decimal on scaled int64 values.
+
+    Each non-zero value starts a block that runs until the next non-zero value;
+    blocks are found with a cumulative sum over the "starts" mask and their
+    positive basis totals with np.add.reduceat. Shares are then computed for all
+    rows at once as exact integer quotients rounded ROUND_HALF_UP. Exact ties are
+    re-evaluated with the Decimal expression, so results (including the Decimal
+    exponent and sign of zero) match the reference implementation.
+
+    Returns:
+        The processed column, or None if NumPy is unavailable or the inputs do not
+        fit the fixed-point representation (the caller then uses the Decimal path).
+    """
+    prefix = "[distribute_values]"
+    if np is None or decimal.getcontext().prec < 28:
+        return None
+    precision_sign, precision_digits, precision_exponent = dist_precision.as_tuple()
+    if precision_sign or precision_digits != (1,) or not isinstance(precision_exponent, int) or precision_exponent > 0:
+        return None # Only power-of-ten quanta such as 0.0001 map onto integers
+    quantum_places = -precision_exponent
+
+    values_fp = _to_fixed_point(current_col_values_dec)
+    basis_fp = _to_fixed_point(basis_values_dec)
+    if values_fp is None or basis_fp is None:
+        return None
+    values, values_present, value_scale = values_fp
+    basis, basis_present, _ = basis_fp
+
+    num_rows = len(current_col_values_dec)
+    zero = decimal.Decimal(0)
+    processed_col_values: List[decimal.Decimal] = [zero] * num_rows
+
+    is_start = values_present & (values != 0)
+    starts = np.flatnonzero(is_start)
+    if starts.size == 0:
+        return processed_col_values
+    for start in starts.tolist():
+        processed_col_values[start] = current_col_values_dec[start]
+
+    block_lengths = np.diff(np.append(starts, num_rows))
+    positive_basis = np.where(basis_present & (basis > 0), basis, 0)
+    if positive_basis.sum(dtype=np.float64) >= _FIXED_POINT_LIMIT:
+        return None
+    block_totals = np.add.reduceat(positive_basis, starts)
+    has_followers = block_lengths > 1
+    distributable = has_followers & (block_totals > 0)
+
+    block_of_row = np.cumsum(is_start) - 1 # -1 for rows before the first value
+    in_block = block_of_row >= 0
+    follower_rows = in_block & ~is_start
+    follower_rows[follower_rows] = has_followers[block_of_row[follower_rows]]
+    zeroed_rows = int(np.count_nonzero(follower_rows & (positive_basis == 0)))
+
+    target = in_block & (positive_basis > 0)
+    target[target] = distributable[block_of_row[target]]
+    rows = np.flatnonzero(target)
+
+    if rows.size:
+        row_blocks = block_of_row[rows]
+        start_values = values[starts][row_blocks]
+        row_basis = positive_basis[rows]
+        # v * b / T in quantum units = |V| * B * 10**q / (T * 10**a) with V, B, T the scaled integers
+        numerator_scale = 10 ** max(0, quantum_places - value_scale)
+        denominator_scale = 10 ** max(0, value_scale - quantum_places)
+        max_abs_value = int(np.abs(start_values).max())
+        if max_abs_value * int(row_basis.max()) * numerator_scale >= _FIXED_POINT_LIMIT or \
+           int(block_totals.max()) * denominator_scale >= _FIXED_POINT_LIMIT:
+            return None
+        numerators = np.abs(start_values) * row_basis * numerator_scale
+        denominators = block_totals[row_blocks] * denominator_scale
+        quotients, remainders = np.divmod(numerators, denominators)
+        twice_remainders = 2 * remainders
+        quotients += twice_remainders >= denominators # ROUND_HALF_UP on the magnitude
+        negative = start_values < 0
+
+        distributed = [
+            decimal.Decimal(magnitude).scaleb(-quantum_places).copy_negate() if is_negative
+            else decimal.Decimal(magnitude).scaleb(-quantum_places)
+            for magnitude, is_negative in zip(quotients.tolist(), negative.tolist())
+        ]
+        # Exact ties are where the Decimal path's 28-digit intermediate rounding could matter
+        for idx in np.flatnonzero(twice_remainders == denominators).tolist():
+            row, block = int(rows[idx]), int(row_blocks[idx])
+            block_total = sum(basis_values_dec[k] for k in range(int(starts[block]), int(starts[block] + block_lengths[block]))
+                              if basis_values_dec[k] is not None and basis_values_dec[k] > 0)
+            proportion = basis_values_dec[row] / block_total
+            distributed[idx] = (current_col_values_dec[int(starts[block])] * proportion).quantize(dist_precision, rounding=decimal.ROUND_HALF_UP)
+            quotients[idx] = abs(int(distributed[idx].scaleb(quantum_places)))
+        for row, value in zip(rows.tolist(), distributed):
+            processed_col_values[row] = value
+
+        # --- Distribution Check (per block) ---
+        signed_quotients = np.where(negative, -quotients, quotients)
+        block_sums = np.zeros(starts.size, dtype=np.int64)
+        np.add.at(block_sums, row_blocks, signed_quotients)
+        tolerance = dist_precision / decimal.Decimal(2)
+        for block in np.flatnonzero(distributable).tolist():
+            start = int(starts[block])
+            distributed_sum = decimal.Decimal(int(block_sums[block])).scaleb(-quantum_places)
+            diff = abs(distributed_sum - current_col_values_dec[start])
+            if not diff <= tolerance:
+                logging.warning(f"{prefix} Col '{col_name}', Row index {start}: Distribution Check potentially FAILED for block. Original: {current_col_values_dec[start]}, Distributed Sum: {distributed_sum}, Difference: {diff:.10f} (Tolerance: {tolerance})")
+
+    for block in np.flatnonzero(has_followers & ~distributable).tolist():
+        start = int(starts[block])
+        logging.warning(f"{prefix} Col '{col_name}', Row index {start}: Cannot distribute value {current_col_values_dec[start]}. Total positive basis in block is zero or none found. Keeping original value, setting the other {int(block_lengths[block]) - 1} row(s) in the block to 0.")
+    if zeroed_rows:
+        logging.warning(f"{prefix} Col '{col_name}': Assigned 0 to {zeroed_rows} row(s) in distribution blocks due to missing or zero/negative basis.")
+    return processed_col_values
+
+
+def _distribute_column_decimal(
+    col_name: str,
+    current_col_values_dec: List[Optional[decimal.Decimal]],
+    basis_values_dec: List[Optional[decimal.Decimal]]
+) -> List[Optional[decimal.Decimal]]:
+    """
+    Reference Decimal implementation of the distribution for one column.
+    Walks the rows one by one; used when the fixed-point path cannot represent the inputs exactly.
+    """
+    prefix = "[distribute_values]"
+    num_rows = len(basis_values_dec)
+
+    # Initialize processed list for this column
+    processed_col_values: List[Optional[decimal.Decimal]] = [None] * num_rows
+
+    i = 0 # Main loop index
+    while i < num_rows:
+        current_val_dec = current_col_values_dec[i]
+        log_row_context = f"{prefix} Col '{col_name}', Row index {i}"
+
+        # --- Case 1: Found a non-None, non-zero value to potentially distribute ---
+        if current_val_dec is not None and current_val_dec != decimal.Decimal(0):
+            logging.debug(f"{log_row_context}: Found distributable value: {current_val_dec}")
+            # Store the original non-zero value at its position
+            processed_col_values[i] = current_val_dec
+
+            # --- Look ahead for the distribution block ---
+            j = i + 1 # Lookahead index
+            distribution_rows_indices = [] # Indices of rows following i that are empty/zero in this col
+            while j < num_rows:
+                 next_original_val_dec = current_col_values_dec[j]
+                 # Stop lookahead if the *next* original value is non-empty/non-zero
+                 if next_original_val_dec is not None and next_original_val_dec != decimal.Decimal(0):
+                      logging.debug(f"{log_row_context}: Lookahead stopped at index {j}. Found non-empty/zero value {next_original_val_dec} in original data.")
+                      break
+
+                 # Check basis value for this potential distribution row
+                 basis_for_j = basis_values_dec[j]
+                 if basis_for_j is not None:
+                      # Include row j in the potential block, regardless of basis value (handle 0 basis later)
+                      distribution_rows_indices.append(j)
+                      logging.debug(f"{log_row_context}: Lookahead index {j} is part of block (Original val empty/zero, Basis={basis_for_j}).")
+                 else:
+                      # Basis is missing for row j. It's part of the block but cannot receive distribution.
+                      distribution_rows_indices.append(j) # Still part of the block length calculation
+                      logging.warning(f"{log_row_context}: Lookahead index {j} has MISSING basis. Will assign 0 later.")
+                 j += 1
+            # --- End of Look ahead ---
+            logging.debug(f"{log_row_context}: Lookahead finished. Indices in distribution block (excluding start row {i}): {distribution_rows_indices}")
+
+            # --- If a distribution block was found (rows followed the value) ---
+            if distribution_rows_indices:
+                block_indices = [i] + distribution_rows_indices # All indices in the block
+                logging.debug(f"{log_row_context}: Identified distribution block indices: {block_indices}")
+
+                # --- Calculate total POSITIVE basis for the block ---
+                total_basis_in_block = decimal.Decimal(0)
+                indices_with_valid_basis = [] # Track rows that contribute > 0 basis
+
+                for k in block_indices:
+                    basis_val = basis_values_dec[k]
+                    if basis_val is not None and basis_val > 0:
+                        total_basis_in_block += basis_val
+                        indices_with_valid_basis.append(k)
+                    elif basis_val is not None: # Log zero/negative basis
+                         logging.debug(f"{log_row_context}: Basis value is zero or negative ({basis_val}) at index {k} in block. Excluded from total.")
+                    # else: # Basis is None, already logged during lookahead
+
+                logging.debug(f"{log_row_context}: Block Calculation - Total POSITIVE basis: {total_basis_in_block}. Indices with positive basis: {indices_with_valid_basis}")
+
+                # --- Perform distribution if possible ---
+                if total_basis_in_block > 0 and indices_with_valid_basis:
+                     distributed_sum_check = decimal.Decimal(0)
+                     dist_precision = CBM_DECIMAL_PLACES if col_name == 'cbm' else DEFAULT_DIST_PRECISION
+
+                     logging.debug(f"{log_row_context}: Distributing {current_val_dec} across {len(indices_with_valid_basis)} rows with positive basis using precision {dist_precision}.")
+
+                     # Distribute ONLY to rows with positive basis
+                     for k in indices_with_valid_basis:
+                         basis_val = basis_values_dec[k] # Known > 0
+                         proportion = basis_val / total_basis_in_block
+                         distributed_value = (current_val_dec * proportion).quantize(dist_precision, rounding=decimal.ROUND_HALF_UP)
+                         # Assign the calculated value to the processed list
+                         processed_col_values[k] = distributed_value
+                         distributed_sum_check += distributed_value
+                         logging.debug(f"{log_row_context}:   Index {k}: Basis={basis_val}, Prop={proportion:.6f}, Dist Val={distributed_value}")
+
+                     # Assign 0 to rows in the block that had missing/zero/negative basis
+                     for k in block_indices:
+                         if k not in indices_with_valid_basis:
+                             # Only assign 0 if it hasn't been assigned yet (should only be for k != i)
+                             if processed_col_values[k] is None:
+                                 processed_col_values[k] = decimal.Decimal(0)
+                                 log_reason = "missing basis" if basis_values_dec[k] is None else f"zero/negative basis ({basis_values_dec[k]})"
+                                 logging.warning(f"{log_row_context}:   Index {k}: Assigning 0 due to {log_reason}.")
+
+
+                     # --- Distribution Check ---
+                     tolerance = dist_precision / decimal.Decimal(2)
+                     diff = abs(distributed_sum_check - current_val_dec)
+                     if not diff <= tolerance:
+                          logging.warning(f"{log_row_context}: Distribution Check potentially FAILED for block. Original: {current_val_dec}, Distributed Sum: {distributed_sum_check}, Difference: {diff:.10f} (Tolerance: {tolerance})")
+                     else:
+                          logging.debug(f"{log_row_context}: Distribution Check PASSED for block. Original: {current_val_dec}, Sum: {distributed_sum_check}")
+
+                else: # Cannot distribute (no positive basis found in the block)
+                    logging.warning(f"{log_row_context}: Cannot distribute value {current_val_dec}. Total positive basis in block is zero or none found. Keeping original value at index {i}, setting others in block {distribution_rows_indices} to 0.")
+                    # Ensure subsequent rows in the identified block are set to 0 if not already set
+                    for k in distribution_rows_indices:
+                        if processed_col_values[k] is None:
+                            processed_col_values[k] = decimal.Decimal(0)
+
+                # Move main loop index past the processed block
+                i = j # Start next iteration after the block
+                logging.debug(f"{log_row_context}: End of block processing. Moving main index i to {i}")
+
+            # --- Case 1b: Non-zero value found, but NO block followed ---
+            else:
+                logging.debug(f"{log_row_context}: Value {current_val_dec} found, but no empty/zero rows followed. Keeping value as is.")
+                # The value processed_col_values[i] = current_val_dec was already set
+                i += 1 # Move to the next row normally
+
+        # --- Case 2: Current original value is None or zero ---
+        else:
+            logging.debug(f"{log_row_context}: Original value is None or zero ('{current_col_values_dec[i]}').")
+            # Check if this position was already filled by the distribution from a previous block
+            if processed_col_values[i] is None:
+                # If not filled, set it explicitly to 0
+                logging.debug(f"{log_row_context}: Position was not filled by previous block, setting to 0.")
+                processed_col_values[i] = decimal.Decimal(0)
+            else:
+                 logging.debug(f"{log_row_context}: Position was already filled with {processed_col_values[i]} by a previous block's distribution.")
+            i += 1 # Move to the next row
+
+    return processed_col_values
+
+
 # distribute_values function remains unchanged...
 def distribute_values(
     raw_data: Dict[str, List[Any]],
@@ -179,7 +486,7 @@ def distribute_values(
     processed_data = raw_data # Operate directly on the input dictionary
 
     # --- Input Validation ---
-    if not isinstance(raw_data, dict):
+    if not isinstance(raw_data, (dict, Table)):
         logging.error(f"{prefix} Input 'raw_data' is not a dictionary (Type: {type(raw_data).__name__}). Cannot distribute.")
         raise ProcessingError("Input data for distribution must be a dictionary.")
 
@@ -188,7 +495,7 @@ def distribute_values(
         raise ProcessingError(f"Basis column '{basis_column}' not found for distribution.")
 
     basis_values_list = processed_data.get(basis_column)
-    if not isinstance(basis_values_list, list):
+    if not isinstance(basis_values_list, (list, Column)):
         logging.error(f"{prefix} Basis column '{basis_column}' key exists but value is not a list (Type: {type(basis_values_list).__name__}). Cannot distribute.")
         raise ProcessingError(f"Basis column '{basis_column}' data is not a list.")
 
@@ -198,7 +505,7 @@ def distribute_values(
         for col in columns_to_distribute:
             if col not in processed_data:
                  logging.warning(f"{prefix} Column '{col}' specified for distribution but not found in this table's data keys: {list(processed_data.keys())}. Skipping this column.")
-            elif not isinstance(processed_data.get(col), list):
+            elif not isinstance(processed_data.get(col), (list, Column)):
                  logging.warning(f"{prefix} Column '{col}' specified for distribution exists but is not a list (Type: {type(processed_data.get(col)).__name__}). Skipping this column.")
             else:
                 valid_columns_to_distribute.append(col)
@@ -219,10 +526,7 @@ def distribute_values(
     logging.info(f"{prefix} Starting value distribution for columns: {valid_columns_to_distribute} based on '{basis_column}' ({num_rows} rows).")
 
     # Pre-convert basis values to Decimal
-    basis_values_dec: List[Optional[decimal.Decimal]] = [
-        _convert_to_decimal(val, f"{prefix} basis column '{basis_column}' row index {i}")
-        for i, val in enumerate(basis_values_list)
-    ]
+    basis_values_dec = _column_to_decimals(basis_values_list, f"{prefix} basis column '{basis_column}'")
     logging.debug(f"{prefix} Pre-converted basis values (first 10): {basis_values_dec[:10]}")
 
     # --- Process each column ---
@@ -235,139 +539,16 @@ def distribute_values(
              logging.error(f"{prefix} Row count mismatch detected just before processing! Basis '{basis_column}' ({num_rows}) vs '{col_name}' ({len(original_col_values)}). This indicates a potential data integrity issue. Skipping distribution for '{col_name}'.")
              continue # Skip this column
 
-        # Pre-convert original values for the column being distributed
-        current_col_values_dec: List[Optional[decimal.Decimal]] = [
-             # Keep existing Decimals (e.g., from CBM calc), attempt conversion otherwise
-             val if isinstance(val, decimal.Decimal)
-             else _convert_to_decimal(val, f"{prefix} column '{col_name}' row index {i}")
-             for i, val in enumerate(original_col_values)
-        ]
+        # Pre-convert original values for the column being distributed (existing Decimals, e.g. from CBM calc, are kept)
+        current_col_values_dec = _column_to_decimals(original_col_values, f"{prefix} column '{col_name}'")
         logging.debug(f"{prefix} Pre-converted values for '{col_name}' (first 10): {current_col_values_dec[:10]}")
 
 
-        # Initialize processed list for this column
-        processed_col_values: List[Optional[decimal.Decimal]] = [None] * num_rows
-
-        i = 0 # Main loop index
-        while i < num_rows:
-            current_val_dec = current_col_values_dec[i]
-            log_row_context = f"{prefix} Col '{col_name}', Row index {i}"
-
-            # --- Case 1: Found a non-None, non-zero value to potentially distribute ---
-            if current_val_dec is not None and current_val_dec != decimal.Decimal(0):
-                logging.debug(f"{log_row_context}: Found distributable value: {current_val_dec}")
-                # Store the original non-zero value at its position
-                processed_col_values[i] = current_val_dec
-
-                # --- Look ahead for the distribution block ---
-                j = i + 1 # Lookahead index
-                distribution_rows_indices = [] # Indices of rows following i that are empty/zero in this col
-                while j < num_rows:
-                     next_original_val_dec = current_col_values_dec[j]
-                     # Stop lookahead if the *next* original value is non-empty/non-zero
-                     if next_original_val_dec is not None and next_original_val_dec != decimal.Decimal(0):
-                          logging.debug(f"{log_row_context}: Lookahead stopped at index {j}. Found non-empty/zero value {next_original_val_dec} in original data.")
-                          break
-
-                     # Check basis value for this potential distribution row
-                     basis_for_j = basis_values_dec[j]
-                     if basis_for_j is not None:
-                          # Include row j in the potential block, regardless of basis value (handle 0 basis later)
-                          distribution_rows_indices.append(j)
-                          logging.debug(f"{log_row_context}: Lookahead index {j} is part of block (Original val empty/zero, Basis={basis_for_j}).")
-                     else:
-                          # Basis is missing for row j. It's part of the block but cannot receive distribution.
-                          distribution_rows_indices.append(j) # Still part of the block length calculation
-                          logging.warning(f"{log_row_context}: Lookahead index {j} has MISSING basis. Will assign 0 later.")
-                     j += 1
-                # --- End of Look ahead ---
-                logging.debug(f"{log_row_context}: Lookahead finished. Indices in distribution block (excluding start row {i}): {distribution_rows_indices}")
-
-                # --- If a distribution block was found (rows followed the value) ---
-                if distribution_rows_indices:
-                    block_indices = [i] + distribution_rows_indices # All indices in the block
-                    logging.debug(f"{log_row_context}: Identified distribution block indices: {block_indices}")
-
-                    # --- Calculate total POSITIVE basis for the block ---
-                    total_basis_in_block = decimal.Decimal(0)
-                    indices_with_valid_basis = [] # Track rows that contribute > 0 basis
-
-                    for k in block_indices:
-                        basis_val = basis_values_dec[k]
-                        if basis_val is not None and basis_val > 0:
-                            total_basis_in_block += basis_val
-                            indices_with_valid_basis.append(k)
-                        elif basis_val is not None: # Log zero/negative basis
-                             logging.debug(f"{log_row_context}: Basis value is zero or negative ({basis_val}) at index {k} in block. Excluded from total.")
-                        # else: # Basis is None, already logged during lookahead
-
-                    logging.debug(f"{log_row_context}: Block Calculation - Total POSITIVE basis: {total_basis_in_block}. Indices with positive basis: {indices_with_valid_basis}")
-
-                    # --- Perform distribution if possible ---
-                    if total_basis_in_block > 0 and indices_with_valid_basis:
-                         distributed_sum_check = decimal.Decimal(0)
-                         dist_precision = CBM_DECIMAL_PLACES if col_name == 'cbm' else DEFAULT_DIST_PRECISION
-
-                         logging.debug(f"{log_row_context}: Distributing {current_val_dec} across {len(indices_with_valid_basis)} rows with positive basis using precision {dist_precision}.")
-
-                         # Distribute ONLY to rows with positive basis
-                         for k in indices_with_valid_basis:
-                             basis_val = basis_values_dec[k] # Known > 0
-                             proportion = basis_val / total_basis_in_block
-                             distributed_value = (current_val_dec * proportion).quantize(dist_precision, rounding=decimal.ROUND_HALF_UP)
-                             # Assign the calculated value to the processed list
-                             processed_col_values[k] = distributed_value
-                             distributed_sum_check += distributed_value
-                             logging.debug(f"{log_row_context}:   Index {k}: Basis={basis_val}, Prop={proportion:.6f}, Dist Val={distributed_value}")
-
-                         # Assign 0 to rows in the block that had missing/zero/negative basis
-                         for k in block_indices:
-                             if k not in indices_with_valid_basis:
-                                 # Only assign 0 if it hasn't been assigned yet (should only be for k != i)
-                                 if processed_col_values[k] is None:
-                                     processed_col_values[k] = decimal.Decimal(0)
-                                     log_reason = "missing basis" if basis_values_dec[k] is None else f"zero/negative basis ({basis_values_dec[k]})"
-                                     logging.warning(f"{log_row_context}:   Index {k}: Assigning 0 due to {log_reason}.")
-
-
-                         # --- Distribution Check ---
-                         tolerance = dist_precision / decimal.Decimal(2)
-                         diff = abs(distributed_sum_check - current_val_dec)
-                         if not diff <= tolerance:
-                              logging.warning(f"{log_row_context}: Distribution Check potentially FAILED for block. Original: {current_val_dec}, Distributed Sum: {distributed_sum_check}, Difference: {diff:.10f} (Tolerance: {tolerance})")
-                         else:
-                              logging.debug(f"{log_row_context}: Distribution Check PASSED for block. Original: {current_val_dec}, Sum: {distributed_sum_check}")
-
-                    else: # Cannot distribute (no positive basis found in the block)
-                        logging.warning(f"{log_row_context}: Cannot distribute value {current_val_dec}. Total positive basis in block is zero or none found. Keeping original value at index {i}, setting others in block {distribution_rows_indices} to 0.")
-                        # Ensure subsequent rows in the identified block are set to 0 if not already set
-                        for k in distribution_rows_indices:
-                            if processed_col_values[k] is None:
-                                processed_col_values[k] = decimal.Decimal(0)
-
-                    # Move main loop index past the processed block
-                    i = j # Start next iteration after the block
-                    logging.debug(f"{log_row_context}: End of block processing. Moving main index i to {i}")
-
-                # --- Case 1b: Non-zero value found, but NO block followed ---
-                else:
-                    logging.debug(f"{log_row_context}: Value {current_val_dec} found, but no empty/zero rows followed. Keeping value as is.")
-                    # The value processed_col_values[i] = current_val_dec was already set
-                    i += 1 # Move to the next row normally
-
-            # --- Case 2: Current original value is None or zero ---
-            else:
-                logging.debug(f"{log_row_context}: Original value is None or zero ('{current_col_values_dec[i]}').")
-                # Check if this position was already filled by the distribution from a previous block
-                if processed_col_values[i] is None:
-                    # If not filled, set it explicitly to 0
-                    logging.debug(f"{log_row_context}: Position was not filled by previous block, setting to 0.")
-                    processed_col_values[i] = decimal.Decimal(0)
-                else:
-                     logging.debug(f"{log_row_context}: Position was already filled with {processed_col_values[i]} by a previous block's distribution.")
-                i += 1 # Move to the next row
-
-        # --- End of main loop (while i < num_rows) ---
+        dist_precision = CBM_DECIMAL_PLACES if col_name == 'cbm' else DEFAULT_DIST_PRECISION
+        processed_col_values = _distribute_column_fixed_point(col_name, current_col_values_dec, basis_values_dec, dist_precision)
+        if processed_col_values is None:
+            logging.debug(f"{prefix} Column '{col_name}' cannot be represented exactly in fixed point. Using the Decimal path.")
+            processed_col_values = _distribute_column_decimal(col_name, current_col_values_dec, basis_values_dec)
 
         # Update the main data dictionary with the processed list (containing Decimals or Nones)
         processed_data[col_name] = processed_col_values
@@ -379,168 +560,201 @@ def distribute_values(
     return processed_data # Return the dictionary with modified lists
 
 
-# *** Standard Aggregation Function (MODIFIED to handle SQFT, AMOUNT, and DESCRIPTION key) ***
-def aggregate_standard_by_po_item_price(
-    processed_data: Dict[str, List[Any]],
-    # UPDATED TYPE HINT: Key is now 4 elements, Value is Dict storing sums
-    global_aggregation_map: Dict[Tuple[Any, Any, Optional[decimal.Decimal], Optional[str]], Dict[str, decimal.Decimal]] # Added Optional[str] for description
-) -> Dict[Tuple[Any, Any, Optional[decimal.Decimal], Optional[str]], Dict[str, decimal.Decimal]]:
-    """
-    STANDARD Aggregation: Aggregates 'sqft' AND 'amount' values based on unique
-    combinations of 'po', 'item', 'unit' price, AND 'description'.
-    Updates the global_aggregation_map in place.
+# --- Aggregation ---
+# Both aggregation maps share one key shape: (po, item, price or None, description),
+# with values {'sqft_sum': Decimal, 'amount_sum': Decimal}.
+AggregationKey = Tuple[Any, Any, Optional[decimal.Decimal], Optional[str]]
+AggregationMap = Dict[AggregationKey, Dict[str, decimal.Decimal]]
 
-    Args:
-        processed_data: Dictionary representing the data of the current table.
-        global_aggregation_map: The dictionary holding the cumulative aggregation results.
-                                  Key: (po, item, price, description)
-                                  Value: Dict{'sqft_sum': Decimal, 'amount_sum': Decimal}.
 
-    Returns:
-        The updated global_aggregation_map.
-    """
-    aggregated_results = global_aggregation_map
-    # UPDATED: Add 'description' to required columns (handle its absence later)
-    required_cols = ['po', 'item', 'unit', 'sqft', 'amount'] # Keep description optional for now
-    prefix = "[aggregate_standard]"
+def _standard_aggregation_key(row: Dict[str, Any]) -> AggregationKey:
+    """STANDARD key: (PO, Item, Price, Description)."""
+    return (row['po'], row['item'], row['price'], row['description'])
 
-    logging.debug(f"{prefix} Updating global STANDARD aggregation (SQFT & Amount by PO/Item/Price/Desc) with new table data.")
-    logging.debug(f"{prefix} Size of global map BEFORE processing this table: {len(aggregated_results)}")
 
-    # --- Input Validation ---
-    if not isinstance(processed_data, dict):
-        logging.error(f"{prefix} Input 'processed_data' is not a dictionary. Cannot aggregate.")
-        return aggregated_results
+def _custom_aggregation_key(row: Dict[str, Any]) -> AggregationKey:
+    """CUSTOM key: (PO, Item, None, Description); None keeps the key shape of STANDARD."""
+    return (row['po'], row['item'], None, row['description'])
 
-    missing_cols = [col for col in required_cols if col not in processed_data]
-    if missing_cols:
-        logging.warning(f"{prefix} Cannot perform STANDARD aggregation: Missing required columns {missing_cols}. Skipping aggregation for this table.")
-        return aggregated_results
 
-    # --- Check for optional 'description' column ---
-    has_description_col = 'description' in processed_data
-    if has_description_col and not isinstance(processed_data.get('description'), list):
-        logging.warning(f"{prefix} 'description' column exists but is not a list. Will use None for description keys.")
-        has_description_col = False # Treat as missing if not a list
-    elif not has_description_col:
-        logging.info(f"{prefix} 'description' column not found or is invalid. Will use None for description keys.")
-
-    # Safely get lists and check types - Use get() with default empty list
-    po_list = processed_data.get('po', [])
-    item_list = processed_data.get('item', [])
-    unit_list = processed_data.get('unit', [])
-    sqft_list = processed_data.get('sqft', [])
-    amount_list = processed_data.get('amount', [])
-    description_list = processed_data.get('description', []) if has_description_col else [] # Get description list if valid
-
-    # Use length of 'po' list as the reference number of rows
-    num_rows = len(po_list)
-    logging.debug(f"{prefix} Input data contains lists. Number of rows based on 'po' list: {num_rows}")
-
-    # Check for length consistency across all required lists
-    all_lists_to_check = {'item': item_list, 'unit': unit_list, 'sqft': sqft_list, 'amount': amount_list}
-    # Add description list to check only if it exists and is supposed to be used
-    if has_description_col:
-        all_lists_to_check['description'] = description_list
+# Registered aggregation modes.
+#   required_cols: columns the mode needs.
+#   strict: if True, the table is skipped for this mode when a required column is missing
+#           or any required/description list has a different length. If False, missing
+#           columns are read as None.
+#   key: builds the aggregation key from a normalized row (see _normalized_rows).
+AGGREGATION_MODES: Dict[str, Dict[str, Any]] = {
+    'standard': {'required_cols': ('po', 'item', 'unit', 'sqft', 'amount'), 'strict': True, 'key': _standard_aggregation_key},
+    'custom': {'required_cols': ('po', 'item', 'sqft', 'amount'), 'strict': False, 'key': _custom_aggregation_key},
+}
 
-    if not all(len(lst) == num_rows for lst in all_lists_to_check.values()):
-        lengths = {k: len(v) for k, v in all_lists_to_check.items()}
-        lengths['po'] = num_rows # Add PO length for context
-        logging.error(f"{prefix} Data length mismatch! Lengths:{lengths}. Aborting standard aggregation for this table.")
-        return aggregated_results
-
-    if num_rows == 0:
-        logging.info(f"{prefix} No data rows found in this table. Global map unchanged.")
-        return aggregated_results
 
-    logging.info(f"{prefix} Processing {num_rows} rows for STANDARD aggregation (SQFT & Amount by PO/Item/Price/Desc).")
-
-    # --- Iterate and Aggregate ---
-    rows_processed_this_table = 0
-    successful_conversions_sqft = 0
-    successful_conversions_amount = 0
+def _normalized_rows(columns: Dict[str, List[Any]], num_rows: int, prefix: str):
+    """
+    Yields each table row once as the normalized view every aggregation mode keys on:
+    stripped PO/Item (missing -> '<MISSING_PO>'/'<MISSING_ITEM>'), stripped description
+    (empty -> None), unit price as Decimal, and SQFT/Amount as Decimal (missing -> 0).
+    Missing columns read as None.
+    """
+    empty = [None] * num_rows
+    po_list, item_list, unit_list, sqft_list, amount_list, description_list = (
+        columns.get(col) or empty for col in ('po', 'item', 'unit', 'sqft', 'amount', 'description'))
+    has_unit = 'unit' in columns
+    zero = decimal.Decimal(0)
 
     for i in range(num_rows):
-        rows_processed_this_table += 1
-        log_row_context = f"{prefix} Table Row index {i}"
-        logging.debug(f"{log_row_context} --- Processing ---")
-
-        # Get raw values
-        po_val, item_val = po_list[i], item_list[i]
-        unit_price_raw, sqft_raw, amount_raw = unit_list[i], sqft_list[i], amount_list[i]
-        # Get description if available, else None
-        desc_raw = description_list[i] if has_description_col and i < len(description_list) else None
+        po_val, item_val, desc_raw = po_list[i], item_list[i], description_list[i]
+        po_key = po_val.strip() if isinstance(po_val, str) else po_val
+        item_key = item_val.strip() if isinstance(item_val, str) else item_val
+        description_key = desc_raw.strip() if isinstance(desc_raw, str) else desc_raw
+
+        sqft_dec = _convert_to_decimal(sqft_list[i], f"{prefix} SQFT", row_index=i)
+        amount_dec = _convert_to_decimal(amount_list[i], f"{prefix} Amount", row_index=i)
+        yield {
+            'po': po_key if po_key is not None else "<MISSING_PO>",
+            'item': item_key if item_key is not None else "<MISSING_ITEM>",
+            'price': _convert_to_decimal(unit_list[i], f"{prefix} price", row_index=i) if has_unit else None,
+            'description': description_key if description_key else None, # Empty strings become None
+            'sqft': sqft_dec if sqft_dec is not None else zero,
+            'amount': amount_dec if amount_dec is not None else zero,
+            'sqft_converted': sqft_dec is not None,
+            'amount_converted': amount_dec is not None,
+        }
+
+
+def aggregate_all_modes(
+    processed_data: Dict[str, List[Any]],
+    aggregation_maps: Dict[str, AggregationMap]
+) -> Dict[str, AggregationMap]:
+    """
+    Fused aggregation: walks the table ONCE and updates every requested mode's map.
 
-        logging.debug(f"{log_row_context}: Raw values - PO='{po_val}', Item='{item_val}', Price='{unit_price_raw}', Desc='{desc_raw}', SQFT='{sqft_raw}', Amount='{amount_raw}'")
+    Each row is normalized a single time (key parts stripped, SQFT/Amount/price
+    converted to Decimal) and then added to each mode under that mode's key, so
+    the cost scales with rows rather than rows x modes.
 
-        # Prepare key components
-        po_key = str(po_val).strip() if isinstance(po_val, str) else po_val
-        item_key = str(item_val).strip() if isinstance(item_val, str) else item_val
-        description_key = str(desc_raw).strip() if isinstance(desc_raw, str) else desc_raw # Keep None as None
-        description_key = description_key if description_key else None # Ensure empty strings become None
+    Args:
+        processed_data: Dictionary representing the data of the current table.
+        aggregation_maps: Mode name (a key of AGGREGATION_MODES) -> the global map
+                          holding that mode's cumulative results. Updated in place.
 
-        po_key = po_key if po_key is not None else "<MISSING_PO>"
-        item_key = item_key if item_key is not None else "<MISSING_ITEM>"
-        # Description key can be None
+    Returns:
+        The aggregation_maps dictionary.
+    """
+    prefix = "[aggregate_all_modes]"
 
-        # Convert price to Decimal for the key
-        price_dec = _convert_to_decimal(unit_price_raw, f"{log_row_context} price")
+    if not isinstance(processed_data, (dict, Table)):
+        logging.error(f"{prefix} Input 'processed_data' is not a dictionary. Cannot aggregate.")
+        return aggregation_maps
 
-        # UPDATED Key: (PO, Item, Price, Description)
-        key = (po_key, item_key, price_dec, description_key)
-        logging.debug(f"{log_row_context}: Generated Key Tuple = {key}")
+    unknown_modes = [mode for mode in aggregation_maps if mode not in AGGREGATION_MODES]
+    if unknown_modes:
+        raise ProcessingError(f"Unknown aggregation mode(s): {unknown_modes}. Known modes: {list(AGGREGATION_MODES)}")
 
+    # Only list/Column columns take part; anything else is treated as missing
+    columns = {col: values for col, values in processed_data.items() if isinstance(values, (list, Column))}
+    if 'description' in processed_data and 'description' not in columns:
+        logging.warning(f"{prefix} 'description' column exists but is not a list. Will use None for description keys.")
+    elif 'description' not in processed_data:
+        logging.info(f"{prefix} 'description' column not found. Will use None for description keys.")
 
-        # Convert SQFT and Amount to Decimal for summation
-        sqft_dec = _convert_to_decimal(sqft_raw, f"{log_row_context} SQFT")
-        if sqft_dec is None:
-             # logging.debug(f"{log_row_context}: SQFT value '{sqft_raw}' is None or failed conversion. Using 0.") # Reduced verbosity
-             sqft_dec = decimal.Decimal(0)
-        else:
-             successful_conversions_sqft +=1
+    # Reference row count: the 'po' list, or the first non-empty core list when 'po' is missing/empty
+    po_list = columns.get('po') or []
+    num_rows = len(po_list)
+    if not po_list:
+        core_lists = [columns[col] for col in ('item', 'sqft', 'amount') if columns.get(col)]
+        if core_lists:
+            num_rows = len(core_lists[0])
+            logging.warning(f"{prefix} 'po' list missing or empty, using length of another list ({num_rows}) as reference.")
 
-        amount_dec = _convert_to_decimal(amount_raw, f"{log_row_context} Amount")
-        if amount_dec is None:
-            # logging.debug(f"{log_row_context}: Amount value '{amount_raw}' is None or failed conversion. Using 0.") # Reduced verbosity
-            amount_dec = decimal.Decimal(0)
+    # --- Per-mode validation (cheap, per table) ---
+    active_modes: List[str] = []
+    for mode in aggregation_maps:
+        mode_spec = AGGREGATION_MODES[mode]
+        required_cols = mode_spec['required_cols']
+        missing_cols = [col for col in required_cols if col not in columns]
+        if mode_spec['strict']:
+            if missing_cols:
+                logging.warning(f"{prefix} Cannot perform {mode.upper()} aggregation: Missing required columns {missing_cols}. Skipping it for this table.")
+                continue
+            checked_cols = list(required_cols) + (['description'] if 'description' in columns else [])
         else:
-            successful_conversions_amount +=1
-
-        # logging.debug(f"{log_row_context}: Converted values - SQFT='{sqft_dec}', Amount='{amount_dec}'") # Reduced verbosity
+            if missing_cols:
+                logging.warning(f"{prefix} Cannot perform full {mode.upper()} aggregation: Missing required columns {missing_cols}. Proceeding cautiously.")
+            checked_cols = [col for col in required_cols if col in columns] + (['description'] if 'description' in columns else [])
+        lengths = {col: len(columns[col]) for col in checked_cols}
+        if any(length != num_rows for length in lengths.values()):
+            logging.error(f"{prefix} Data length mismatch! Ref:{num_rows}, Lengths:{lengths}. Aborting {mode.upper()} aggregation for this table.")
+            continue
+        active_modes.append(mode)
+
+    if not active_modes:
+        return aggregation_maps
+    if num_rows == 0:
+        logging.info(f"{prefix} No data rows found in this table. Aggregation maps unchanged.")
+        return aggregation_maps
 
-        # --- Add to the global aggregate sums (SQFT & Amount) ---
-        current_sums = aggregated_results.get(key, {'sqft_sum': decimal.Decimal(0), 'amount_sum': decimal.Decimal(0)})
+    logging.info(f"{prefix} Processing {num_rows} rows for aggregation modes: {active_modes}.")
+    # The view only reads columns validated by an active mode (e.g. 'unit' only when STANDARD runs)
+    view_cols = {col for mode in active_modes for col in AGGREGATION_MODES[mode]['required_cols']} | {'description'}
+    view_columns = {col: columns[col].to_list() if isinstance(columns[col], Column) else columns[col]
+                    for col in view_cols if col in columns}
+    mode_targets = [(AGGREGATION_MODES[mode]['key'], aggregation_maps[mode]) for mode in active_modes]
 
-        # logging.debug(f"{log_row_context}: Sums for key {key} BEFORE add = {current_sums}") # Reduced verbosity
+    # --- Single pass over the rows ---
+    successful_conversions_sqft = 0
+    successful_conversions_amount = 0
+    for row in _normalized_rows(view_columns, num_rows, prefix):
+        successful_conversions_sqft += row['sqft_converted']
+        successful_conversions_amount += row['amount_converted']
+        sqft_dec, amount_dec = row['sqft'], row['amount']
+        for key_func, aggregated_results in mode_targets:
+            key = key_func(row)
+            current_sums = aggregated_results.get(key)
+            if current_sums is None:
+                current_sums = aggregated_results[key] = {'sqft_sum': decimal.Decimal(0), 'amount_sum': decimal.Decimal(0)}
+            current_sums['sqft_sum'] += sqft_dec
+            current_sums['amount_sum'] += amount_dec
+
+    logging.info(f"{prefix} Finished processing {num_rows} rows.")
+    logging.info(f"{prefix} SQFT values successfully converted for {successful_conversions_sqft} rows; Amount values for {successful_conversions_amount} rows.")
+    for mode in active_modes:
+        logging.info(f"{prefix} Global {mode.upper()} aggregation map size: {len(aggregation_maps[mode])}")
+    return aggregation_maps
 
-        # Update the sums
-        current_sums['sqft_sum'] += sqft_dec
-        current_sums['amount_sum'] += amount_dec
 
-        # Store the updated dictionary back into the global map
-        aggregated_results[key] = current_sums
-        # logging.debug(f"{log_row_context}: Global sums for key {key} AFTER add = {aggregated_results[key]}") # Reduced verbosity
+def aggregate_standard_by_po_item_price(
+    processed_data: Dict[str, List[Any]],
+    global_aggregation_map: AggregationMap
+) -> AggregationMap:
+    """
+    STANDARD Aggregation: Aggregates 'sqft' AND 'amount' values based on unique
+    combinations of 'po', 'item', 'unit' price, AND 'description'.
+    Updates the global_aggregation_map in place. Use aggregate_all_modes to fill
+    several modes in one pass.
 
+    Args:
+        processed_data: Dictionary representing the data of the current table.
+        global_aggregation_map: The dictionary holding the cumulative aggregation results.
+                                  Key: (po, item, price, description)
+                                  Value: Dict{'sqft_sum': Decimal, 'amount_sum': Decimal}.
 
-    logging.info(f"{prefix} Finished processing {rows_processed_this_table} rows.")
-    logging.info(f"{prefix} SQFT values successfully converted/defaulted for {successful_conversions_sqft} rows.")
-    logging.info(f"{prefix} Amount values successfully converted/defaulted for {successful_conversions_amount} rows.")
-    logging.info(f"{prefix} Global standard aggregation map size: {len(aggregated_results)}")
-    # logging.debug(f"{prefix} Global Standard Aggregated Results (End of Table):\n{pprint.pformat(aggregated_results)}") # Keep DEBUG for detailed tracing if needed
-    return aggregated_results
+    Returns:
+        The updated global_aggregation_map.
+    """
+    return aggregate_all_modes(processed_data, {'standard': global_aggregation_map})['standard']
 
 
-# *** Custom Aggregation Function (MODIFIED to include DESCRIPTION key) ***
 def aggregate_custom_by_po_item(
     processed_data: Dict[str, List[Any]],
-    # UPDATED TYPE HINT: Key is now 4 elements (PO, Item, None, Description)
-    global_custom_aggregation_map: Dict[Tuple[Any, Any, None, Optional[str]], Dict[str, decimal.Decimal]]
-) -> Dict[Tuple[Any, Any, None, Optional[str]], Dict[str, decimal.Decimal]]:
+    global_custom_aggregation_map: AggregationMap
+) -> AggregationMap:
     """
     CUSTOM Aggregation: Aggregates 'sqft' and 'amount' values based on unique
     combinations of 'po', 'item', AND 'description'. Uses a 4-element key
     (PO, Item, None, Description) for structural consistency with standard aggregation.
-    Updates the global_custom_aggregation_map in place.
+    Updates the global_custom_aggregation_map in place. Use aggregate_all_modes to
+    fill several modes in one pass.
 
     Args:
         processed_data: Dictionary representing the data of the current table.
@@ -552,149 +766,6 @@ def aggregate_custom_by_po_item(
     Returns:
         The updated global_custom_aggregation_map.
     """
-    aggregated_results = global_custom_aggregation_map
-    # Required columns for this aggregation (Description is optional)
-    required_cols = ['po', 'item', 'sqft', 'amount']
-    prefix = "[aggregate_custom]"
-
-    logging.debug(f"{prefix} Updating global CUSTOM aggregation (SQFT & Amount by PO/Item/Desc) with new table data.")
-    logging.debug(f"{prefix} Size of global custom map BEFORE processing this table: {len(aggregated_results)}")
-
-    # --- Input Validation ---
-    if not isinstance(processed_data, dict):
-        logging.error(f"{prefix} Input 'processed_data' is not a dictionary. Cannot aggregate.")
-        return aggregated_results
-
-    missing_cols = [col for col in required_cols if col not in processed_data]
-    if missing_cols:
-        logging.warning(f"{prefix} Cannot perform full CUSTOM aggregation: Missing required columns {missing_cols}. Proceeding cautiously.")
-        # Allow proceeding, rows without needed data will be skipped or defaulted
-
-    # --- Check for optional 'description' column ---
-    has_description_col = 'description' in processed_data
-    if has_description_col and not isinstance(processed_data.get('description'), list):
-        logging.warning(f"{prefix} 'description' column exists but is not a list. Will use None for description keys.")
-        has_description_col = False
-    elif not has_description_col:
-        logging.info(f"{prefix} 'description' column not found or is invalid. Will use None for description keys.")
-
-
-    # Safely get lists and check types - Use get() with default empty list
-    po_list = processed_data.get('po', [])
-    item_list = processed_data.get('item', [])
-    sqft_list = processed_data.get('sqft', [])
-    amount_list = processed_data.get('amount', [])
-    description_list = processed_data.get('description', []) if has_description_col else []
-
-    # Use length of 'po' list as reference (handle potential missing 'po'?)
-    num_rows = len(po_list) if po_list else 0
-    if not po_list and (item_list or sqft_list or amount_list or description_list):
-        # If PO is missing but others exist, try using another core list length
-        core_lists = [l for l in [item_list, sqft_list, amount_list] if l]
-        if core_lists:
-            num_rows = len(core_lists[0])
-            logging.warning(f"{prefix} 'po' list missing or empty, using length of another list ({num_rows}) as reference.")
-        else:
-            logging.warning(f"{prefix} Core lists ('po', 'item', 'sqft', 'amount') seem missing or empty. Cannot reliably determine row count.")
-            num_rows = 0 # Cannot proceed safely
-
-    logging.debug(f"{prefix} Determined number of rows: {num_rows}")
-
-    # Check for length consistency across all *found* required lists + description if present
-    all_lists = {'po': po_list, 'item': item_list, 'sqft': sqft_list, 'amount': amount_list}
-    if has_description_col:
-        all_lists['description'] = description_list
-
-    found_lists = {k: v for k, v in all_lists.items() if k in processed_data and isinstance(processed_data[k], list)}
-
-    if not all(len(lst) == num_rows for lst in found_lists.values()):
-        lengths = {k: len(v) for k, v in found_lists.items()}
-        logging.error(f"{prefix} Data length mismatch for found columns! Ref:{num_rows}, Found:{lengths}. Aborting custom aggregation for this table.")
-        return aggregated_results
-
-    if num_rows == 0:
-        logging.info(f"{prefix} No data rows found in this table. Global custom aggregation map remains unchanged.")
-        return aggregated_results
-
-    logging.info(f"{prefix} Processing {num_rows} rows from this table to update global CUSTOM aggregation (by PO/Item/Desc).")
-
-    # --- Iterate and Aggregate ---
-    rows_processed_this_table = 0
-    successful_conversions_sqft = 0
-    successful_conversions_amount = 0
-
-    for i in range(num_rows):
-        rows_processed_this_table += 1
-        log_row_context = f"{prefix} Table Row index {i}"
-        # logging.debug(f"{log_row_context} --- Processing ---") # Reduced verbosity
-
-        # Get raw values (handle potential missing lists safely using get with default None)
-        po_val = po_list[i] if i < len(po_list) else None
-        item_val = item_list[i] if i < len(item_list) else None
-        sqft_raw = sqft_list[i] if i < len(sqft_list) else None
-        amount_raw = amount_list[i] if i < len(amount_list) else None
-        desc_raw = description_list[i] if has_description_col and i < len(description_list) else None
-
-        # logging.debug(f"{log_row_context}: Raw values - PO='{po_val}', Item='{item_val}', Desc='{desc_raw}', SQFT='{sqft_raw}', Amount='{amount_raw}'") # Reduced verbosity
-
-        # Prepare the key components (Handle None, strip strings)
-        po_key = str(po_val).strip() if isinstance(po_val, str) else po_val
-        item_key = str(item_val).strip() if isinstance(item_val, str) else item_val
-        description_key = str(desc_raw).strip() if isinstance(desc_raw, str) else desc_raw
-        description_key = description_key if description_key else None # Ensure empty strings become None
-
-
-        po_key = po_key if po_key is not None else "<MISSING_PO>"
-        item_key = item_key if item_key is not None else "<MISSING_ITEM>"
-        # Description key can be None
-
-        # logging.debug(f"{log_row_context}: Key parts - PO Key='{po_key}', Item Key='{item_key}', Desc Key='{description_key}'") # Reduced verbosity
-
-        # UPDATED Key: (PO, Item, None, Description) - Move description to index 3 to match standard
-        key = (po_key, item_key, None, description_key)
-        # logging.debug(f"{log_row_context}: Generated Key Tuple = {key}") # Reduced verbosity
-
-        # Convert SQFT to Decimal for summation (default to 0 if fails/None)
-        sqft_dec = _convert_to_decimal(sqft_raw, f"{log_row_context} SQFT")
-        if sqft_dec is None:
-            # logging.debug(f"{log_row_context}: SQFT value '{sqft_raw}' is None or failed conversion. Using 0.") # Reduced verbosity
-            sqft_dec = decimal.Decimal(0)
-        else:
-             successful_conversions_sqft +=1
-
-        # Convert Amount to Decimal for summation (default to 0 if fails/None)
-        amount_dec = _convert_to_decimal(amount_raw, f"{log_row_context} Amount")
-        if amount_dec is None:
-            # logging.debug(f"{log_row_context}: Amount value '{amount_raw}' is None or failed conversion. Using 0.") # Reduced verbosity
-            amount_dec = decimal.Decimal(0)
-        else:
-            successful_conversions_amount +=1
-
-        # logging.debug(f"{log_row_context}: Converted values - SQFT='{sqft_dec}', Amount='{amount_dec}'") # Reduced verbosity
-
-        # --- Add to the global aggregate sums (SQFT & Amount) ---
-        current_sums = aggregated_results.get(key, {'sqft_sum': decimal.Decimal(0), 'amount_sum': decimal.Decimal(0)})
-
-        # logging.debug(f"{log_row_context}: Sums for key {key} BEFORE add = {current_sums}") # Reduced verbosity
-
-        # Update the sums
-        current_sums['sqft_sum'] += sqft_dec
-        current_sums['amount_sum'] += amount_dec
-
-        # Store the updated dictionary back into the global map
-        aggregated_results[key] = current_sums
-        # logging.debug(f"{log_row_context}: Global sums for key {key} AFTER add = {aggregated_results[key]}") # Reduced verbosity
-
-
-    # --- Log summary for this table's contribution ---
-    logging.info(f"{prefix} Finished processing {rows_processed_this_table} rows for this table.")
-    logging.info(f"{prefix} SQFT values successfully converted/defaulted for {successful_conversions_sqft} rows.")
-    logging.info(f"{prefix} Amount values successfully converted/defaulted for {successful_conversions_amount} rows.")
-    logging.info(f"{prefix} Global custom aggregation map now contains {len(aggregated_results)} unique (PO, Item, None, Description) keys.")
-
-    # Log the state of the map at DEBUG level after processing this table
-    # logging.debug(f"{prefix} Global Custom Aggregated Results Dictionary (after this table):\n{pprint.pformat(aggregated_results)}") # Keep DEBUG for detailed tracing if needed
-
-    return aggregated_results # Return the modified global map
+    return aggregate_all_modes(processed_data, {'custom': global_custom_aggregation_map})['custom']
 
 # --- END MODIFIED FILE: data_processor.py ---
\ No newline at end of file
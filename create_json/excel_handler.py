@@ -1,12 +1,87 @@
 # --- START OF FULL FILE: excel_handler.py ---
 
 import openpyxl
+from openpyxl.utils import range_boundaries
 import os
 import logging # Using logging is better than print for info/errors
+from typing import Any, Iterable, Iterator, List, Optional, Tuple
 
 # Basic config moved to main.py, logger will inherit settings
 # logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+# Workbooks at or above this size are opened in openpyxl's read-only (streaming) mode
+# when load_sheet() is called with read_only=None.
+READ_ONLY_AUTO_THRESHOLD_BYTES = 2 * 1024 * 1024
+
+# Shared placeholder for rows with no values (e.g. formatting-only rows), so inflated
+# sheets cost one reference per blank row instead of a tuple of Nones.
+_EMPTY_ROW: Tuple[Any, ...] = ()
+
+
+class SheetGrid:
+    """
+    Compact, read-only snapshot of a worksheet's cell values.
+
+    Rows are stored as the tuples produced by iter_rows(values_only=True), so
+    the parser can index them directly instead of resolving a cell object (and
+    often a coordinate string) for every lookup. All row/column arguments are
+    1-indexed to mirror openpyxl's sheet.cell(row=..., column=...).
+    """
+    __slots__ = ('title', 'rows', 'max_row', 'max_column')
+
+    def __init__(self, rows: List[Tuple[Any, ...]], title: Optional[str] = None):
+        self.title = title
+        self.rows = rows
+        self.max_row = len(rows)
+        self.max_column = max((len(r) for r in rows), default=0)
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Tuple[Any, ...]], title: Optional[str] = None) -> 'SheetGrid':
+        """Builds a grid from an iterable of value tuples, collapsing blank rows."""
+        collected = [
+            row_values if any(v is not None for v in row_values) else _EMPTY_ROW
+            for row_values in rows
+        ]
+        return cls(collected, title=title)
+
+    @classmethod
+    def from_worksheet(cls, sheet) -> 'SheetGrid':
+        """Reads every row of an openpyxl worksheet once, keeping values only."""
+        return cls.from_rows(sheet.iter_rows(values_only=True), title=sheet.title)
+
+    def clear_merged(self, ranges: Iterable[str]):
+        """
+        Blanks every cell of each merged range except its top-left anchor, matching what
+        a full-mode openpyxl worksheet reports. Needed for streamed/read-only sources,
+        which return the raw stored value of every merged cell.
+        """
+        for range_ref in ranges:
+            min_col, min_row, max_col, max_row = range_boundaries(range_ref)
+            for row_num in range(min_row, min(max_row, self.max_row) + 1):
+                row_values = self.rows[row_num - 1]
+                first_col = min_col + 1 if row_num == min_row else min_col
+                last_col = min(max_col, len(row_values))
+                if first_col > last_col or all(v is None for v in row_values[first_col - 1:last_col]):
+                    continue
+                cleared = list(row_values)
+                cleared[first_col - 1:last_col] = [None] * (last_col - first_col + 1)
+                self.rows[row_num - 1] = tuple(cleared) if any(v is not None for v in cleared) else _EMPTY_ROW
+
+    def row(self, row: int) -> Tuple[Any, ...]:
+        """Returns the value tuple for a 1-indexed row, or an empty tuple if out of range."""
+        if 1 <= row <= self.max_row:
+            return self.rows[row - 1]
+        return ()
+
+    def value(self, row: int, column: int) -> Any:
+        """Returns the value at a 1-indexed (row, column), or None if out of range."""
+        if 1 <= row <= self.max_row:
+            row_values = self.rows[row - 1]
+            if 1 <= column <= len(row_values):
+                return row_values[column - 1]
+        return None
+
+
 class ExcelHandler:
     """Handles loading and accessing data from Excel files using openpyxl."""
     def __init__(self, file_path):
@@ -16,22 +91,43 @@ class ExcelHandler:
         self.file_path = file_path
         self.workbook = None
         self.sheet = None
+        self.grid = None
+        self.read_only = False
         logging.info(f"Initialized ExcelHandler for: {file_path}")
 
-    def load_sheet(self, sheet_name=None, data_only=True):
+    def _should_use_read_only(self) -> bool:
+        """Picks streaming mode for large workbooks when the caller leaves the choice to us."""
+        try:
+            file_size = os.path.getsize(self.file_path)
+        except OSError:
+            return False
+        use_read_only = file_size >= READ_ONLY_AUTO_THRESHOLD_BYTES
+        logging.info(f"Workbook size is {file_size} bytes. Auto-selected {'read-only (streaming)' if use_read_only else 'full'} load mode.")
+        return use_read_only
+
+    def load_sheet(self, sheet_name=None, data_only=True, read_only=None):
         """
         Loads the workbook and a specific sheet.
 
         Args:
             sheet_name (str, optional): Name of the sheet. Defaults to None (active sheet).
             data_only (bool, optional): Get cell values (True) or formulas (False). Defaults to True.
+            read_only (bool, optional): Open the workbook in openpyxl's streaming read-only mode.
+                True/False forces the mode; None (default) selects it automatically for files of
+                at least READ_ONLY_AUTO_THRESHOLD_BYTES. Read-only sheets only support row
+                iteration, so use iter_rows() or get_grid() rather than cell access.
 
         Returns:
-            openpyxl.worksheet.worksheet.Worksheet: The loaded sheet object, or None on failure.
+            openpyxl.worksheet.worksheet.Worksheet: The loaded sheet object (a ReadOnlyWorksheet
+            in streaming mode), or None on failure.
         """
         try:
-            logging.info(f"Attempting to load workbook '{self.file_path}' with data_only={data_only}")
-            self.workbook = openpyxl.load_workbook(self.file_path, data_only=data_only)
+            if read_only is None:
+                read_only = self._should_use_read_only()
+            self.read_only = bool(read_only)
+            logging.info(f"Attempting to load workbook '{self.file_path}' with data_only={data_only}, read_only={self.read_only}")
+            self.workbook = openpyxl.load_workbook(self.file_path, data_only=data_only, read_only=self.read_only)
+            self.grid = None # Any previous snapshot belongs to the old sheet
             active_sheet_title = self.workbook.active.title # Get active sheet title early
 
             if sheet_name:
@@ -49,7 +145,10 @@ class ExcelHandler:
             
             # Add diagnostic info for MOTO files
             if "MOTO" in str(self.file_path):
-                logging.warning(f"MOTO FILE DETECTED - Large max_row might cause performance issues: {self.sheet.max_row}")
+                if self.read_only:
+                    logging.info(f"MOTO FILE DETECTED - Streaming rows in read-only mode, blank formatted rows are collapsed. Reported max_row: {self.sheet.max_row}")
+                else:
+                    logging.warning(f"MOTO FILE DETECTED - Large max_row might cause performance issues: {self.sheet.max_row}")
             
             return self.sheet
         except FileNotFoundError: # Already handled in __init__, but belt-and-suspenders
@@ -59,6 +158,7 @@ class ExcelHandler:
             logging.error(f"Failed to load workbook/sheet from '{self.file_path}': {e}", exc_info=True)
             self.workbook = None
             self.sheet = None
+            self.grid = None
             return None
 
     def get_sheet(self):
@@ -67,6 +167,49 @@ class ExcelHandler:
             logging.warning("Sheet not loaded. Call load_sheet() first.")
         return self.sheet
 
+    def iter_rows(self) -> Iterator[Tuple[Any, ...]]:
+        """
+        Lazily yields the value tuple of each row in the loaded sheet.
+        In read-only mode rows are parsed from the archive as they are consumed.
+        """
+        if not self.sheet:
+            logging.warning("Sheet not loaded. Call load_sheet() first.")
+            return
+        yield from self.sheet.iter_rows(values_only=True)
+
+    def get_grid(self) -> Optional[SheetGrid]:
+        """
+        Returns an in-memory SheetGrid of the loaded sheet's values.
+
+        The sheet is read once on first call and the snapshot is reused afterwards,
+        so header detection and table extraction share a single pass over the cells.
+        In read-only mode the workbook archive is released as soon as the grid is built.
+        """
+        if self.grid is None:
+            if not self.sheet:
+                logging.warning("Sheet not loaded. Call load_sheet() first.")
+                return None
+            self.grid = SheetGrid.from_rows(self.iter_rows(), title=self.sheet.title)
+            logging.info(f"Built value grid for sheet '{self.grid.title}': {self.grid.max_row} rows x {self.grid.max_column} columns")
+            if self.read_only:
+                self._release_archive()
+                # Read-only sheets expose no merge info; blank merged cells like full mode does.
+                from xlsx_stream_reader import read_merged_ranges
+                try:
+                    self.grid.clear_merged(read_merged_ranges(self.file_path, self.grid.title))
+                except Exception as e:
+                    logging.warning(f"Could not apply merged ranges to read-only grid (merged cells may repeat values): {e}")
+        return self.grid
+
+    def _release_archive(self):
+        """Closes the underlying zip archive of a read-only workbook; the grid stays usable."""
+        if self.workbook:
+            try:
+                self.workbook.close()
+                logging.info(f"Released read-only workbook archive for: {self.file_path}")
+            except Exception as e:
+                logging.warning(f"Exception while releasing read-only workbook archive (this is usually okay): {e}")
+
     def close(self):
         """Closes the workbook if it's open."""
         # openpyxl doesn't require explicit closing for reading,
@@ -83,6 +226,7 @@ class ExcelHandler:
             finally:
                  self.workbook = None
                  self.sheet = None
+                 self.grid = None
 
 
 # --- END OF FULL FILE: excel_handler.py ---
\ No newline at end of file
@@ -22,9 +22,10 @@ def run_simple_extraction_and_sum():
     if not sheet:
         logging.error("Failed to load the sheet. Exiting.")
         return
+    grid = handler.get_grid()
 
     # Find the header row and column mapping
-    header_info = sheet_parser.find_and_map_smart_headers(sheet) #
+    header_info = sheet_parser.find_and_map_smart_headers(grid) #
     if not header_info:
         logging.error("Could not find a valid header row. Exiting.")
         return
@@ -35,12 +36,12 @@ def run_simple_extraction_and_sum():
     # Find all tables on the sheet
     all_header_rows = [header_row]
     additional_headers = sheet_parser.find_all_header_rows(
-        sheet, HEADER_IDENTIFICATION_PATTERN, HEADER_SEARCH_ROW_RANGE, HEADER_SEARCH_COL_RANGE, start_after_row=header_row
+        grid, HEADER_IDENTIFICATION_PATTERN, HEADER_SEARCH_ROW_RANGE, HEADER_SEARCH_COL_RANGE, start_after_row=header_row
     ) #
     all_header_rows.extend(additional_headers)
 
     # Extract data from all found tables
-    all_tables_data = sheet_parser.extract_multiple_tables(sheet, all_header_rows, column_mapping) #
+    all_tables_data = sheet_parser.extract_multiple_tables(grid, all_header_rows, column_mapping) #
     handler.close()
 
     if not all_tables_data:
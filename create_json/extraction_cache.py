@@ -0,0 +1,147 @@
+# --- START OF FULL FILE: extraction_cache.py ---
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+from pathlib import Path
+from typing import Any, Dict, Optional, Union
+
+# Bump when the extraction code changes in a way that alters the JSON output
+# for the same workbook and config, so stale entries stop matching.
+CACHE_FORMAT_VERSION = 2
+
+DEFAULT_CACHE_MAX_BYTES = 200 * 1024 * 1024
+
+# Config attributes that influence the extracted JSON. EXTRACTION_BACKEND and
+# XML_STREAM_MIN_COST are deliberately absent: every backend yields the same grid.
+CONFIG_FINGERPRINT_KEYS = (
+    "SHEET_NAME",
+    "HEADER_SEARCH_ROW_RANGE",
+    "HEADER_SEARCH_COL_RANGE",
+    "HEADER_IDENTIFICATION_PATTERN",
+    "EXPECTED_HEADER_DATA_TYPES",
+    "TARGET_HEADERS_MAP",
+    "EXPECTED_HEADER_PATTERNS",
+    "EXPECTED_HEADER_VALUES",
+    "HEADERLESS_COLUMN_PATTERNS",
+    "STOP_EXTRACTION_ON_EMPTY_COLUMN",
+    "MAX_DATA_ROWS_TO_SCAN",
+    "COLUMNS_TO_DISTRIBUTE",
+    "DISTRIBUTION_BASIS_COLUMN",
+    "CUSTOM_AGGREGATION_WORKBOOK_PREFIXES",
+)
+
+
+def config_fingerprint(cfg: Any) -> str:
+    """Returns a sha256 over the parser-relevant values of a config module/object."""
+    values = {key: getattr(cfg, key, None) for key in CONFIG_FINGERPRINT_KEYS}
+    canonical = json.dumps(values, sort_keys=True, ensure_ascii=False, default=repr)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def file_sha256(file_path: Union[str, Path], chunk_size: int = 1024 * 1024) -> str:
+    """Hashes a file's bytes in chunks."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ExtractionCache:
+    """
+    Content-addressed, size-bounded on-disk cache of extraction JSON.
+
+    Entries are keyed by the workbook's sha256, its filename (the filename picks
+    the aggregation mode) and the parser config fingerprint, so editing config.py
+    invalidates old entries automatically. Least recently used entries (by file
+    mtime, refreshed on every hit) are evicted once the cache exceeds max_bytes.
+    """
+
+    def __init__(self, cache_dir: Union[str, Path], cfg: Any, max_bytes: Optional[int] = None):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes if max_bytes is not None else getattr(cfg, "EXTRACTION_CACHE_MAX_BYTES", DEFAULT_CACHE_MAX_BYTES)
+        self.config_fingerprint = config_fingerprint(cfg)
+
+    def key_for(self, workbook_path: Union[str, Path]) -> str:
+        """Builds the cache key for a workbook under the current config."""
+        parts = f"{CACHE_FORMAT_VERSION}|{file_sha256(workbook_path)}|{Path(workbook_path).name}|{self.config_fingerprint}"
+        return hashlib.sha256(parts.encode("utf-8")).hexdigest()
+
+    def _entry_path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.json"
+
+    def get_path(self, key: str) -> Optional[Path]:
+        """Returns the cached JSON file for key (marking it recently used), or None on a miss."""
+        entry_path = self._entry_path(key)
+        if not entry_path.is_file():
+            return None
+        try:
+            os.utime(entry_path, None)
+        except OSError:
+            pass
+        return entry_path
+
+    def restore(self, key: str, output_path: Union[str, Path]) -> Optional[Dict[str, Any]]:
+        """
+        On a hit, copies the cached JSON to output_path and returns it parsed.
+        Returns None on a miss or if the entry is unreadable (the entry is then dropped).
+        """
+        entry_path = self.get_path(key)
+        if entry_path is None:
+            return None
+        try:
+            with open(entry_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            shutil.copyfile(entry_path, output_path)
+            return data
+        except (OSError, json.JSONDecodeError) as e:
+            logging.warning(f"[ExtractionCache] Dropping unreadable cache entry '{entry_path.name}': {e}")
+            try:
+                entry_path.unlink()
+            except OSError:
+                pass
+            return None
+
+    def store(self, key: str, json_path: Union[str, Path]):
+        """Copies a freshly written JSON output into the cache, then enforces the size bound."""
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        os.close(fd)
+        try:
+            shutil.copyfile(json_path, tmp_path)
+            os.replace(tmp_path, self._entry_path(key)) # Atomic, safe with concurrent writers
+        except OSError as e:
+            logging.warning(f"[ExtractionCache] Could not store cache entry for '{json_path}': {e}")
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            return
+        self.evict()
+
+    def evict(self):
+        """Removes least recently used entries until the cache fits in max_bytes."""
+        entries = []
+        total_bytes = 0
+        for entry_path in self.cache_dir.glob("*.json"):
+            try:
+                stat = entry_path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry_path))
+            total_bytes += stat.st_size
+        if total_bytes <= self.max_bytes:
+            return
+        for _, size, entry_path in sorted(entries):
+            try:
+                entry_path.unlink()
+                total_bytes -= size
+                logging.info(f"[ExtractionCache] Evicted '{entry_path.name}' ({size} bytes).")
+            except OSError:
+                continue
+            if total_bytes <= self.max_bytes:
+                break
+
+# --- END OF FULL FILE: extraction_cache.py ---
@@ -0,0 +1,219 @@
+# --- START OF FULL FILE: header_matcher.py ---
+
+import re
+import logging
+from typing import Any, Dict, List, Optional, Pattern, Sequence, Tuple
+from decimal import Decimal
+from openpyxl.utils import get_column_letter
+
+import config
+
+# Score awarded per rule type (kept identical to the original inline scoring)
+SCORE_VALUE_MATCH = 25      # Data cell matches EXPECTED_HEADER_VALUES
+SCORE_PATTERN_MATCH = 15    # Data cell matches EXPECTED_HEADER_PATTERNS
+SCORE_TYPE_MATCH = 5        # Data cell matches EXPECTED_HEADER_DATA_TYPES
+SCORE_MERCY = 1             # Header matched a 'string' column but the data cell did not validate
+SCORE_HEADERLESS = 4        # Empty header, data cell matches HEADERLESS_COLUMN_PATTERNS
+SCORE_UNIT_AMOUNT_TIE = 10  # Bonus for resolving two numeric 'unit'/'amount' look-alike columns
+
+
+def _compile_patterns(canonical_name: str, patterns: Any) -> Tuple[Pattern, ...]:
+    """Compiles a pattern or list of patterns, logging and skipping invalid ones."""
+    pattern_list = [patterns] if isinstance(patterns, str) else list(patterns or [])
+    compiled = []
+    for pattern in pattern_list:
+        try:
+            compiled.append(re.compile(pattern))
+        except re.error as e:
+            logging.error(f"[HeaderMatcher] Invalid regex pattern provided in config for '{canonical_name}' '{pattern}': {e}")
+    return tuple(compiled)
+
+
+class _ColumnRule:
+    """Precomputed validation rule for one canonical header name."""
+    __slots__ = ('name', 'allowed_values', 'patterns', 'accepts_numeric', 'accepts_string')
+
+    def __init__(self, name: str, allowed_values, patterns: Tuple[Pattern, ...], allowed_types: Sequence[str]):
+        self.name = name
+        self.allowed_values = tuple(allowed_values) if allowed_values is not None else None
+        self.patterns = patterns
+        self.accepts_numeric = 'numeric' in allowed_types
+        self.accepts_string = 'string' in allowed_types
+
+    def score(self, data_value: Any, data_str: str) -> int:
+        """Scores the cell below a header that matched this rule's aliases."""
+        score = 0
+        if self.allowed_values is not None:
+            processed_data_value = int(data_value) if isinstance(data_value, str) and data_value.isdigit() else data_value
+            if processed_data_value in self.allowed_values:
+                score = SCORE_VALUE_MATCH
+        elif self.patterns:
+            if data_str and any(p.match(data_str) for p in self.patterns):
+                score = SCORE_PATTERN_MATCH
+        else:
+            is_numeric = isinstance(data_value, (int, float, Decimal))
+            if (self.accepts_numeric and is_numeric) or \
+               (self.accepts_string and (is_numeric or (isinstance(data_value, str) and bool(data_value.strip())))):
+                score = SCORE_TYPE_MATCH
+
+        if score == 0 and self.accepts_string:
+            # Mercy rule: the header matched but the cell below is empty or unvalidated.
+            score = SCORE_MERCY
+        return score
+
+
+class HeaderMatcher:
+    """
+    Header detection engine built once from the parser config.
+
+    Holds an inverted index of normalized alias -> canonical names (in
+    TARGET_HEADERS_MAP priority order) and precompiled validation regexes,
+    so scoring a row costs one dict lookup per header cell instead of
+    re-normalizing every alias list and re-parsing every pattern.
+    """
+
+    def __init__(
+        self,
+        target_headers_map: Dict[str, List[Any]],
+        expected_header_values: Dict[str, List[Any]],
+        expected_header_patterns: Dict[str, Any],
+        expected_header_data_types: Dict[str, List[str]],
+        headerless_column_patterns: Dict[str, Any],
+    ):
+        alias_index: Dict[str, List[str]] = {}
+        for canonical_name, aliases in target_headers_map.items():
+            for alias in aliases:
+                names = alias_index.setdefault(str(alias).upper(), [])
+                if canonical_name not in names:
+                    names.append(canonical_name)
+        self.alias_index: Dict[str, Tuple[str, ...]] = {alias: tuple(names) for alias, names in alias_index.items()}
+
+        self.rules: Dict[str, _ColumnRule] = {
+            canonical_name: _ColumnRule(
+                canonical_name,
+                expected_header_values.get(canonical_name),
+                _compile_patterns(canonical_name, expected_header_patterns.get(canonical_name)),
+                expected_header_data_types.get(canonical_name, []),
+            )
+            for canonical_name in target_headers_map
+        }
+        self.headerless_rules: Tuple[Tuple[str, Tuple[Pattern, ...]], ...] = tuple(
+            (canonical_name, _compile_patterns(canonical_name, patterns))
+            for canonical_name, patterns in headerless_column_patterns.items()
+        )
+        logging.debug(f"[HeaderMatcher] Built index with {len(self.alias_index)} aliases for {len(self.rules)} canonical headers.")
+
+    @classmethod
+    def from_config(cls, cfg=config) -> 'HeaderMatcher':
+        """Builds a matcher from a config module (defaults to create_json/config.py)."""
+        return cls(
+            cfg.TARGET_HEADERS_MAP,
+            cfg.EXPECTED_HEADER_VALUES,
+            cfg.EXPECTED_HEADER_PATTERNS,
+            cfg.EXPECTED_HEADER_DATA_TYPES,
+            cfg.HEADERLESS_COLUMN_PATTERNS,
+        )
+
+    def column_candidates(self, header_value: Any, data_value: Any) -> List[Dict]:
+        """
+        Returns the scored candidates ({'score', 'name'}) for one column, given its
+        header cell and the data cell directly below it.
+        """
+        header_str = str(header_value or '').strip().upper()
+        data_str = str(data_value or '').strip()
+
+        if header_str:
+            candidate_canonicals = self.alias_index.get(header_str)
+            if not candidate_canonicals:
+                return []
+            col_scores = []
+            for canonical_name in candidate_canonicals:
+                score = self.rules[canonical_name].score(data_value, data_str)
+                if score > 0:
+                    col_scores.append({'score': score, 'name': canonical_name})
+            return col_scores
+
+        if data_str:
+            for canonical_name, patterns in self.headerless_rules:
+                if any(p.match(data_str) for p in patterns):
+                    return [{'score': SCORE_HEADERLESS, 'name': canonical_name}]
+        return []
+
+    def evaluate_row(self, header_row_values: Sequence[Any], data_row_values: Sequence[Any], col_range: Tuple[int, int]) -> Tuple[int, Dict[str, str]]:
+        """
+        Scores a single candidate header row against the row below it.
+
+        Returns:
+            (row_score, mapping) where mapping is canonical name -> column letter.
+        """
+        all_column_candidates: Dict[int, List[Dict]] = {}
+        header_len, data_len = len(header_row_values), len(data_row_values)
+        for col_num in range(col_range[0], col_range[1] + 1):
+            header_value = header_row_values[col_num - 1] if col_num <= header_len else None
+            data_value = data_row_values[col_num - 1] if col_num <= data_len else None
+            candidates = self.column_candidates(header_value, data_value)
+            if candidates:
+                all_column_candidates[col_num] = candidates
+
+        potential_mapping: Dict[str, str] = {}
+        current_row_score = 0
+        processed_canonicals = set()
+
+        unit_amt_tie_cols = [
+            col for col, candidates in all_column_candidates.items()
+            if {c['name'] for c in candidates} == {'unit', 'amount'} and all(c['score'] == SCORE_TYPE_MATCH for c in candidates)
+        ]
+        if len(unit_amt_tie_cols) == 2:
+            col1, col2 = sorted(unit_amt_tie_cols)
+            potential_mapping['unit'] = get_column_letter(col1)
+            potential_mapping['amount'] = get_column_letter(col2)
+            processed_canonicals.update(['unit', 'amount'])
+            current_row_score += SCORE_UNIT_AMOUNT_TIE
+            del all_column_candidates[col1], all_column_candidates[col2]
+
+        for col_num, candidates in sorted(all_column_candidates.items()):
+            valid_candidates = [c for c in candidates if c['name'] not in processed_canonicals]
+            if not valid_candidates: continue
+            best_candidate = max(valid_candidates, key=lambda x: x['score'])
+            potential_mapping[best_candidate['name']] = get_column_letter(col_num)
+            processed_canonicals.add(best_candidate['name'])
+            current_row_score += best_candidate['score']
+
+        return current_row_score, potential_mapping
+
+    def find_best_header_row(self, grid, row_range: Tuple[int, int], col_range: Tuple[int, int]) -> Optional[Tuple[int, Dict[str, str], int]]:
+        """
+        Evaluates every row in row_range of a SheetGrid in a single pass and returns
+        (header_row, mapping, score) for the highest-scoring row that maps at least
+        three columns, or None.
+        """
+        prefix = "[HeaderMatcher.find_best_header_row]"
+        best_result: Optional[Tuple[int, Dict[str, str], int]] = None
+        highest_row_score = 0
+
+        for row_num in range(row_range[0], row_range[1] + 1):
+            if row_num + 1 > grid.max_row: continue
+            current_row_score, potential_mapping = self.evaluate_row(grid.row(row_num), grid.row(row_num + 1), col_range)
+            if not potential_mapping: continue
+
+            logging.info(f"{prefix} Evaluated Row {row_num} | Score: {current_row_score} | Mapping: {potential_mapping}")
+
+            if len(potential_mapping) >= 3 and current_row_score > highest_row_score:
+                highest_row_score = current_row_score
+                best_result = (row_num, potential_mapping, current_row_score)
+                logging.info(f"{prefix} Found new best candidate row at {row_num} with score {highest_row_score}.")
+
+        return best_result
+
+
+_default_matcher: Optional[HeaderMatcher] = None
+
+
+def get_default_matcher() -> HeaderMatcher:
+    """Returns the process-wide HeaderMatcher built from config.py (built on first use)."""
+    global _default_matcher
+    if _default_matcher is None:
+        _default_matcher = HeaderMatcher.from_config()
+    return _default_matcher
+
+# --- END OF FULL FILE: header_matcher.py ---
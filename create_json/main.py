@@ -32,9 +32,12 @@ except ImportError:
     logging.warning("Using dummy config values due to import failure.")
 
 
-from excel_handler import ExcelHandler
+import xlsx_stream_reader
 import sheet_parser
+from extraction_cache import ExtractionCache
+from compact_format import COMPACT_SUFFIX, write_compact
 import data_processor # Includes all processing functions
+from table import Column, Table
 
 # Configure logging (Set level as needed, DEBUG is useful)
 logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(filename)s:%(lineno)d - %(message)s')
@@ -47,6 +50,11 @@ FOB_CHUNK_SIZE = 2  # How many items per group (e.g., PO1\\PO2)
 FOB_INTRA_CHUNK_SEPARATOR = "/"  # Separator within a group (e.g., DOUBLE BACKSLASH)
 FOB_INTER_CHUNK_SEPARATOR = "\n"  # Separator between groups (e.g., newline)
 
+# --- Output formats ---
+OUTPUT_FORMAT_JSON = "json"        # <stem>.json, pretty-printed (default; editable, cacheable)
+OUTPUT_FORMAT_COMPACT = "compact"  # <stem>.json.gz, columnar + gzip (see compact_format.py)
+OUTPUT_FORMATS = (OUTPUT_FORMAT_JSON, OUTPUT_FORMAT_COMPACT)
+
 # Type alias for the two possible initial aggregation structures
 # UPDATED Type Alias to reflect new key structures
 InitialAggregationResults = Union[
@@ -345,12 +353,44 @@ def json_serializer_default(obj):
 # --- >>> END OF ADDED FUNCTION <<< ---
 
 
+# --- Aggregation map encoding ---
+# Aggregation maps are written as a versioned list of records with explicit fields
+# instead of repr'd tuple keys. Readers: invoice_gen/invoice_data_io.py (which also
+# still accepts the legacy repr-string keys).
+AGGREGATION_RECORDS_FORMAT = "aggregation_records"
+AGGREGATION_RECORDS_VERSION = 1
+
+
+def encode_aggregation_results(aggregation_map: Dict[Tuple[Any, Any, Any, Any], Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Encodes a (po, item, price, description) -> {'sqft_sum', 'amount_sum'} map as
+    {"format": "aggregation_records", "version": 1, "records": [{"po", "item", "price",
+    "description", "sqft_sum", "amount_sum"}, ...]}. Decimals are serialized as strings
+    by json_serializer_default.
+    """
+    records = []
+    for (po, item, price, description), sums in aggregation_map.items():
+        records.append({
+            "po": po,
+            "item": item,
+            "price": price,
+            "description": description,
+            "sqft_sum": sums.get('sqft_sum'),
+            "amount_sum": sums.get('amount_sum'),
+        })
+    return {"format": AGGREGATION_RECORDS_FORMAT, "version": AGGREGATION_RECORDS_VERSION, "records": records}
+
+
 # Helper function to make data JSON serializable
 # Handles tuple keys in aggregation results
 def make_json_serializable(data):
     """Recursively converts tuple keys in dicts to strings and handles non-serializable types."""
     # NOTE: Using the default serializer for json.dumps handles Decimal and datetime now.
     # This function primarily focuses on converting tuple keys.
+    if isinstance(data, Table):
+        data = data.to_dict()
+    elif isinstance(data, Column):
+        return make_json_serializable(data.to_list())
     if isinstance(data, dict):
         # Convert all keys to string, including tuple keys
         return {str(k): make_json_serializable(v) for k, v in data.items()}
@@ -362,16 +402,22 @@ def make_json_serializable(data):
     return data
 
 # <<< MODIFIED FUNCTION SIGNATURE >>>
-def run_invoice_automation(input_excel_override: Optional[str] = None, output_dir_override: Optional[str] = None):
+def run_invoice_automation(input_excel_override: Optional[str] = None, output_dir_override: Optional[str] = None, cache_dir: Optional[str] = None, output_format: str = OUTPUT_FORMAT_JSON) -> Optional[Dict[str, Any]]:
     """Main function to find tables, extract, and process data for each.
        Uses input_excel_override if provided, otherwise falls back to cfg.INPUT_EXCEL_FILE.
        Saves output JSON to output_dir_override if provided, otherwise uses CWD.
+       If cache_dir is given, a workbook already extracted under the same parser config
+       is served from the extraction cache instead of being re-parsed.
+       output_format selects '<stem>.json' ("json") or the compact '<stem>.json.gz' ("compact");
+       the extraction cache only applies to JSON output.
+       Returns the JSON structure that was written, or None if processing failed.
+       (On a cache hit this is the JSON as loaded from disk.)
     """
     # Start timing the entire process
     start_time = time.time()
     logging.info("--- Starting Invoice Automation ---")
+    written_json_structure: Optional[Dict[str, Any]] = None
     
-    handler = None
     actual_sheet_name = None
     input_filename = "Unknown"
     input_filepath = None
@@ -430,9 +476,32 @@ def run_invoice_automation(input_excel_override: Optional[str] = None, output_di
         logging.info(f"Using default output directory (CWD): {output_dir}")
     # --- End Determine Output Directory ---
 
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"Unknown output format '{output_format}'. Expected one of {OUTPUT_FORMATS}.")
+
+    # --- Extraction Cache Lookup ---
+    extraction_cache: Optional[ExtractionCache] = None
+    cache_key: Optional[str] = None
+    if cache_dir and output_format != OUTPUT_FORMAT_JSON:
+        logging.info(f"Extraction cache skipped: it stores JSON output only (output format '{output_format}').")
+    elif cache_dir:
+        try:
+            extraction_cache = ExtractionCache(cache_dir, cfg)
+            cache_key = extraction_cache.key_for(input_filepath)
+            cached_json = extraction_cache.restore(cache_key, output_dir / f"{Path(input_filename).stem}.json")
+            if cached_json is not None:
+                logging.info(f"Extraction cache hit for '{input_filename}' (key {cache_key[:12]}). Skipping extraction.")
+                logging.info(f"🕒 TOTAL PROCESSING TIME: {time.time() - start_time:.2f} seconds (cached)")
+                return cached_json
+            logging.info(f"Extraction cache miss for '{input_filename}' (key {cache_key[:12]}).")
+        except OSError as e:
+            logging.warning(f"Extraction cache unavailable at '{cache_dir}': {e}. Continuing without cache.")
+            extraction_cache = None
+    # --- End Extraction Cache Lookup ---
 
-    processed_tables: Dict[int, Dict[str, Any]] = {}
-    all_tables_data: Dict[int, Dict[str, List[Any]]] = {}
+
+    processed_tables: Dict[int, Table] = {}
+    all_tables_data: Dict[int, Table] = {}
 
     # Global dictionaries for initial aggregation results
     global_standard_aggregation_results: Dict[Tuple[Any, Any, Optional[decimal.Decimal], Optional[str]], Dict[str, decimal.Decimal]] = {}
@@ -473,16 +542,18 @@ def run_invoice_automation(input_excel_override: Optional[str] = None, output_di
 # --- Steps 1-4: Load, Find Headers, Map Columns, Extract Data (REFACTORED) ---
         # <<< USE THE DETERMINED input_filepath >>>
         logging.info(f"Loading workbook from: {input_filepath}")
-        handler = ExcelHandler(input_filepath)
-        sheet = handler.load_sheet(sheet_name=cfg.SHEET_NAME, data_only=True)
-        if sheet is None: raise RuntimeError(f"Failed to load sheet from '{input_filepath}'.")
-        actual_sheet_name = sheet.title
+        # Read the sheet once into a value grid; all parser steps below work from it.
+        # The backend (openpyxl via ExcelHandler, or the direct XML stream reader) is
+        # chosen from cfg.EXTRACTION_BACKEND and the sheet's estimated size.
+        grid = xlsx_stream_reader.load_sheet_grid(input_filepath, sheet_name=cfg.SHEET_NAME)
+        if grid is None: raise RuntimeError(f"Failed to load sheet from '{input_filepath}'.")
+        actual_sheet_name = grid.title
         logging.info(f"Successfully loaded worksheet: '{actual_sheet_name}' from '{input_filename}'")
 
         # 1. Make a single call to the new smart function.
         # It handles finding the correct row AND creating the validated map.
         logging.info("Searching for the primary header row using smart detection...")
-        smart_result = sheet_parser.find_and_map_smart_headers(sheet)
+        smart_result = sheet_parser.find_and_map_smart_headers(grid)
 
         # 2. Check if the smart function succeeded.
         if not smart_result:
@@ -496,10 +567,10 @@ def run_invoice_automation(input_excel_override: Optional[str] = None, output_di
         # 4. Now, find any ADDITIONAL tables that might appear LATER in the sheet.
         # We start the search *after* the header row we just found to avoid duplicates.
         additional_header_rows = sheet_parser.find_all_header_rows(
-            sheet=sheet,
+            sheet=grid,
             search_pattern=cfg.HEADER_IDENTIFICATION_PATTERN,
             # Start searching on the row right after the one we found.
-            row_range=(header_row + 1, sheet.max_row),
+            row_range=(header_row + 1, grid.max_row),
             col_range=(cfg.HEADER_SEARCH_COL_RANGE[0], cfg.HEADER_SEARCH_COL_RANGE[1])
         )
 
@@ -515,11 +586,14 @@ def run_invoice_automation(input_excel_override: Optional[str] = None, output_di
 
 
         logging.info("Extracting data for all tables...")
-        all_tables_data = sheet_parser.extract_multiple_tables(sheet, all_header_rows, column_mapping)
+        extracted_tables = sheet_parser.extract_multiple_tables(grid, all_header_rows, column_mapping)
         if logging.getLogger().getEffectiveLevel() <= logging.DEBUG:
-            log_str = pprint.pformat(all_tables_data)
+            log_str = pprint.pformat(extracted_tables)
             if len(log_str) > MAX_LOG_DICT_LEN: log_str = log_str[:MAX_LOG_DICT_LEN] + "\n... (output truncated)"
-            logging.debug(f"--- Raw Extracted Data ({len(all_tables_data)} Table(s)) ---\n{log_str}")
+            logging.debug(f"--- Raw Extracted Data ({len(extracted_tables)} Table(s)) ---\n{log_str}")
+        # Pack each table into typed columns once; the processing stages below update the Tables in place.
+        all_tables_data = {table_index: Table.from_dict(table_data) for table_index, table_data in extracted_tables.items()}
+        del extracted_tables
         if not all_tables_data: logging.warning("Extraction resulted in empty data structure.")
         # --- End Steps 1-4 ---
 
@@ -533,7 +607,7 @@ def run_invoice_automation(input_excel_override: Optional[str] = None, output_di
                 continue
 
             logging.info(f"--- Processing Table Index {table_index} ---")
-            if not isinstance(current_table_data, dict) or not current_table_data or not any(isinstance(v, list) and v for v in current_table_data.values()):
+            if not isinstance(current_table_data, Table) or not current_table_data or not any(len(column) for column in current_table_data.values()):
                 logging.warning(f"Table {table_index} empty or invalid. Skipping processing steps.")
                 processed_tables[table_index] = current_table_data # Store the raw data
                 continue
@@ -568,23 +642,17 @@ def run_invoice_automation(input_excel_override: Optional[str] = None, output_di
                  data_for_aggregation = processed_tables.get(table_index)
 
 
-            # 5c. Initial Aggregation (ALWAYS RUN BOTH Standard and Custom)
-            if isinstance(data_for_aggregation, dict) and data_for_aggregation:
-                 # Run Standard Aggregation
-                 try:
-                    logging.info(f"Table {table_index}: Updating global STANDARD aggregation...")
-                    data_processor.aggregate_standard_by_po_item_price(data_for_aggregation, global_standard_aggregation_results)
-                    logging.debug(f"Table {table_index}: STANDARD aggregation map updated. Size: {len(global_standard_aggregation_results)}")
-                 except Exception as agg_e_std:
-                    logging.error(f"Global STANDARD aggregation update failed for Table {table_index}: {agg_e_std}", exc_info=True)
-
-                 # Run Custom Aggregation
+            # 5c. Initial Aggregation (ALWAYS RUN BOTH Standard and Custom, in one pass over the table)
+            if isinstance(data_for_aggregation, Table) and data_for_aggregation:
                  try:
-                    logging.info(f"Table {table_index}: Updating global CUSTOM aggregation...")
-                    data_processor.aggregate_custom_by_po_item(data_for_aggregation, global_custom_aggregation_results)
-                    logging.debug(f"Table {table_index}: CUSTOM aggregation map updated. Size: {len(global_custom_aggregation_results)}")
-                 except Exception as agg_e_cust:
-                    logging.error(f"Global CUSTOM aggregation update failed for Table {table_index}: {agg_e_cust}", exc_info=True)
+                    logging.info(f"Table {table_index}: Updating global STANDARD and CUSTOM aggregation...")
+                    data_processor.aggregate_all_modes(data_for_aggregation, {
+                        'standard': global_standard_aggregation_results,
+                        'custom': global_custom_aggregation_results,
+                    })
+                    logging.debug(f"Table {table_index}: Aggregation maps updated. Sizes: STANDARD={len(global_standard_aggregation_results)}, CUSTOM={len(global_custom_aggregation_results)}")
+                 except Exception as agg_e:
+                    logging.error(f"Global aggregation update failed for Table {table_index}: {agg_e}", exc_info=True)
             else:
                  logging.warning(f"Table {table_index}: Skipping initial aggregation update (data for aggregation invalid/empty).")
 
@@ -660,7 +728,6 @@ def run_invoice_automation(input_excel_override: Optional[str] = None, output_di
         logging.info("--- Preparing Data for JSON Output ---")
         try:
             # Create the structure to be converted to JSON
-            # Use the helper function to ensure serializability
             final_json_structure = {
                  "metadata": {
                     "workbook_filename": input_filename, # Use the actual input filename
@@ -672,44 +739,62 @@ def run_invoice_automation(input_excel_override: Optional[str] = None, output_di
                     "timestamp": datetime.datetime.now() # Add generation timestamp
                 },
                  # Include processed table data (potentially large)
-                 "processed_tables_data": make_json_serializable(processed_tables),
+                 "processed_tables_data": processed_tables,
 
                 # Include BOTH aggregation results explicitly
-                "standard_aggregation_results": make_json_serializable(global_standard_aggregation_results),
-                "custom_aggregation_results": make_json_serializable(global_custom_aggregation_results),
+                "standard_aggregation_results": encode_aggregation_results(global_standard_aggregation_results),
+                "custom_aggregation_results": encode_aggregation_results(global_custom_aggregation_results),
 
                 # Include the final compounded result (derived from one of the above, based on mode)
-                "final_fob_compounded_result": make_json_serializable(global_fob_compounded_result)
+                "final_fob_compounded_result": global_fob_compounded_result
             }
+            input_stem = Path(input_filename).stem # Get filename without extension
 
-             # Convert the structure to a JSON string (pretty-printed)
-            json_output_string = json.dumps(final_json_structure,
-                                            indent=4,
-                                            default=json_serializer_default) # Use the default serializer
-
-            # Log the JSON output (or a preview if too large)
-            logging.info("--- Generated JSON Output ---")
-            max_log_json_len = 5000
-            if len(json_output_string) <= max_log_json_len:
-                logging.info(json_output_string)
+            if output_format == OUTPUT_FORMAT_COMPACT:
+                # Tables go to the writer as-is: typed columns are encoded straight from their arrays
+                output_data_path = output_dir / f"{input_stem}{COMPACT_SUFFIX}"
+                logging.info(f"Determined output compact data path: {output_data_path}")
+                try:
+                    write_compact(final_json_structure, output_data_path)
+                    logging.info(f"Successfully saved compact output to '{output_data_path}' ({output_data_path.stat().st_size} bytes)")
+                    written_json_structure = final_json_structure
+                except (IOError, OSError) as io_err:
+                    logging.error(f"Failed to write compact output to file '{output_data_path}': {io_err}")
             else:
-                logging.info(f"JSON output is large ({len(json_output_string)} chars). Logging preview:")
-                logging.info(json_output_string[:max_log_json_len] + "\n... (JSON output truncated in log)")
-
-            # --- MODIFIED: Save JSON using output_dir and simplified filename ---
-            input_stem = Path(input_filename).stem # Get filename without extension
-            json_output_filename = f"{input_stem}.json" # Simplified filename
-            output_json_path = output_dir / json_output_filename # Combine output dir and filename
-            logging.info(f"Determined output JSON path: {output_json_path}")
-            # --- END MODIFICATION ---
-            try:
-                with open(output_json_path, 'w', encoding='utf-8') as f_json:
-                     f_json.write(json_output_string)
-                logging.info(f"Successfully saved JSON output to '{output_json_path}'")
-            except IOError as io_err:
-                logging.error(f"Failed to write JSON output to file '{output_json_path}': {io_err}")
-            except Exception as write_err:
-                 logging.error(f"An unexpected error occurred while writing JSON file: {write_err}", exc_info=True)
+                # Use the helper function to ensure serializability
+                final_json_structure["processed_tables_data"] = make_json_serializable(processed_tables)
+                final_json_structure["final_fob_compounded_result"] = make_json_serializable(global_fob_compounded_result)
+
+                 # Convert the structure to a JSON string (pretty-printed)
+                json_output_string = json.dumps(final_json_structure,
+                                                indent=4,
+                                                default=json_serializer_default) # Use the default serializer
+
+                # Log the JSON output (or a preview if too large)
+                logging.info("--- Generated JSON Output ---")
+                max_log_json_len = 5000
+                if len(json_output_string) <= max_log_json_len:
+                    logging.info(json_output_string)
+                else:
+                    logging.info(f"JSON output is large ({len(json_output_string)} chars). Logging preview:")
+                    logging.info(json_output_string[:max_log_json_len] + "\n... (JSON output truncated in log)")
+
+                # --- MODIFIED: Save JSON using output_dir and simplified filename ---
+                json_output_filename = f"{input_stem}.json" # Simplified filename
+                output_json_path = output_dir / json_output_filename # Combine output dir and filename
+                logging.info(f"Determined output JSON path: {output_json_path}")
+                # --- END MODIFICATION ---
+                try:
+                    with open(output_json_path, 'w', encoding='utf-8') as f_json:
+                         f_json.write(json_output_string)
+                    logging.info(f"Successfully saved JSON output to '{output_json_path}'")
+                    written_json_structure = final_json_structure
+                    if extraction_cache is not None and cache_key is not None:
+                        extraction_cache.store(cache_key, output_json_path)
+                except IOError as io_err:
+                    logging.error(f"Failed to write JSON output to file '{output_json_path}': {io_err}")
+                except Exception as write_err:
+                     logging.error(f"An unexpected error occurred while writing JSON file: {write_err}", exc_info=True)
 
         except TypeError as json_err:
             logging.error(f"Failed to serialize data to JSON: {json_err}. Check data types and default handler.", exc_info=True)
@@ -737,10 +822,10 @@ def run_invoice_automation(input_excel_override: Optional[str] = None, output_di
         logging.error(f"An unexpected error occurred in the main script execution: {e}", exc_info=True)
         logging.info(f"🕒 Processing failed after {total_time:.2f} seconds")
     finally:
-        if handler:
-            handler.close()
         logging.info("--- Automation Run Complete ---")
 
+    return written_json_structure
+
 
 if __name__ == "__main__":
     # --- Argument Parsing ---
@@ -759,6 +844,18 @@ if __name__ == "__main__":
         help="Directory to save the output JSON file. Defaults to the current working directory."
     )
     # --- END ADD ---
+    parser.add_argument(
+        "--cache-dir",
+        type=str,
+        default=None, # Default to None, indicating no extraction cache
+        help="Directory of the extraction cache. Unchanged workbooks are served from it without re-parsing."
+    )
+    parser.add_argument(
+        "--output-format",
+        choices=OUTPUT_FORMATS,
+        default=OUTPUT_FORMAT_JSON,
+        help="'json' writes <name>.json (default); 'compact' writes the gzip columnar <name>.json.gz."
+    )
     args = parser.parse_args()
     # --- End Argument Parsing ---
 
@@ -766,7 +863,9 @@ if __name__ == "__main__":
     # Pass the parsed arguments to the main function
     run_invoice_automation(
         input_excel_override=args.input_excel,
-        output_dir_override=args.output_dir # Pass the output dir argument
+        output_dir_override=args.output_dir, # Pass the output dir argument
+        cache_dir=args.cache_dir,
+        output_format=args.output_format
     )
     # --- End Run Logic ---
 
@@ -4,12 +4,14 @@ import re
 import logging
 from typing import Dict, List, Optional, Tuple, Any, Union
 from openpyxl.worksheet.worksheet import Worksheet
-from openpyxl.utils import get_column_letter
+from openpyxl.utils import column_index_from_string
 from decimal import Decimal, InvalidOperation
 
-# Import config values, now including the new pattern-matching configs
+from excel_handler import SheetGrid
+from header_matcher import HeaderMatcher, get_default_matcher
+
+# Import config values. Header alias/pattern configs are consumed by header_matcher.HeaderMatcher.
 from config import (
-    TARGET_HEADERS_MAP,
     HEADER_SEARCH_ROW_RANGE,
     HEADER_SEARCH_COL_RANGE,
     HEADER_IDENTIFICATION_PATTERN,
@@ -17,173 +19,46 @@ from config import (
     MAX_DATA_ROWS_TO_SCAN,
     DISTRIBUTION_BASIS_COLUMN,
     COLUMNS_TO_DISTRIBUTE,
-    # --- Dependencies for the new smart function ---
-    EXPECTED_HEADER_DATA_TYPES,
-    EXPECTED_HEADER_PATTERNS,
-    HEADERLESS_COLUMN_PATTERNS,
-    EXPECTED_HEADER_VALUES,
 )
 
 
-# --- NEW: Helper functions for smart validation ---
-
-def _is_numeric(value: Any) -> bool:
-    """Helper to check if a value is a number."""
-    if value is None:
-        return False
-    return isinstance(value, (int, float, Decimal))
-
-def _is_string_like(value: Any) -> bool:
-    """Helper to check if a value is a non-empty string or a number."""
-    if value is None:
-        return False
-    if isinstance(value, str) and value.strip():
-        return True
-    if _is_numeric(value):
-        return True
-    return False
+# --- Grid access helpers ---
 
-def _matches_any_pattern(value: Any, patterns: Union[str, List[str]]) -> bool:
+def _as_grid(sheet: Union[Worksheet, SheetGrid]) -> SheetGrid:
     """
-    Helper to check if a value's string representation matches ANY of the regex patterns in a list.
+    Returns a SheetGrid for the given sheet. Callers should pass the grid from
+    ExcelHandler.get_grid(); a raw Worksheet is still accepted and snapshotted here.
     """
-    # Convert value to a stripped string for reliable matching. Handles numbers, None, etc.
-    value_str = str(value or '').strip()
-    if not value_str:
-        return False
-
-    # Ensure patterns is always a list for iteration
-    if isinstance(patterns, str):
-        patterns_list = [patterns]
-    else:
-        patterns_list = patterns
-
-    # Check against each pattern in the list
-    for pattern in patterns_list:
-        try:
-            if re.match(pattern, value_str):
-                # If any pattern matches, we return True immediately
-                return True
-        except re.error as e:
-            logging.error(f"[Pattern Check] Invalid regex pattern provided in config '{pattern}': {e}")
-            continue # Try the next pattern
-            
-    # If no patterns matched after checking all of them
-    return False
+    if isinstance(sheet, SheetGrid):
+        return sheet
+    logging.debug("[_as_grid] Received a Worksheet instead of a SheetGrid. Building a value snapshot.")
+    return SheetGrid.from_worksheet(sheet)
+
+def _cell_at(row_values: Tuple[Any, ...], col_num: int) -> Any:
+    """Returns the value at a 1-indexed column of a grid row, or None if the row is shorter."""
+    return row_values[col_num - 1] if col_num <= len(row_values) else None
 
 
 # --- THE NEW SMART HEADER DETECTION FUNCTION ---
-def find_and_map_smart_headers(sheet: Worksheet) -> Optional[Tuple[int, Dict[str, str]]]:
+def find_and_map_smart_headers(sheet: Union[Worksheet, SheetGrid], matcher: Optional[HeaderMatcher] = None) -> Optional[Tuple[int, Dict[str, str]]]:
     """
     Finds and maps headers using a scoring system. It now evaluates all rows
     in the search range and selects the one with the highest cumulative score,
     making it robust against stray keywords outside the main table.
+    Reads cell values from a SheetGrid snapshot (see ExcelHandler.get_grid) and
+    scores them with a prebuilt HeaderMatcher (defaults to the one built from config.py).
     """
-    prefix = "[find_and_map_smart_headers_v12]" # Version increment
+    prefix = "[find_and_map_smart_headers_v13]" # Version increment
     logging.info(f"{prefix} Starting best-fit header search...")
+    grid = _as_grid(sheet)
+    matcher = matcher or get_default_matcher()
 
-    best_result: Optional[Tuple[int, Dict[str, str]]] = None
-    highest_row_score = 0
-
-    for row_num in range(HEADER_SEARCH_ROW_RANGE[0], HEADER_SEARCH_ROW_RANGE[1] + 1):
-        if row_num + 1 > sheet.max_row: continue
-
-        all_column_candidates: Dict[int, List[Dict]] = {}
-        for col_num in range(HEADER_SEARCH_COL_RANGE[0], HEADER_SEARCH_COL_RANGE[1] + 1):
-            header_cell = sheet.cell(row=row_num, column=col_num)
-            header_value = str(header_cell.value or '').strip().upper()
-
-            if header_value:
-                candidate_canonicals = [
-                    canonical for canonical, aliases in TARGET_HEADERS_MAP.items()
-                    if header_value in [str(a).upper() for a in aliases]
-                ]
-                if not candidate_canonicals: continue
-
-                col_scores = []
-                for canonical_name in candidate_canonicals:
-                    data_cell = sheet.cell(row=row_num + 1, column=col_num)
-                    data_value = data_cell.value
-                    score = 0
-                    used_strict_value_check = False
-
-                    # --- START: MODIFIED SCORING LOGIC ---
-                    allowed_values = EXPECTED_HEADER_VALUES.get(canonical_name)
-                    if allowed_values is not None:
-                        used_strict_value_check = True
-                        processed_data_value = int(data_value) if isinstance(data_value, str) and data_value.isdigit() else data_value
-                        if processed_data_value in allowed_values:
-                            score = 25 # Increased score for specific value matches
-                    
-                    if not used_strict_value_check:
-                        patterns_to_check = EXPECTED_HEADER_PATTERNS.get(canonical_name)
-                        if patterns_to_check:
-                            if _matches_any_pattern(data_value, patterns_to_check):
-                                score = 15 # Increased score for pattern matches
-                        else:
-                            allowed_types = EXPECTED_HEADER_DATA_TYPES.get(canonical_name, [])
-                            if ('numeric' in allowed_types and _is_numeric(data_value)) or \
-                               ('string' in allowed_types and _is_string_like(data_value)):
-                                score = 5 # Kept as the baseline score
-                    # --- END: MODIFIED SCORING LOGIC ---
-                    
-                    if score == 0:
-                        # --- NEW MERCY RULE ---
-                        # If all other checks fail but we did find a header match for a column
-                        # that is allowed to be a string, give it a minimal score.
-                        # This handles cases where the cell below the header is empty (None).
-                        allowed_types = EXPECTED_HEADER_DATA_TYPES.get(canonical_name, [])
-                        if 'string' in allowed_types:
-                            score = 1 # A minimal "mercy" score to prevent it from being ignored
-
-                    if score > 0:
-                        col_scores.append({'score': score, 'name': canonical_name})
-                
-                if col_scores:
-                    all_column_candidates[col_num] = col_scores
-            else:
-                data_cell = sheet.cell(row=row_num + 1, column=col_num)
-                data_value = data_cell.value
-                for canonical_name, patterns in HEADERLESS_COLUMN_PATTERNS.items():
-                    if _matches_any_pattern(data_value, patterns):
-                        all_column_candidates[col_num] = [{'score': 4, 'name': canonical_name}]
-                        break
-
-        potential_mapping: Dict[str, str] = {}
-        current_row_score = 0
-        processed_canonicals = set()
-        
-        unit_amt_tie_cols = [
-            col for col, candidates in all_column_candidates.items()
-            if {c['name'] for c in candidates} == {'unit', 'amount'} and all(c['score'] == 5 for c in candidates)
-        ]
-        if len(unit_amt_tie_cols) == 2:
-            col1, col2 = sorted(unit_amt_tie_cols)
-            potential_mapping['unit'] = get_column_letter(col1)
-            potential_mapping['amount'] = get_column_letter(col2)
-            processed_canonicals.update(['unit', 'amount'])
-            current_row_score += 10
-            del all_column_candidates[col1], all_column_candidates[col2]
-        
-        for col_num, candidates in sorted(all_column_candidates.items()):
-            valid_candidates = [c for c in candidates if c['name'] not in processed_canonicals]
-            if not valid_candidates: continue
-            best_candidate = sorted(valid_candidates, key=lambda x: x['score'], reverse=True)[0]
-            potential_mapping[best_candidate['name']] = get_column_letter(col_num)
-            processed_canonicals.add(best_candidate['name'])
-            current_row_score += best_candidate['score']
-
-        # --- NEW LOGGING LINE FOR DIAGNOSTICS ---
-        logging.info(f"{prefix} Evaluated Row {row_num} | Score: {current_row_score} | Mapping: {potential_mapping}")
-
-        if len(potential_mapping) >= 3 and current_row_score > highest_row_score:
-            highest_row_score = current_row_score
-            best_result = (row_num, potential_mapping)
-            logging.info(f"{prefix} Found new best candidate row at {row_num} with score {highest_row_score}.")
+    best_result = matcher.find_best_header_row(grid, HEADER_SEARCH_ROW_RANGE, HEADER_SEARCH_COL_RANGE)
 
     if best_result:
-        logging.info(f"{prefix} SUCCESS: Confirmed header row at {best_result[0]} with final score {highest_row_score}.")
-        return best_result
+        header_row, column_mapping, highest_row_score = best_result
+        logging.info(f"{prefix} SUCCESS: Confirmed header row at {header_row} with final score {highest_row_score}.")
+        return header_row, column_mapping
 
     logging.error(f"{prefix} FAILED: Could not find any row that passed smart validation.")
     return None
@@ -196,7 +71,7 @@ def map_columns_to_headers(sheet, header_row: int, col_range: int) -> Dict[str,
     pass
 
 
-def extract_multiple_tables(sheet, header_rows: List[int], column_mapping: Dict[str, str]) -> Dict[int, Dict[str, List[Any]]]:
+def extract_multiple_tables(sheet: Union[Worksheet, SheetGrid], header_rows: List[int], column_mapping: Dict[str, str]) -> Dict[int, Dict[str, List[Any]]]:
     """
     Extracts data for multiple tables defined by header_rows using the validated column_mapping.
     """
@@ -204,8 +79,13 @@ def extract_multiple_tables(sheet, header_rows: List[int], column_mapping: Dict[
         logging.warning("[extract_multiple_tables] No header rows or column mapping provided.")
         return {}
 
+    grid = _as_grid(sheet)
     all_tables_data: Dict[int, Dict[str, List[Any]]] = {}
     stop_col_letter = column_mapping.get(STOP_EXTRACTION_ON_EMPTY_COLUMN)
+    stop_col_idx = column_index_from_string(stop_col_letter) if stop_col_letter else None
+    # Resolve column letters once; the same letter mapped twice keeps the last canonical name.
+    col_letter_to_canonical = {v: k for k, v in column_mapping.items()}
+    col_idx_to_canonical = [(column_index_from_string(letter), name) for letter, name in col_letter_to_canonical.items()]
     prefix = "[extract_multiple_tables]"
 
     logging.info(f"{prefix} Starting extraction for {len(header_rows)} tables: {header_rows}")
@@ -217,7 +97,7 @@ def extract_multiple_tables(sheet, header_rows: List[int], column_mapping: Dict[
         if i + 1 < len(header_rows):
             max_possible_end_row = header_rows[i + 1]
         else:
-            max_possible_end_row = sheet.max_row + 1
+            max_possible_end_row = grid.max_row + 1
             
         scan_limit_row = start_data_row + MAX_DATA_ROWS_TO_SCAN
         end_data_row = min(max_possible_end_row, scan_limit_row)
@@ -230,15 +110,15 @@ def extract_multiple_tables(sheet, header_rows: List[int], column_mapping: Dict[
         current_table_data: Dict[str, List[Any]] = {key: [] for key in column_mapping.keys()}
         
         for current_row in range(start_data_row, end_data_row):
-            if stop_col_letter:
-                stop_cell_value = sheet[f"{stop_col_letter}{current_row}"].value
-                if stop_cell_value is None or (isinstance(stop_cell_value, str) and not stop_cell_value.strip()):
+            row_values = grid.row(current_row)
+            if stop_col_idx:
+                stop_cell_value = _cell_at(row_values, stop_col_idx)
+                if _is_blank(stop_cell_value):
                     logging.info(f"{prefix} Stopping extraction for Table {table_index} at row {current_row}: Empty cell in stop column '{STOP_EXTRACTION_ON_EMPTY_COLUMN}'.")
                     break
 
-            col_letter_to_canonical = {v: k for k, v in column_mapping.items()}
-            for col_letter, canonical_name in col_letter_to_canonical.items():
-                cell_value = sheet[f"{col_letter}{current_row}"].value
+            for col_idx, canonical_name in col_idx_to_canonical:
+                cell_value = _cell_at(row_values, col_idx)
                 processed_value = cell_value.strip() if isinstance(cell_value, str) else cell_value
                 current_table_data[canonical_name].append(processed_value)
 
@@ -248,17 +128,136 @@ def extract_multiple_tables(sheet, header_rows: List[int], column_mapping: Dict[
     return all_tables_data
 
 
-def find_all_header_rows(sheet, search_pattern, row_range, col_range, start_after_row: int = 0) -> List[int]:
+# (header_row, column_mapping, (first_data_row, end_data_row_exclusive))
+TableSegment = Tuple[int, Dict[str, str], Tuple[int, int]]
+
+
+def _is_blank(value: Any) -> bool:
+    """True for None or whitespace-only strings (the extraction stop condition)."""
+    return value is None or (isinstance(value, str) and not value.strip())
+
+
+def segment_tables(
+    sheet: Union[Worksheet, SheetGrid],
+    row_range: Optional[Tuple[int, int]] = None,
+    col_range: Optional[Tuple[int, int]] = None,
+    matcher: Optional[HeaderMatcher] = None,
+) -> List[TableSegment]:
+    """
+    Splits a sheet into consecutive tables in a single pass over its rows.
+
+    Every candidate row is scored once with the HeaderMatcher. Tables are then
+    picked the same way the old Second_Layer search loop did (best-scoring header
+    at or after the previous table's end, earliest row on ties, at least three
+    mapped columns), but using a precomputed suffix-best index instead of
+    re-scoring the rest of the sheet for every table. Data ranges end at the first
+    blank cell in STOP_EXTRACTION_ON_EMPTY_COLUMN of the first table's mapping,
+    which is the mapping used to extract every table.
+
+    Returns:
+        A list of (header_row, mapping, (first_data_row, end_data_row_exclusive)).
+    """
+    prefix = "[segment_tables]"
+    grid = _as_grid(sheet)
+    matcher = matcher or get_default_matcher()
+    first_row = max(1, row_range[0]) if row_range else 1
+    last_row = min(row_range[1], grid.max_row) if row_range else grid.max_row
+    col_range = col_range or HEADER_SEARCH_COL_RANGE
+
+    # Pass 1: score each row once. Only rows with a data row below can be headers.
+    num_rows = max(0, last_row - first_row + 1)
+    row_scores: List[int] = [0] * num_rows
+    row_mappings: List[Optional[Dict[str, str]]] = [None] * num_rows
+    for offset in range(num_rows):
+        row_num = first_row + offset
+        if row_num + 1 > grid.max_row: continue
+        score, mapping = matcher.evaluate_row(grid.row(row_num), grid.row(row_num + 1), col_range)
+        if len(mapping) >= 3 and score > 0:
+            row_scores[offset], row_mappings[offset] = score, mapping
+
+    # Suffix index: best qualifying row at or after each offset (earliest wins ties).
+    suffix_best: List[int] = [-1] * (num_rows + 1)
+    for offset in range(num_rows - 1, -1, -1):
+        following = suffix_best[offset + 1]
+        if row_mappings[offset] is not None and (following < 0 or row_scores[offset] >= row_scores[following]):
+            suffix_best[offset] = offset
+        else:
+            suffix_best[offset] = following
+
+    # Pass 2: walk forward, jumping past each table's data rows.
+    segments: List[TableSegment] = []
+    stop_col_idx: Optional[int] = None
+    offset = 0
+    while offset < num_rows:
+        best = suffix_best[offset]
+        if best < 0: break
+        header_row, mapping = first_row + best, row_mappings[best]
+        if not segments:
+            stop_col_letter = mapping.get(STOP_EXTRACTION_ON_EMPTY_COLUMN)
+            stop_col_idx = column_index_from_string(stop_col_letter) if stop_col_letter else None
+
+        start_data_row = header_row + 1
+        end_data_row = min(grid.max_row + 1, start_data_row + MAX_DATA_ROWS_TO_SCAN)
+        rows_in_table = 0
+        if stop_col_idx:
+            for current_row in range(start_data_row, end_data_row):
+                if _is_blank(_cell_at(grid.row(current_row), stop_col_idx)):
+                    end_data_row = current_row
+                    break
+            rows_in_table = max(0, end_data_row - start_data_row)
+
+        segments.append((header_row, mapping, (start_data_row, end_data_row)))
+        logging.info(f"{prefix} Table {len(segments)}: header row {header_row} (score {row_scores[best]}), data rows {start_data_row}-{end_data_row - 1}")
+        offset = header_row + rows_in_table + 1 - first_row
+
+    logging.info(f"{prefix} Found {len(segments)} table(s) in {num_rows} scanned rows.")
+    return segments
+
+
+def extract_segments(sheet: Union[Worksheet, SheetGrid], segments: List[TableSegment], column_mapping: Optional[Dict[str, str]] = None) -> Dict[int, Dict[str, List[Any]]]:
+    """
+    Extracts the data ranges produced by segment_tables().
+
+    Args:
+        segments: Output of segment_tables().
+        column_mapping: Mapping applied to every table. Defaults to the first segment's mapping.
+
+    Returns:
+        {table_index (1-based): {canonical_name: [values...]}}
+    """
+    if not segments:
+        logging.warning("[extract_segments] No table segments provided.")
+        return {}
+    grid = _as_grid(sheet)
+    column_mapping = column_mapping or segments[0][1]
+    col_letter_to_canonical = {v: k for k, v in column_mapping.items()}
+    col_idx_to_canonical = [(column_index_from_string(letter), name) for letter, name in col_letter_to_canonical.items()]
+
+    all_tables_data: Dict[int, Dict[str, List[Any]]] = {}
+    for table_index, (_, _, (start_data_row, end_data_row)) in enumerate(segments, start=1):
+        current_table_data: Dict[str, List[Any]] = {key: [] for key in column_mapping.keys()}
+        for current_row in range(start_data_row, end_data_row):
+            row_values = grid.row(current_row)
+            for col_idx, canonical_name in col_idx_to_canonical:
+                cell_value = _cell_at(row_values, col_idx)
+                current_table_data[canonical_name].append(cell_value.strip() if isinstance(cell_value, str) else cell_value)
+        all_tables_data[table_index] = current_table_data
+        logging.info(f"[extract_segments] Stored {end_data_row - start_data_row} rows for Table Index {table_index}.")
+    return all_tables_data
+
+
+def find_all_header_rows(sheet: Union[Worksheet, SheetGrid], search_pattern, row_range, col_range, start_after_row: int = 0) -> List[int]:
     """
     Finds all 1-indexed row numbers containing a header based on a pattern,
     optionally starting the search after a specific row.
     """
     found_rows: set[int] = set()
     try:
+        grid = _as_grid(sheet)
         regex = re.compile(search_pattern, re.IGNORECASE)
         start_row = max(row_range[0], start_after_row + 1)
-        max_row_to_search = min(row_range[1], sheet.max_row)
-        max_col_to_search = min(col_range[1], sheet.max_column)
+        max_row_to_search = min(row_range[1], grid.max_row)
+        max_col_to_search = min(col_range[1], grid.max_column)
 
         if start_row > max_row_to_search:
              return []
@@ -269,10 +268,10 @@ def find_all_header_rows(sheet, search_pattern, row_range, col_range, start_afte
         )
 
         for r_idx in range(start_row, max_row_to_search + 1):
-            for c_idx in range(col_range[0], max_col_to_search + 1):
-                cell = sheet.cell(row=r_idx, column=c_idx)
-                if cell.value is not None:
-                    cell_value_str = str(cell.value).strip()
+            row_values = grid.row(r_idx)
+            for cell_value in row_values[col_range[0] - 1:max_col_to_search]:
+                if cell_value is not None:
+                    cell_value_str = str(cell_value).strip()
                     if regex.search(cell_value_str):
                         found_rows.add(r_idx)
                         break
@@ -0,0 +1,257 @@
+# --- START OF FULL FILE: table.py ---
+
+import sys
+import decimal
+from array import array
+from collections.abc import MutableMapping
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+# Decimal coefficients are stored in int64; this bounds their digit count.
+_MAX_DECIMAL_DIGITS = 18
+
+
+class Column:
+    """
+    Base class for a typed table column. Columns are sequences (len, index,
+    slice, iterate) and are replaced wholesale through Table.__setitem__
+    rather than mutated row by row.
+    """
+    __slots__ = ()
+    kind = 'object'
+
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+    def _get(self, index: int) -> Any:
+        raise NotImplementedError
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._get(i) for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("column index out of range")
+        return self._get(index)
+
+    def __iter__(self) -> Iterator[Any]:
+        for i in range(len(self)):
+            yield self._get(i)
+
+    def to_list(self) -> List[Any]:
+        """Returns the column as a plain list of Python values (the JSON shape)."""
+        return list(self)
+
+    def to_decimals(self) -> List[Optional[decimal.Decimal]]:
+        """Returns the values as Optional[Decimal] (numeric columns only)."""
+        raise TypeError(f"{type(self).__name__} does not hold numeric values")
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, (Column, list)):
+            return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.to_list()!r})"
+
+
+class ObjectColumn(Column):
+    """Fallback column for mixed or unsupported value types."""
+    __slots__ = ('values',)
+
+    def __init__(self, values: List[Any]):
+        self.values = values
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def _get(self, index: int) -> Any:
+        return self.values[index]
+
+    def __iter__(self) -> Iterator[Any]:
+        return iter(self.values)
+
+    def to_list(self) -> List[Any]:
+        return list(self.values)
+
+
+class StringColumn(Column):
+    """Strings (and None), interned so repeated PO/item/description values share one object."""
+    __slots__ = ('values',)
+    kind = 'string'
+
+    def __init__(self, values: Iterable[Optional[str]]):
+        self.values = [sys.intern(v) if v is not None else None for v in values]
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def _get(self, index: int) -> Optional[str]:
+        return self.values[index]
+
+    def __iter__(self) -> Iterator[Optional[str]]:
+        return iter(self.values)
+
+    def to_list(self) -> List[Optional[str]]:
+        return list(self.values)
+
+
+class _NumericColumn(Column):
+    """int64/float64 values in an array, with a bytearray marking missing (None) rows."""
+    __slots__ = ('values', 'missing')
+    typecode = ''
+
+    def __init__(self, values: Iterable[Any]):
+        values = list(values)
+        self.missing = bytearray(v is None for v in values) if None in values else None
+        self.values = array(self.typecode, (0 if v is None else v for v in values))
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def _get(self, index: int) -> Any:
+        if self.missing is not None and self.missing[index]:
+            return None
+        return self.values[index]
+
+    def __iter__(self) -> Iterator[Any]:
+        if self.missing is None:
+            return iter(self.values)
+        return (None if is_missing else value for value, is_missing in zip(self.values, self.missing))
+
+    def to_list(self) -> List[Any]:
+        return self.values.tolist() if self.missing is None else list(self)
+
+
+class IntColumn(_NumericColumn):
+    __slots__ = ()
+    kind = 'int'
+    typecode = 'q'
+
+    def to_decimals(self) -> List[Optional[decimal.Decimal]]:
+        return [None if v is None else decimal.Decimal(v) for v in self]
+
+
+class FloatColumn(_NumericColumn):
+    __slots__ = ()
+    kind = 'float'
+    typecode = 'd'
+
+    def to_decimals(self) -> List[Optional[decimal.Decimal]]:
+        # Via str() to match _convert_to_decimal (Decimal('1.1'), not the binary expansion)
+        return [None if v is None else decimal.Decimal(str(v)) for v in self]
+
+
+class DecimalColumn(Column):
+    """
+    Finite Decimals stored as int64 coefficients plus int8 exponents, so each
+    value round-trips exactly (including its exponent, e.g. 1.5000 vs 1.5).
+    """
+    __slots__ = ('coefficients', 'exponents', 'missing')
+    kind = 'decimal'
+
+    def __init__(self, values: Iterable[Optional[decimal.Decimal]]):
+        values = list(values)
+        coefficients = array('q')
+        exponents = array('b')
+        for value in values:
+            if value is None:
+                coefficients.append(0)
+                exponents.append(0)
+                continue
+            sign, digits, exponent = value.as_tuple()
+            if not isinstance(exponent, int) or len(digits) > _MAX_DECIMAL_DIGITS or not -128 <= exponent <= 127 or (sign and not any(digits)):
+                raise ValueError(f"Decimal {value!r} cannot be stored in a DecimalColumn")
+            coefficient = int(value.scaleb(-exponent))
+            coefficients.append(coefficient)
+            exponents.append(exponent)
+        self.coefficients = coefficients
+        self.exponents = exponents
+        self.missing = bytearray(v is None for v in values) if None in values else None
+
+    def __len__(self) -> int:
+        return len(self.coefficients)
+
+    def _get(self, index: int) -> Optional[decimal.Decimal]:
+        if self.missing is not None and self.missing[index]:
+            return None
+        return decimal.Decimal(self.coefficients[index]).scaleb(self.exponents[index])
+
+    def to_decimals(self) -> List[Optional[decimal.Decimal]]:
+        return list(self)
+
+
+def pack_column(values: Iterable[Any]) -> Column:
+    """
+    Picks the most compact column type for values (sniffed once, here):
+    int -> IntColumn, float -> FloatColumn, Decimal -> DecimalColumn, str -> StringColumn,
+    anything mixed or unsupported -> ObjectColumn. None is allowed in every type.
+    """
+    if isinstance(values, Column):
+        return values
+    values = list(values)
+    kinds = {type(v) for v in values if v is not None}
+    try:
+        if kinds == {int}:
+            return IntColumn(values)
+        if kinds == {float}:
+            return FloatColumn(values)
+        if kinds == {decimal.Decimal}:
+            return DecimalColumn(values)
+    except (OverflowError, ValueError):
+        return ObjectColumn(values)
+    if kinds == {str}:
+        return StringColumn(values)
+    return ObjectColumn(values)
+
+
+class Table(MutableMapping):
+    """
+    Columnar container for one extracted table: canonical column name -> typed Column.
+
+    Behaves like the Dict[str, List[Any]] it replaces (get, in, keys, items,
+    assignment), so processing stages update it in place; assigned lists are
+    packed into typed columns. to_dict() gives back the plain JSON shape.
+    """
+    __slots__ = ('_columns',)
+
+    def __init__(self, columns: Optional[Dict[str, Iterable[Any]]] = None):
+        self._columns: Dict[str, Column] = {}
+        for name, values in (columns or {}).items():
+            self[name] = values
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, List[Any]]) -> 'Table':
+        """Builds a Table from the Dict[str, List[Any]] produced by sheet_parser."""
+        return cls(data)
+
+    def __getitem__(self, name: str) -> Column:
+        return self._columns[name]
+
+    def __setitem__(self, name: str, values: Iterable[Any]):
+        self._columns[name] = pack_column(values)
+
+    def __delitem__(self, name: str):
+        del self._columns[name]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._columns)
+
+    def __len__(self) -> int:
+        return len(self._columns)
+
+    @property
+    def num_rows(self) -> int:
+        return max((len(column) for column in self._columns.values()), default=0)
+
+    def to_dict(self) -> Dict[str, List[Any]]:
+        """Returns {column name: list of values}, identical to the pre-Table structure."""
+        return {name: column.to_list() for name, column in self._columns.items()}
+
+    def __repr__(self) -> str:
+        kinds = ', '.join(f"{name}:{column.kind}" for name, column in self._columns.items())
+        return f"Table({self.num_rows} rows; {kinds})"
+
+# --- END OF FULL FILE: table.py ---
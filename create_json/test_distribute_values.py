@@ -0,0 +1,114 @@
+"""
+Parity tests: the NumPy fixed-point distribution must reproduce the Decimal
+reference implementation exactly (value, exponent and sign of zero).
+
+Run from create_json/:  python -m pytest -q test_distribute_values.py
+"""
+
+import decimal
+import random
+from decimal import Decimal
+
+import pytest
+
+import data_processor
+from data_processor import (
+    CBM_DECIMAL_PLACES,
+    DEFAULT_DIST_PRECISION,
+    _distribute_column_decimal,
+    _distribute_column_fixed_point,
+    distribute_values,
+)
+
+pytestmark = pytest.mark.skipif(data_processor.np is None, reason="NumPy is not installed")
+
+
+def _assert_identical(actual, expected):
+    assert len(actual) == len(expected)
+    for row, (a, e) in enumerate(zip(actual, expected)):
+        assert a == e and str(a) == str(e), f"row {row}: fixed-point {a!r} != decimal {e!r}"
+
+
+def _check_parity(values, basis, col_name="net"):
+    precision = CBM_DECIMAL_PLACES if col_name == "cbm" else DEFAULT_DIST_PRECISION
+    fixed = _distribute_column_fixed_point(col_name, list(values), list(basis), precision)
+    assert fixed is not None, "inputs unexpectedly fell back to the Decimal path"
+    _assert_identical(fixed, _distribute_column_decimal(col_name, list(values), list(basis)))
+
+
+def _random_decimal(rng, places, upper):
+    return Decimal(rng.randint(-upper // 10, upper)).scaleb(-places)
+
+
+@pytest.mark.parametrize("seed", range(200))
+def test_random_columns_match_decimal_reference(seed):
+    rng = random.Random(seed)
+    num_rows = rng.randint(1, 60)
+    value_places = rng.choice([0, 1, 2, 3, 4, 6])
+    values = []
+    for _ in range(num_rows):
+        roll = rng.random()
+        if roll < 0.45:
+            values.append(None)
+        elif roll < 0.55:
+            values.append(Decimal(0))
+        else:
+            values.append(_random_decimal(rng, value_places, 100000))
+    basis = []
+    for _ in range(num_rows):
+        roll = rng.random()
+        if roll < 0.08:
+            basis.append(None)
+        elif roll < 0.15:
+            basis.append(Decimal(rng.choice([0, -1, -5])))
+        else:
+            basis.append(Decimal(rng.randint(1, 500)).scaleb(-rng.choice([0, 0, 1, 2])))
+    _check_parity(values, basis, col_name=rng.choice(["net", "gross", "cbm"]))
+
+
+@pytest.mark.parametrize("values, basis", [
+    # Exact ROUND_HALF_UP ties, positive and negative
+    ([Decimal("0.0003"), None], [Decimal(1), Decimal(1)]),
+    ([Decimal("-0.0003"), None], [Decimal(1), Decimal(1)]),
+    ([Decimal("0.00045"), None, None], [Decimal(1), Decimal(1), Decimal(1)]),
+    ([Decimal("1"), None, None], [Decimal(1), Decimal(1), Decimal(1)]),
+    # Shares that round to zero keep the sign of the distributed value
+    ([Decimal("-0.0001"), None, None, None], [Decimal(1)] * 4),
+    # Start row without positive basis keeps its original value
+    ([Decimal("10"), None, None], [None, Decimal(2), Decimal(3)]),
+    ([Decimal("10"), None, None], [Decimal(0), Decimal(2), Decimal(3)]),
+    # No positive basis anywhere in the block
+    ([Decimal("7.5"), Decimal(0), None], [Decimal(0), None, Decimal(-2)]),
+    # Values before the first non-zero value and single-row blocks
+    ([None, Decimal(0), Decimal("3.25"), Decimal("4.5"), None], [Decimal(1)] * 5),
+    ([None, None, None], [Decimal(1)] * 3),
+    ([], []),
+])
+def test_edge_cases_match_decimal_reference(values, basis):
+    _check_parity(values, basis)
+
+
+def test_inputs_outside_fixed_point_range_fall_back():
+    many_places = [Decimal("0.12345678901234567"), None]
+    assert _distribute_column_fixed_point("net", many_places, [Decimal(1)] * 2, DEFAULT_DIST_PRECISION) is None
+    huge = [Decimal("1E+30"), None]
+    assert _distribute_column_fixed_point("net", huge, [Decimal(1)] * 2, DEFAULT_DIST_PRECISION) is None
+    not_finite = [Decimal("NaN"), None]
+    assert _distribute_column_fixed_point("net", not_finite, [Decimal(1)] * 2, DEFAULT_DIST_PRECISION) is None
+
+
+def test_distribute_values_end_to_end():
+    raw_data = {
+        "pcs": [10, 20, "30", None, 5, 5],
+        "net": [12.5, None, None, 3, None, ""],
+        "gross": ["100.10", 0, None, None, None, None],
+        "cbm": [Decimal("1.2345"), None, None, Decimal("0.5"), None, None],
+    }
+    basis = [data_processor._convert_to_decimal(v) for v in raw_data["pcs"]]
+    expected = {}
+    for col in ("net", "gross", "cbm"):
+        col_dec = [data_processor._convert_to_decimal(v) for v in raw_data[col]]
+        expected[col] = _distribute_column_decimal(col, col_dec, basis)
+    result = distribute_values(raw_data, ["net", "gross", "cbm"], "pcs")
+    for col in ("net", "gross", "cbm"):
+        _assert_identical(result[col], expected[col])
@@ -0,0 +1,403 @@
+# --- START OF FULL FILE: xlsx_stream_reader.py ---
+
+import os
+import re
+import logging
+import posixpath
+import zipfile
+import xml.etree.ElementTree as ET
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+from openpyxl.styles.numbers import BUILTIN_FORMATS, is_date_format, is_timedelta_format
+from openpyxl.utils import column_index_from_string, range_boundaries
+from openpyxl.utils.datetime import from_excel, from_ISO8601, CALENDAR_WINDOWS_1900, CALENDAR_MAC_1904
+
+from excel_handler import ExcelHandler, SheetGrid
+
+try:
+    import config as cfg
+except ImportError:
+    cfg = None
+
+# --- Backend selection defaults (overridable in config.py) ---
+# 'auto' picks the XML stream reader for sheets whose estimated cost reaches the threshold.
+DEFAULT_EXTRACTION_BACKEND = 'auto'
+DEFAULT_XML_STREAM_MIN_COST = 100_000
+# Used when a sheet has no usable <dimension> tag: rough bytes of sheet XML per cell.
+BYTES_PER_CELL_ESTIMATE = 40
+
+BACKEND_OPENPYXL = 'openpyxl'
+BACKEND_XML_STREAM = 'xml_stream'
+
+_REL_NS = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+_CELL_REF_RE = re.compile(r'^([A-Z]+)(\d+)$')
+
+
+def _local(tag: str) -> str:
+    """Strips the namespace from an ElementTree tag (handles transitional and strict OOXML)."""
+    return tag.rsplit('}', 1)[-1]
+
+
+def _cast_number(value: str) -> Any:
+    """Same int/float rule openpyxl uses for numeric cell text."""
+    if "." in value or "E" in value or "e" in value:
+        return float(value)
+    return int(value)
+
+
+def _text_content(element: ET.Element) -> str:
+    """Concatenates a <si>/<is> element's <t> and rich-text run <r><t> content, skipping phonetic runs."""
+    snippets = []
+    for child in element:
+        tag = _local(child.tag)
+        if tag == 't':
+            snippets.append(child.text or '')
+        elif tag == 'r':
+            for run_child in child:
+                if _local(run_child.tag) == 't':
+                    snippets.append(run_child.text or '')
+    return ''.join(snippets)
+
+
+class XlsxStreamReader:
+    """
+    Reads cell values straight from an .xlsx archive without openpyxl cell objects.
+
+    The sheet XML is parsed incrementally and each <row> is discarded as soon as
+    its value tuple has been produced, so peak memory is the shared string table
+    plus one row. Values follow openpyxl's data_only conversions (shared/inline
+    strings, booleans, numbers, date-formatted numbers to datetime).
+    """
+
+    def __init__(self, file_path: str):
+        if not os.path.exists(file_path):
+            logging.error(f"File not found: {file_path}")
+            raise FileNotFoundError(f"The file '{file_path}' was not found.")
+        self.file_path = file_path
+        self._sheets: Optional[List[Tuple[str, str]]] = None # (name, archive path)
+        self._active_index = 0
+        self._epoch = CALENDAR_WINDOWS_1900
+        self._shared_strings_path: Optional[str] = None
+        self._styles_path: Optional[str] = None
+
+    # --- Workbook structure ---
+
+    def _load_workbook_index(self, archive: zipfile.ZipFile):
+        """Reads sheet names/paths, the active tab, the date epoch and part locations."""
+        if self._sheets is not None:
+            return
+        rels: Dict[str, Tuple[str, str]] = {}
+        with archive.open('xl/_rels/workbook.xml.rels') as f:
+            for rel in ET.parse(f).getroot():
+                target = rel.get('Target', '')
+                target = target.lstrip('/') if target.startswith('/') else posixpath.normpath(posixpath.join('xl', target))
+                rels[rel.get('Id')] = (rel.get('Type', ''), target)
+
+        for rel_type, target in rels.values():
+            if rel_type.endswith('/sharedStrings'):
+                self._shared_strings_path = target
+            elif rel_type.endswith('/styles'):
+                self._styles_path = target
+
+        sheets: List[Tuple[str, str]] = []
+        with archive.open('xl/workbook.xml') as f:
+            root = ET.parse(f).getroot()
+        for element in root.iter():
+            tag = _local(element.tag)
+            if tag == 'workbookPr' and element.get('date1904') in ('1', 'true'):
+                self._epoch = CALENDAR_MAC_1904
+            elif tag == 'workbookView' and element.get('activeTab'):
+                self._active_index = int(element.get('activeTab'))
+            elif tag == 'sheet':
+                rel_id = element.get(f'{{{_REL_NS}}}id') or next((v for k, v in element.attrib.items() if _local(k) == 'id'), None)
+                if rel_id in rels:
+                    sheets.append((element.get('name'), rels[rel_id][1]))
+        self._sheets = sheets
+
+    def _resolve_sheet(self, archive: zipfile.ZipFile, sheet_name: Optional[str]) -> Tuple[str, str]:
+        """Returns (title, archive path) using the same fallback rules as ExcelHandler.load_sheet."""
+        self._load_workbook_index(archive)
+        if not self._sheets:
+            raise ValueError(f"No worksheets found in '{self.file_path}'.")
+        if sheet_name:
+            for name, path in self._sheets:
+                if name == sheet_name:
+                    return name, path
+            logging.warning(f"Sheet '{sheet_name}' not found in '{self.file_path}'. Using active sheet.")
+        index = self._active_index if 0 <= self._active_index < len(self._sheets) else 0
+        return self._sheets[index]
+
+    def _read_shared_strings(self, archive: zipfile.ZipFile) -> List[str]:
+        """Reads the shared string table incrementally."""
+        strings: List[str] = []
+        if not self._shared_strings_path or self._shared_strings_path not in archive.namelist():
+            return strings
+        with archive.open(self._shared_strings_path) as f:
+            for _, element in ET.iterparse(f, events=('end',)):
+                if _local(element.tag) == 'si':
+                    strings.append(_text_content(element).replace('x005F_', ''))
+                    element.clear()
+        return strings
+
+    def _read_date_styles(self, archive: zipfile.ZipFile) -> Tuple[Set[int], Set[int]]:
+        """Returns the cellXfs indexes whose number format is a date, and those that are durations."""
+        date_styles: Set[int] = set()
+        timedelta_styles: Set[int] = set()
+        if not self._styles_path or self._styles_path not in archive.namelist():
+            return date_styles, timedelta_styles
+        with archive.open(self._styles_path) as f:
+            root = ET.parse(f).getroot()
+        custom_formats: Dict[int, str] = {}
+        cell_xfs = None
+        for element in root:
+            tag = _local(element.tag)
+            if tag == 'numFmts':
+                for num_fmt in element:
+                    custom_formats[int(num_fmt.get('numFmtId'))] = num_fmt.get('formatCode')
+            elif tag == 'cellXfs':
+                cell_xfs = element
+        if cell_xfs is None:
+            return date_styles, timedelta_styles
+        for idx, xf in enumerate(cell_xfs):
+            num_fmt_id = int(xf.get('numFmtId', 0))
+            fmt = custom_formats.get(num_fmt_id, BUILTIN_FORMATS.get(num_fmt_id))
+            if fmt and is_date_format(fmt):
+                date_styles.add(idx)
+            if fmt and is_timedelta_format(fmt):
+                timedelta_styles.add(idx)
+        return date_styles, timedelta_styles
+
+    # --- Cost estimation ---
+
+    def estimate_cost(self, sheet_name: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Reads only the sheet's <dimension> tag and the shared-string counts.
+
+        Returns:
+            Dict with 'sheet', 'dimension', 'rows', 'columns', 'cells' (estimated),
+            'shared_strings', 'sheet_xml_bytes' and 'cost' (cells + shared strings).
+        """
+        with zipfile.ZipFile(self.file_path) as archive:
+            title, sheet_path = self._resolve_sheet(archive, sheet_name)
+            sheet_xml_bytes = archive.getinfo(sheet_path).file_size
+
+            dimension_ref = None
+            with archive.open(sheet_path) as f:
+                for event, element in ET.iterparse(f, events=('start',)):
+                    tag = _local(element.tag)
+                    if tag == 'dimension':
+                        dimension_ref = element.get('ref')
+                        break
+                    if tag == 'sheetData':
+                        break
+
+            shared_strings = 0
+            if self._shared_strings_path and self._shared_strings_path in archive.namelist():
+                with archive.open(self._shared_strings_path) as f:
+                    for event, element in ET.iterparse(f, events=('start',)):
+                        shared_strings = int(element.get('uniqueCount') or element.get('count') or 0)
+                        break
+
+        rows = columns = 0
+        if dimension_ref:
+            try:
+                min_col, min_row, max_col, max_row = range_boundaries(dimension_ref)
+                rows, columns = max_row or 0, max_col or 0
+            except (ValueError, TypeError):
+                logging.debug(f"[XlsxStreamReader] Unparseable dimension '{dimension_ref}' in '{self.file_path}'.")
+        cells = rows * columns
+        if cells <= 1:
+            # Missing or collapsed dimension (some writers emit just "A1"); fall back to XML size.
+            cells = sheet_xml_bytes // BYTES_PER_CELL_ESTIMATE
+        return {
+            'sheet': title,
+            'dimension': dimension_ref,
+            'rows': rows,
+            'columns': columns,
+            'cells': cells,
+            'shared_strings': shared_strings,
+            'sheet_xml_bytes': sheet_xml_bytes,
+            'cost': cells + shared_strings,
+        }
+
+    # --- Row streaming ---
+
+    def iter_rows(self, sheet_name: Optional[str] = None, merged_ranges: Optional[List[str]] = None) -> Iterator[Tuple[Any, ...]]:
+        """
+        Yields one value tuple per sheet row, starting at row 1. Gaps between stored
+        rows are yielded as empty tuples so tuple positions match row numbers.
+
+        Merged cells are yielded with their stored values. <mergeCells> follows the
+        rows in the XML, so pass a list as merged_ranges to collect the merge refs
+        once the stream is exhausted (see read_grid).
+        """
+        with zipfile.ZipFile(self.file_path) as archive:
+            title, sheet_path = self._resolve_sheet(archive, sheet_name)
+            shared_strings = self._read_shared_strings(archive)
+            date_styles, timedelta_styles = self._read_date_styles(archive)
+            logging.info(f"[XlsxStreamReader] Streaming sheet '{title}' ({sheet_path}) with {len(shared_strings)} shared strings.")
+
+            next_row_num = 1
+            row_counter = 0
+            sheet_data = None
+            with archive.open(sheet_path) as f:
+                for event, element in ET.iterparse(f, events=('start', 'end')):
+                    tag = _local(element.tag)
+                    if event == 'start':
+                        if tag == 'sheetData':
+                            sheet_data = element
+                        continue
+                    if tag == 'mergeCell':
+                        if merged_ranges is not None and element.get('ref'):
+                            merged_ranges.append(element.get('ref'))
+                        continue
+                    if tag != 'row':
+                        continue
+
+                    row_attr = element.get('r')
+                    row_counter = int(row_attr) if row_attr else row_counter + 1
+                    values: List[Any] = []
+                    col_counter = 0
+                    for cell in element:
+                        if _local(cell.tag) != 'c':
+                            continue
+                        ref = cell.get('r')
+                        match = _CELL_REF_RE.match(ref) if ref else None
+                        col_counter = column_index_from_string(match.group(1)) if match else col_counter + 1
+                        value = self._cell_value(cell, shared_strings, date_styles, timedelta_styles)
+                        if len(values) < col_counter:
+                            values.extend([None] * (col_counter - len(values)))
+                        values[col_counter - 1] = value
+
+                    if sheet_data is not None:
+                        sheet_data.clear() # Drop parsed rows so memory stays at one row
+                    else:
+                        element.clear()
+
+                    if not values:
+                        continue # Rows without cells do not extend the sheet (matches openpyxl)
+                    while next_row_num < row_counter:
+                        yield ()
+                        next_row_num += 1
+                    yield tuple(values)
+                    next_row_num = row_counter + 1
+
+    def _cell_value(self, cell: ET.Element, shared_strings: List[str], date_styles: Set[int], timedelta_styles: Set[int]) -> Any:
+        """Converts one <c> element to the value openpyxl returns with data_only=True."""
+        data_type = cell.get('t', 'n')
+        if data_type == 'inlineStr':
+            for child in cell:
+                if _local(child.tag) == 'is':
+                    return _text_content(child)
+            return None
+
+        raw = None
+        for child in cell:
+            if _local(child.tag) == 'v':
+                raw = child.text
+                break
+        if not raw:
+            return None
+
+        if data_type == 'n':
+            value = _cast_number(raw)
+            style_id = int(cell.get('s') or 0)
+            if style_id in date_styles:
+                try:
+                    return from_excel(value, self._epoch, timedelta=style_id in timedelta_styles)
+                except (OverflowError, ValueError):
+                    return "#VALUE!"
+            return value
+        if data_type == 's':
+            return shared_strings[int(raw)]
+        if data_type == 'b':
+            return bool(int(raw))
+        if data_type == 'd':
+            return from_ISO8601(raw)
+        return raw # 'str' (formula result) and 'e' (error) are kept as text
+
+    def read_grid(self, sheet_name: Optional[str] = None) -> SheetGrid:
+        """Streams the sheet into a SheetGrid, the structure sheet_parser consumes."""
+        with zipfile.ZipFile(self.file_path) as archive:
+            title, _ = self._resolve_sheet(archive, sheet_name)
+        merged_ranges: List[str] = []
+        grid = SheetGrid.from_rows(self.iter_rows(sheet_name, merged_ranges), title=title)
+        grid.clear_merged(merged_ranges)
+        return grid
+
+    def read_merged_ranges(self, sheet_name: Optional[str] = None) -> List[str]:
+        """Returns the sheet's merged range refs (e.g. 'A1:C1') without building any rows."""
+        merged_ranges: List[str] = []
+        with zipfile.ZipFile(self.file_path) as archive:
+            _, sheet_path = self._resolve_sheet(archive, sheet_name)
+            with archive.open(sheet_path) as f:
+                for _, element in ET.iterparse(f, events=('end',)):
+                    tag = _local(element.tag)
+                    if tag == 'mergeCell' and element.get('ref'):
+                        merged_ranges.append(element.get('ref'))
+                    elif tag == 'row':
+                        element.clear()
+        return merged_ranges
+
+
+def read_merged_ranges(file_path: str, sheet_name: Optional[str] = None) -> List[str]:
+    """Module-level shortcut for XlsxStreamReader(file_path).read_merged_ranges(sheet_name)."""
+    return XlsxStreamReader(file_path).read_merged_ranges(sheet_name)
+
+
+def choose_backend(file_path: str, sheet_name: Optional[str] = None, backend: Optional[str] = None) -> str:
+    """
+    Decides which extraction backend to use for a workbook.
+
+    Args:
+        backend: 'openpyxl', 'xml_stream' or 'auto'. Defaults to config.EXTRACTION_BACKEND.
+            'auto' estimates the sheet cost from its <dimension> tag and shared-string
+            count and uses the XML stream reader at or above config.XML_STREAM_MIN_COST.
+    """
+    backend = backend or getattr(cfg, 'EXTRACTION_BACKEND', DEFAULT_EXTRACTION_BACKEND)
+    if backend in (BACKEND_OPENPYXL, BACKEND_XML_STREAM):
+        return backend
+    if backend != 'auto':
+        logging.warning(f"[choose_backend] Unknown extraction backend '{backend}'. Falling back to 'auto'.")
+
+    min_cost = getattr(cfg, 'XML_STREAM_MIN_COST', DEFAULT_XML_STREAM_MIN_COST)
+    try:
+        estimate = XlsxStreamReader(file_path).estimate_cost(sheet_name)
+    except Exception as e:
+        logging.warning(f"[choose_backend] Could not estimate sheet cost for '{file_path}': {e}. Using openpyxl.")
+        return BACKEND_OPENPYXL
+    chosen = BACKEND_XML_STREAM if estimate['cost'] >= min_cost else BACKEND_OPENPYXL
+    logging.info(f"[choose_backend] Sheet '{estimate['sheet']}' dimension={estimate['dimension']} "
+                 f"~{estimate['cells']} cells, {estimate['shared_strings']} shared strings "
+                 f"(cost {estimate['cost']}, threshold {min_cost}). Using '{chosen}' backend.")
+    return chosen
+
+
+def load_sheet_grid(file_path: str, sheet_name: Optional[str] = None, backend: Optional[str] = None) -> Optional[SheetGrid]:
+    """
+    Loads a sheet into a SheetGrid using the backend picked by choose_backend().
+    Falls back to ExcelHandler if the XML stream reader fails.
+
+    Returns:
+        The SheetGrid, or None if the sheet could not be loaded.
+    """
+    chosen = choose_backend(file_path, sheet_name, backend)
+    if chosen == BACKEND_XML_STREAM:
+        try:
+            grid = XlsxStreamReader(file_path).read_grid(sheet_name)
+            logging.info(f"[load_sheet_grid] Streamed sheet '{grid.title}': {grid.max_row} rows x {grid.max_column} columns")
+            return grid
+        except FileNotFoundError:
+            raise
+        except Exception as e:
+            logging.error(f"[load_sheet_grid] XML stream backend failed for '{file_path}': {e}. Falling back to openpyxl.", exc_info=True)
+
+    handler = ExcelHandler(file_path)
+    try:
+        if handler.load_sheet(sheet_name=sheet_name, data_only=True) is None:
+            return None
+        return handler.get_grid()
+    finally:
+        handler.close()
+
+# --- END OF FULL FILE: xlsx_stream_reader.py ---
@@ -11,22 +11,26 @@
 # Updated: Integrated pallet order tracking across multi-table chunks.
 # MODIFIED: Calculates final_grand_total_pallets globally before sheet loop and passes it to all fill_invoice_data calls.
 
+import io
 import os
 import json
 import pickle # Import pickle module
 import argparse
-import shutil
 import openpyxl
 import traceback
 import sys
 import time # Added for timing operations
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import Optional, Dict, Any, Union, List, Tuple
-import ast # <-- Add import for literal_eval
+from typing import Optional, Dict, Any, Iterable, Union, List, Tuple
 from decimal import Decimal # <-- Add import for Decimal evaluation
 import re # <-- Add import for regular expressions
 from openpyxl.utils import get_column_letter # REMOVED range_boundaries
 import text_replace_utils # Ensure this is imported
+import invoice_data_io
+import template_cache
+import template_catalog
+from template_cache import TemplateSnapshot
 
 # --- Import utility functions ---
 try:
@@ -64,7 +68,7 @@ def derive_paths(input_data_path_str: str, template_dir_str: str, config_dir_str
         if not template_dir.is_dir(): print(f"Error: Template directory not found: {template_dir}"); return None
         if not config_dir.is_dir(): print(f"Error: Config directory not found: {config_dir}"); return None
 
-        base_name = input_data_path.stem
+        base_name = invoice_data_io.data_file_stem(input_data_path)
         template_name_part = base_name
         suffixes_to_remove = ['_data', '_input', '_pkl']
         prefixes_to_remove = ['data_']
@@ -84,44 +88,22 @@ def derive_paths(input_data_path_str: str, template_dir_str: str, config_dir_str
             return None
         print(f"Derived initial template name part: '{template_name_part}'")
 
-        # --- Attempt 1: Exact Match ---
-        exact_template_filename = f"{template_name_part}.xlsx"
-        exact_config_filename = f"{template_name_part}_config.json"
-        exact_template_path = template_dir / exact_template_filename
-        exact_config_path = config_dir / exact_config_filename
-        print(f"Checking for exact match: Template='{exact_template_path}', Config='{exact_config_path}'")
-
-        if exact_template_path.is_file() and exact_config_path.is_file():
-            print("Found exact match for template and config.")
-            return {"data": input_data_path, "template": exact_template_path, "config": exact_config_path}
-        else:
-            print("Exact match not found. Attempting prefix matching...")
-
-            # --- Attempt 2: Prefix Match ---
-            prefix_match = re.match(r'^([a-zA-Z]+)', template_name_part) # Extract leading letters
-            if prefix_match:
-                prefix = prefix_match.group(1)
-                print(f"Extracted prefix: '{prefix}'")
-                prefix_template_filename = f"{prefix}.xlsx"
-                prefix_config_filename = f"{prefix}_config.json"
-                prefix_template_path = template_dir / prefix_template_filename
-                prefix_config_path = config_dir / prefix_config_filename
-                print(f"Checking for prefix match: Template='{prefix_template_path}', Config='{prefix_config_path}'")
-
-                if prefix_template_path.is_file() and prefix_config_path.is_file():
-                    print("Found prefix match for template and config.")
-                    return {"data": input_data_path, "template": prefix_template_path, "config": prefix_config_path}
-                else:
-                    print("Prefix match not found.")
-            else:
-                print("Could not extract a letter-based prefix.")
-
-            # --- No Match Found ---
-            print(f"Error: Could not find matching template/config files using exact ('{template_name_part}') or prefix methods.")
-            # Report specific missing files based on the exact match attempt
-            if not exact_template_path.is_file(): print(f"Error: Template file not found: {exact_template_path}")
-            if not exact_config_path.is_file(): print(f"Error: Configuration file not found: {exact_config_path}")
-            return None
+        # --- Exact match (<name>.xlsx + <name>_config.json), then the name's leading letters ---
+        # The template catalog answers from cached directory listings
+        match = template_catalog.get_catalog(template_dir, config_dir).resolve(template_name_part)
+        if match:
+            match_kind, template_path, config_path = match
+            print(f"Found {match_kind} match for template and config: Template='{template_path}', Config='{config_path}'")
+            return {"data": input_data_path, "template": template_path, "config": config_path}
+
+        # --- No Match Found ---
+        print(f"Error: Could not find matching template/config files using exact ('{template_name_part}') or prefix methods.")
+        # Report specific missing files based on the exact match attempt
+        exact_template_path = template_dir / f"{template_name_part}.xlsx"
+        exact_config_path = config_dir / f"{template_name_part}_config.json"
+        if not exact_template_path.is_file(): print(f"Error: Template file not found: {exact_template_path}")
+        if not exact_config_path.is_file(): print(f"Error: Configuration file not found: {exact_config_path}")
+        return None
 
     except Exception as e:
         print(f"Error deriving file paths: {e}")
@@ -145,11 +127,15 @@ def load_config(config_path: Path) -> Optional[Dict[str, Any]]:
     except Exception as e: print(f"Error loading configuration file {config_path}: {e}"); traceback.print_exc(); return None
 
 def load_data(data_path: Path) -> Optional[Dict[str, Any]]:
-    """ Loads and parses the input data file. Supports .json and .pkl. """
+    """ Loads and parses the input data file. Supports .json, compact .json.gz and .pkl. """
     print(f"Loading data from: {data_path}")
     invoice_data = None; file_suffix = data_path.suffix.lower()
     try:
-        if file_suffix == '.json':
+        if invoice_data_io.is_compact_path(data_path):
+            print("Detected compact .json.gz file...")
+            invoice_data = invoice_data_io.load_compact(data_path)
+            print("Compact data loaded successfully.")
+        elif file_suffix == '.json':
             print("Detected .json file...")
             with open(data_path, 'r', encoding='utf-8') as f: invoice_data = json.load(f)
             print("JSON data loaded successfully.")
@@ -160,130 +146,8 @@ def load_data(data_path: Path) -> Optional[Dict[str, Any]]:
         else: print(f"Error: Unsupported data file extension: '{file_suffix}'."); return None
         if not isinstance(invoice_data, dict): print("Error: Loaded data is not a dictionary."); return None
 
-        # --- START AGGREGATION KEY CONVERSION ---
-        # Use "initial_standard_aggregation" as requested
-        aggregation_data_raw = invoice_data.get("standard_aggregation_results")
-        if isinstance(aggregation_data_raw, dict):
-            print("DEBUG: Found 'standard_aggregation_results'. Converting string keys to tuples...")
-            aggregation_data_processed = {}
-            converted_count = 0
-            conversion_errors = 0
-            # Regex to find Decimal('...') and capture the inner number string
-            decimal_pattern = re.compile(r"Decimal\('(-?\d*\.?\d+)'\)") # Handles optional -, digits, optional decimal point
-
-            for key_str, value_dict in aggregation_data_raw.items():
-                processed_key_str = key_str # Initialize for error message
-                try:
-                    # Preprocess the string: Replace Decimal('...') with just the number string '...'
-                    processed_key_str = decimal_pattern.sub(r"'\1'", key_str) # Replace with the number in quotes
-
-                    # Now evaluate the processed string which should only contain literals
-                    key_tuple = ast.literal_eval(processed_key_str)
-
-                    # --- START MODIFIED POST-PROCESSING ---
-                    # Convert tuple elements: Keep PO (idx 0) and Item (idx 1) as strings,
-                    # convert Unit Price (idx 2) to float.
-                    final_key_list = []
-                    if isinstance(key_tuple, tuple) and len(key_tuple) >= 3:
-                        # PO Number (Index 0): Keep as string
-                        final_key_list.append(str(key_tuple[0]))
-
-                        # Item Number (Index 1): Keep as string
-                        final_key_list.append(str(key_tuple[1]))
-
-                        # Unit Price (Index 2): Convert to float
-                        unit_price_val = key_tuple[2]
-                        if isinstance(unit_price_val, (int, float)):
-                            final_key_list.append(float(unit_price_val))
-                        elif isinstance(unit_price_val, str):
-                            try:
-                                final_key_list.append(float(unit_price_val))
-                            except ValueError:
-                                print(f"Warning: Could not convert unit price string '{unit_price_val}' to float for key '{key_str}'. Keeping as string.")
-                                final_key_list.append(unit_price_val) # Keep original string on error
-                        else:
-                            # Handle other types if necessary, maybe try converting to float
-                            try: final_key_list.append(float(unit_price_val))
-                            except (ValueError, TypeError):
-                                print(f"Warning: Could not convert unit price type '{type(unit_price_val)}' ({unit_price_val}) to float for key '{key_str}'. Keeping original type.")
-                                final_key_list.append(unit_price_val) # Keep original on error
-
-                        # Add any remaining elements from the original tuple (if any)
-                        if len(key_tuple) > 3:
-                            final_key_list.extend(key_tuple[3:])
-
-                    else:
-                        # Handle cases where the tuple doesn't have the expected structure
-                        print(f"Warning: Evaluated key tuple '{key_tuple}' does not have expected length >= 3. Using original items.")
-                        final_key_list = list(key_tuple) # Use original items
-
-                    final_key_tuple = tuple(final_key_list)
-                    # --- END MODIFIED POST-PROCESSING ---
-
-
-                    if isinstance(final_key_tuple, tuple):
-                        aggregation_data_processed[final_key_tuple] = value_dict
-                        converted_count += 1
-                    else:
-                        # This case should be less likely now with the explicit tuple check above
-                        print(f"Warning: Final key is not a tuple for processed key string '{processed_key_str}'. Original: '{key_str}'. Result: {final_key_tuple}")
-                        conversion_errors += 1
-                except (ValueError, SyntaxError, NameError, TypeError) as e:
-                    print(f"Warning: Could not convert aggregation key string '{key_str}' (processed: '{processed_key_str}') to tuple: {e}")
-                    conversion_errors += 1
-            # Replace the original string-keyed dict with the tuple-keyed one
-            # Update the key used for replacement as well
-            invoice_data["standard_aggregation_results"] = aggregation_data_processed
-            print(f"DEBUG: Finished key conversion. Converted: {converted_count}, Errors: {conversion_errors}")
-        # --- END AGGREGATION KEY CONVERSION ---
-
-        # --- START CUSTOM AGGREGATION KEY CONVERSION ---
-        # Added block to handle custom_aggregation_results
-        custom_aggregation_data_raw = invoice_data.get("custom_aggregation_results")
-        if isinstance(custom_aggregation_data_raw, dict):
-            print("DEBUG: Found 'custom_aggregation_results'. Converting string keys to tuples...")
-            custom_aggregation_data_processed = {}
-            custom_converted_count = 0
-            custom_conversion_errors = 0
-            # Reuse the same regex pattern
-            decimal_pattern = re.compile(r"Decimal\('(-?\d*\.?\d+)'\)")
-
-            for key_str, value_dict in custom_aggregation_data_raw.items():
-                processed_key_str = key_str
-                try:
-                    processed_key_str = decimal_pattern.sub(r"'\1'", key_str)
-                    key_tuple = ast.literal_eval(processed_key_str)
-
-                    # Apply the same post-processing as standard aggregation if needed
-                    # (Assuming the structure PO, Item, [Optional Price] is consistent)
-                    final_key_list = []
-                    if isinstance(key_tuple, tuple) and len(key_tuple) >= 2: # Custom might only have PO, Item
-                        # PO Number (Index 0): Keep as string
-                        final_key_list.append(str(key_tuple[0]))
-                        # Item Number (Index 1): Keep as string
-                        final_key_list.append(str(key_tuple[1]))
-                        # Keep remaining elements (e.g., None in the example)
-                        if len(key_tuple) > 2:
-                            final_key_list.extend(key_tuple[2:])
-                    else:
-                        print(f"Warning: Custom key tuple '{key_tuple}' doesn't have expected length >= 2. Using original items.")
-                        final_key_list = list(key_tuple)
-
-                    final_key_tuple = tuple(final_key_list)
-
-                    if isinstance(final_key_tuple, tuple):
-                        custom_aggregation_data_processed[final_key_tuple] = value_dict
-                        custom_converted_count += 1
-                    else:
-                        print(f"Warning: Final custom key is not a tuple for processed key string '{processed_key_str}'. Original: '{key_str}'. Result: {final_key_tuple}")
-                        custom_conversion_errors += 1
-                except (ValueError, SyntaxError, NameError, TypeError) as e:
-                    print(f"Warning: Could not convert custom aggregation key string '{key_str}' (processed: '{processed_key_str}') to tuple: {e}")
-                    custom_conversion_errors += 1
-
-            invoice_data["custom_aggregation_results"] = custom_aggregation_data_processed
-            print(f"DEBUG: Finished key conversion for custom_aggregation_results. Converted: {custom_converted_count}, Errors: {custom_conversion_errors}")
-        # --- END CUSTOM AGGREGATION KEY CONVERSION ---
+        # --- AGGREGATION KEY CONVERSION (record-list encoding, or legacy repr-string keys) ---
+        invoice_data_io.decode_aggregation_sections(invoice_data)
 
         return invoice_data
     except json.JSONDecodeError as e: print(f"Error: Invalid JSON in data file {data_path}: {e}"); return None
@@ -401,7 +265,7 @@ def pre_calculate_and_insert_rows(
         try:
             # 1. Insert the required number of blank rows.
             print(f"Inserting {total_rows_to_insert} rows at index {start_row} for sheet '{sheet_name}'...")
-            worksheet.insert_rows(start_row, amount=total_rows_to_insert)
+            merge_utils.insert_rows(worksheet, start_row, total_rows_to_insert)
             print("Bulk row insertion complete.")
             
             return True, total_rows_to_insert
@@ -557,7 +421,7 @@ def process_single_table_sheet(
     if final_row_spacing >= 1:
         try:
             print(f"Config requests final spacing ({final_row_spacing}). Adding blank row(s) at {next_row_after_footer}.")
-            worksheet.insert_rows(next_row_after_footer, amount=final_row_spacing)
+            merge_utils.insert_rows(worksheet, next_row_after_footer, final_row_spacing)
         except Exception as final_spacer_err:
             print(f"Warning: Failed to insert final spacer rows: {final_spacer_err}")
 
@@ -574,43 +438,60 @@ def process_single_table_sheet(
 
     return True
 
-def main():
-    """Main function to orchestrate invoice generation."""
-    # Start timing the invoice generation process
-    start_time = time.time()
-    
-    parser = argparse.ArgumentParser(description="Generate Invoice from Template and Data using configuration files.")
-    parser.add_argument("input_data_file", help="Path to the input data file (.json or .pkl). Filename base determines template/config.")
-    parser.add_argument("-o", "--output", default="result.xlsx", help="Path for the output Excel file (default: result.xlsx)")
-    parser.add_argument("-t", "--templatedir", default="./TEMPLATE", help="Directory containing template Excel files (default: ./TEMPLATE)")
-    parser.add_argument("-c", "--configdir", default="./configs", help="Directory containing configuration JSON files (default: ./configs)")
-    parser.add_argument("--fob", action="store_true", help="Generate FOB version using final_fob_compounded_result for Invoice/Contract sheets.")
-    parser.add_argument("--custom", action="store_true", help="Enable custom processing logic (details TBD).")
-    args = parser.parse_args()
+class GenerationError(Exception):
+    """
+    Raised by generate() when no workbook can be produced. partial_workbook holds the
+    workbook as it stood when an unhandled error occurred (None if unavailable).
+    """
+    def __init__(self, message: str, partial_workbook: Optional[bytes] = None):
+        super().__init__(message)
+        self.partial_workbook = partial_workbook
 
-    print("--- Starting Invoice Generation ---")
-    print(f"🕒 Started at: {time.strftime('%H:%M:%S', time.localtime(start_time))}")
-    print(f"Input Data: {args.input_data_file}"); print(f"Template Dir: {args.templatedir}"); print(f"Config Dir: {args.configdir}"); print(f"Output File: {args.output}")
+MODE_FLAGS = ('fob', 'custom')
 
-    print("\n1. Deriving file paths..."); paths = derive_paths(args.input_data_file, args.templatedir, args.configdir)
-    if not paths: sys.exit(1)
+def parse_mode_flags(mode_flags: Iterable[str]) -> argparse.Namespace:
+    """
+    Turns mode flags into the namespace the sheet processors read (args.fob, args.custom).
+    Accepts the CLI spelling ('--fob', '--custom') as well as bare names ('fob', 'custom').
+    """
+    flags = {flag.lstrip('-').lower() for flag in mode_flags}
+    unknown = flags.difference(MODE_FLAGS)
+    if unknown: raise ValueError(f"Unknown mode flag(s): {sorted(unknown)}. Expected any of {list(MODE_FLAGS)}.")
+    return argparse.Namespace(**{name: name in flags for name in MODE_FLAGS})
 
-    print("\n2. Loading configuration and data..."); config = load_config(paths['config']); invoice_data = load_data(paths['data'])
-    if not config or not invoice_data: sys.exit(1)
+def _workbook_to_bytes(workbook: Any) -> bytes:
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
 
-    print(f"\n3. Copying template '{paths['template'].name}' to '{args.output}'..."); output_path = Path(args.output).resolve()
-    try:
-        output_path.parent.mkdir(parents=True, exist_ok=True);
-        shutil.copy(paths['template'], output_path);
-    except Exception as e:
-        print(f"Error copying template: {e}"); sys.exit(1)
-    print(f"Template copied successfully to {output_path}")
+def generate(invoice_data: Dict[str, Any], config: Dict[str, Any], template_path: Union[str, Path, TemplateSnapshot], mode_flags: Iterable[str] = ()) -> bytes:
+    """
+    Generates one invoice workbook in-process and returns it as .xlsx bytes.
 
+    Args:
+        invoice_data: The extraction result, either as returned by create_json's
+            run_invoice_automation (in memory) or as loaded by load_data. It is not modified.
+        config: The invoice configuration (see load_config).
+        template_path: The template workbook path (served through the template cache), or a
+            TemplateSnapshot from it. The template file is never written.
+        mode_flags: Any of '--fob' / '--custom' (or 'fob' / 'custom'); empty for the normal version.
+
+    Raises:
+        GenerationError: If the workbook could not be produced.
+        ValueError: On an unknown mode flag.
+    """
+    args = parse_mode_flags(mode_flags)
+    # Work on a JSON-shaped copy so each mode starts from the same data
+    invoice_data = invoice_data_io.prepare_invoice_data(invoice_data)
     print("\n4. Processing workbook...");
     workbook = None; processing_successful = True
 
     try:
-        workbook = openpyxl.load_workbook(output_path)
+        if isinstance(template_path, TemplateSnapshot): workbook = template_path.clone()
+        else: workbook = template_cache.get_template_cache().load_workbook(template_path)
+        # Text cells of the template, so the replacement tasks below skip empty cells
+        template_file = template_path.source if isinstance(template_path, TemplateSnapshot) else template_path
+        template_text_cells = template_catalog.template_text_cells(template_file)
 
         # --- Determine sheets to process ---
         sheets_to_process_config = config.get('sheets_to_process', [])
@@ -620,29 +501,22 @@ def main():
             sheets_to_process = [s for s in sheets_to_process_config if s in workbook.sheetnames] # Filter valid sheets
 
         if not sheets_to_process:
-            print("Error: No valid sheets found or specified to process.")
-            if workbook:
-                try: workbook.close()
-                except Exception: pass
-            sys.exit(1) # Exit if no sheets to process
+            raise GenerationError("No valid sheets found or specified to process.")
 
         # --- Store Original Merges BEFORE processing using merge_utils ---
         if args.fob:
             print("\n--- Running initial template replacements for FOB ---")
             text_replace_utils.run_fob_specific_replacement_task(
-                workbook=workbook
+                workbook=workbook, text_cells=template_text_cells
             )
         
         # Perform data-driven replacements (e.g., JFINV, JFTIME)
         print("Performing data-driven replacements for single-table sheet...")
         text_replace_utils.run_invoice_header_replacement_task(
-            workbook, invoice_data
+            workbook, invoice_data, text_cells=template_text_cells
         )
         print("--- Finished initial template replacements ---\n")
 
-        original_merges = merge_utils.store_original_merges(workbook, sheets_to_process) # TODO: Re-enable
-        # print("DEBUG: Stored original merges structure:")
-
         # --- Get other config sections ---
         sheet_data_map = config.get('sheet_data_map', {})
         global_footer_rules = config.get('footer_rules', {})
@@ -760,6 +634,7 @@ def main():
  
                 # ***** REMOVED REDUNDANT PRE-CALCULATION LOOP - NOW DONE GLOBALLY *****
                 last_table = len(table_keys)-1
+                num_header_rows, num_columns = calculate_header_dimensions(sheet_header_to_write) # Same block above every table
  
                 # --- V11: Main loop now only writes data, doesn't insert --- # TODO urgent
                 for i, table_key in enumerate(table_keys):
@@ -768,14 +643,13 @@ def main():
                     if not table_data_to_fill or not isinstance(table_data_to_fill, dict): print(f"Warning: No/invalid data for table key '{table_key}'. Skipping."); continue
  
                     print(f"Writing header for table '{table_key}' at row {write_pointer_row}...");
-                    written_header_info = invoice_utils.write_header(
+                    written_header_info = invoice_utils.stamp_header(
                         worksheet, write_pointer_row, sheet_header_to_write, sheet_styling_config
                     )
                     if not written_header_info: print(f"Error writing header for table '{table_key}'. Skipping sheet."); processing_successful = False; break
                     last_table_header_info = written_header_info # Keep track for width setting later
  
                     # Update write pointer after header
-                    num_header_rows, num_columns = calculate_header_dimensions(sheet_header_to_write)
                     write_pointer_row += num_header_rows
  
                     print(f"Filling data and footer for table '{table_key}' starting near row {write_pointer_row}...")
@@ -955,40 +829,122 @@ def main():
                     processed_table_source=processed_tables_data_for_calc,
                     footer_config=footer_config,
                 )
-        # --- Restore Original Merges AFTER processing all sheets using merge_utils ---
-        merge_utils.find_and_restore_merges_heuristic(workbook, original_merges, sheets_to_process) # TODO: Re-enableN
-
-        # 5. Save the final workbook
+        # 5. Serialize the final workbook
         print("\n--------------------------------")
         if processing_successful:
             print("5. Saving final workbook...")
-            workbook.save(output_path); print(f"--- Workbook saved successfully: '{output_path}' ---")
         else:
             print("--- Processing completed with errors. Saving workbook (may be incomplete). ---")
-            try:
-                # Corrected the closing quote below
-                workbook.save(output_path); print(f"--- Incomplete workbook saved to: '{output_path}' ---")
-            except Exception as save_err:
-                print(f"--- CRITICAL ERROR: Failed to save incomplete workbook: {save_err} ---")
+        workbook_bytes = _workbook_to_bytes(workbook)
+        print(f"--- Workbook serialized ({len(workbook_bytes)} bytes) ---")
+        return workbook_bytes
 
+    except GenerationError:
+        raise
     except Exception as e:
         print(f"\n--- UNHANDLED ERROR during workbook processing: {e} ---"); traceback.print_exc()
-        if workbook and output_path: # Try to save error state
-             try:
-                 error_filename = output_path.stem + "_ERROR" + output_path.suffix; error_path = output_path.with_name(error_filename)
-                 print(f"Attempting to save workbook state to {error_path}..."); workbook.save(error_path); print("Workbook state saved.")
+        partial_workbook = None
+        if workbook: # Try to keep the error state
+             try: partial_workbook = _workbook_to_bytes(workbook)
              except Exception as final_save_err: print(f"--- Could not save workbook state after error: {final_save_err} ---")
+        raise GenerationError(f"Unhandled error during workbook processing: {e}", partial_workbook) from e
     finally:
         if workbook:
             try: workbook.close(); print("Workbook closed.")
             except Exception: pass
 
+
+def generate_modes(
+    invoice_data: Dict[str, Any],
+    config: Dict[str, Any],
+    template_path: Union[str, Path],
+    modes: Dict[str, Iterable[str]],
+    max_workers: Optional[int] = None
+) -> Tuple[Dict[str, bytes], Dict[str, str]]:
+    """
+    Generates several invoice variants (e.g. {'normal': [], 'fob': ['--fob'], 'combine': ['--custom']})
+    in parallel, one worker process per mode. The data is prepared and the template snapshot
+    taken (from the template cache) once; each worker clones its own workbook from the snapshot.
+
+    Returns:
+        (outputs, errors): workbook bytes per successful mode, and an error message per failed
+        mode, both keyed by mode name. Outputs keep the order of 'modes'.
+    """
+    prepared_data = invoice_data_io.prepare_invoice_data(invoice_data)
+    template_snapshot = template_cache.get_template_cache().get_snapshot(template_path)
+    mode_flags = {mode_name: list(flags) for mode_name, flags in modes.items()}
+    for flags in mode_flags.values(): parse_mode_flags(flags) # Reject unknown flags before starting workers
+    workers = max(1, min(max_workers or os.cpu_count() or 1, len(mode_flags)))
+
+    results: Dict[str, bytes] = {}; errors: Dict[str, str] = {}
+    if workers == 1:
+        # Nothing to overlap; skip the pool start-up
+        for mode_name, flags in mode_flags.items():
+            try: results[mode_name] = generate(prepared_data, config, template_snapshot, flags)
+            except GenerationError as e: errors[mode_name] = str(e)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {mode_name: executor.submit(generate, prepared_data, config, template_snapshot, flags) for mode_name, flags in mode_flags.items()}
+            for mode_name, future in futures.items():
+                try: results[mode_name] = future.result()
+                except Exception as e: # GenerationError, or the worker crashed
+                    errors[mode_name] = str(e) if isinstance(e, GenerationError) else f"{type(e).__name__}: {e}"
+    print(f"Generated {len(results)} of {len(mode_flags)} mode(s) with {workers} worker(s).")
+    return results, errors
+
+def main():
+    """Main function to orchestrate invoice generation."""
+    # Start timing the invoice generation process
+    start_time = time.time()
+    
+    parser = argparse.ArgumentParser(description="Generate Invoice from Template and Data using configuration files.")
+    parser.add_argument("input_data_file", help="Path to the input data file (.json, compact .json.gz or .pkl). Filename base determines template/config.")
+    parser.add_argument("-o", "--output", default="result.xlsx", help="Path for the output Excel file (default: result.xlsx)")
+    parser.add_argument("-t", "--templatedir", default="./TEMPLATE", help="Directory containing template Excel files (default: ./TEMPLATE)")
+    parser.add_argument("-c", "--configdir", default="./configs", help="Directory containing configuration JSON files (default: ./configs)")
+    parser.add_argument("--fob", action="store_true", help="Generate FOB version using final_fob_compounded_result for Invoice/Contract sheets.")
+    parser.add_argument("--custom", action="store_true", help="Enable custom processing logic (details TBD).")
+    parser.add_argument("--template-cache-dir", default=None, help="Directory for pre-parsed template snapshots (speeds up cold starts).")
+    args = parser.parse_args()
+    if args.template_cache_dir: template_cache.configure_template_cache(args.template_cache_dir)
+
+    print("--- Starting Invoice Generation ---")
+    print(f"🕒 Started at: {time.strftime('%H:%M:%S', time.localtime(start_time))}")
+    print(f"Input Data: {args.input_data_file}"); print(f"Template Dir: {args.templatedir}"); print(f"Config Dir: {args.configdir}"); print(f"Output File: {args.output}")
+
+    print("\n1. Deriving file paths..."); paths = derive_paths(args.input_data_file, args.templatedir, args.configdir)
+    if not paths: sys.exit(1)
+
+    print("\n2. Loading configuration and data..."); config = load_config(paths['config']); invoice_data = load_data(paths['data'])
+    if not config or not invoice_data: sys.exit(1)
+
+    print(f"\n3. Using template '{paths['template'].name}'..."); output_path = Path(args.output).resolve()
+    mode_flags = [name for name in MODE_FLAGS if getattr(args, name)]
+    try:
+        workbook_bytes = generate(invoice_data, config, paths['template'], mode_flags)
+    except GenerationError as e:
+        print(f"Error: {e}")
+        if e.partial_workbook is not None: # Save error state
+            try:
+                output_path.parent.mkdir(parents=True, exist_ok=True)
+                error_filename = output_path.stem + "_ERROR" + output_path.suffix; error_path = output_path.with_name(error_filename)
+                print(f"Attempting to save workbook state to {error_path}..."); error_path.write_bytes(e.partial_workbook); print("Workbook state saved.")
+            except Exception as final_save_err: print(f"--- Could not save workbook state after error: {final_save_err} ---")
+        sys.exit(1)
+
+    try:
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        output_path.write_bytes(workbook_bytes); print(f"--- Workbook saved successfully: '{output_path}' ---")
+    except OSError as e:
+        print(f"--- CRITICAL ERROR: Failed to save workbook: {e} ---"); sys.exit(1)
+
     # Calculate and log total processing time
     total_time = time.time() - start_time
     input_file_name = Path(args.input_data_file).name if args.input_data_file else "Unknown"
     output_file_name = Path(args.output).name if args.output else "Unknown"
     
     print("\n--- Invoice Generation Finished ---")
+    print(f"Template cache: {template_cache.get_template_cache().stats()}")
     print(f"🕒 INVOICE GENERATION TIME: {total_time:.2f} seconds ({total_time/60:.1f} minutes)")
     print(f"📄 Input: {input_file_name} → Output: {output_file_name}")
     print(f"🏁 Completed at: {time.strftime('%H:%M:%S', time.localtime())}")
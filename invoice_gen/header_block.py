@@ -0,0 +1,212 @@
+# header_block.py
+# A table header layout compiled once and stamped wherever a table starts.
+#
+# Multi-table sheets (processed_tables_multi invoices, packing lists) write the same
+# header_to_write layout above every table. compile_header_block() parses the layout and
+# the header styling once per config; HeaderBlock.write() renders it at a row.
+#
+# HeaderBlock.stamp() goes one step further for repeated headers: the first stamp in a
+# workbook renders the block normally and records what it produced (each cell's value and
+# workbook style array, including the MergedCells of the header merges). Later stamps copy
+# those records to the new rows and register the merges directly, skipping the per-cell
+# style lookups and the merge border pass. A stamp reproduces the first rendering, so only
+# stamp onto freshly inserted rows (as every table of a multi-table block is); use write()
+# where the header lands on template rows whose existing formatting should be kept.
+
+import weakref
+from copy import copy
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from openpyxl.cell.cell import MergedCell
+from openpyxl.styles import Alignment, Border, Font, PatternFill, Side
+from openpyxl.utils import get_column_letter
+from openpyxl.worksheet.merge import MergedCellRange
+from openpyxl.worksheet.worksheet import Worksheet
+
+from merge_index import merge_index, unmerge_overlapping
+
+# Defaults when the styling config has no header_font / header_alignment
+_thin_side = Side(border_style="thin", color="000000")
+DEFAULT_HEADER_BORDER = Border(left=_thin_side, right=_thin_side, top=_thin_side, bottom=_thin_side)
+DEFAULT_HEADER_FONT = Font(bold=True)
+DEFAULT_HEADER_ALIGNMENT = Alignment(horizontal='center', vertical='center', wrap_text=True)
+
+
+class HeaderCell(NamedTuple):
+    row: int # Offset from the first header row
+    col: int # 1-based column
+    value: Any
+    rowspan: int
+    colspan: int
+
+
+class _StampedCell(NamedTuple):
+    row: int # Offset from the first header row
+    col: int
+    merged: bool # True for the covered (non top-left) cells of a merge
+    value: Any
+    style: Any # openpyxl StyleArray; only meaningful inside the workbook it came from
+
+
+class HeaderBlock:
+    """A parsed header_to_write layout with its resolved header font, alignment, border and fill."""
+
+    def __init__(self, header_layout_config: List[Dict[str, Any]], sheet_styling_config: Optional[Dict[str, Any]] = None):
+        self.font = DEFAULT_HEADER_FONT
+        self.alignment = DEFAULT_HEADER_ALIGNMENT
+        self.border = DEFAULT_HEADER_BORDER
+        self.fill = None # Default is no fill
+
+        if sheet_styling_config:
+            header_font_cfg = sheet_styling_config.get("header_font")
+            if header_font_cfg and isinstance(header_font_cfg, dict):
+                try:
+                    self.font = Font(**header_font_cfg)
+                except TypeError:
+                    pass # Keep default on error
+
+            header_align_cfg = sheet_styling_config.get("header_alignment")
+            if header_align_cfg and isinstance(header_align_cfg, dict):
+                try:
+                    self.alignment = Alignment(**header_align_cfg)
+                except TypeError:
+                    pass # Keep default on error
+
+            header_fill_cfg = sheet_styling_config.get("header_pattern_fill")
+            if header_fill_cfg and isinstance(header_fill_cfg, dict):
+                try:
+                    self.fill = PatternFill(**header_fill_cfg)
+                except TypeError:
+                    print(f"Warning: Invalid parameters in header_pattern_fill config: {header_fill_cfg}")
+
+        self.cells: List[HeaderCell] = []
+        self.column_map: Dict[str, int] = {}
+        self.column_id_map: Dict[str, int] = {}
+        for cell_config in header_layout_config:
+            header_cell = HeaderCell(
+                row=cell_config.get('row', 0),
+                col=1 + cell_config.get('col', 0), # openpyxl is 1-based
+                value=cell_config.get('text'),
+                rowspan=cell_config.get('rowspan', 1),
+                colspan=cell_config.get('colspan', 1),
+            )
+            self.cells.append(header_cell)
+            if cell_config.get('id'):
+                self.column_id_map[cell_config['id']] = header_cell.col
+            if header_cell.value:
+                self.column_map[str(header_cell.value).strip()] = header_cell.col
+
+        # The header spans rows start_row .. start_row + last_row_offset
+        self.last_row_offset = max(cell_config.get('row', 0) for cell_config in header_layout_config)
+        self.num_columns = max(cell_config.get('col', 0) + cell_config.get('colspan', 1) for cell_config in header_layout_config)
+        self._stamps: "weakref.WeakKeyDictionary[Any, List[_StampedCell]]" = weakref.WeakKeyDictionary()
+
+    def header_info(self, start_row: int) -> Dict[str, Any]:
+        """The header_info dict describing this block written at start_row."""
+        return {
+            'first_row_index': start_row,
+            'second_row_index': start_row + self.last_row_offset, # The last row of the entire header block
+            'column_map': dict(self.column_map),
+            'column_id_map': dict(self.column_id_map),
+            'num_columns': self.num_columns
+        }
+
+    def write(self, worksheet: Worksheet, start_row: int) -> Dict[str, Any]:
+        """Renders the header at start_row and returns its header_info."""
+        # Unmerge the entire target area first
+        unmerge_overlapping(worksheet, start_row, start_row + self.last_row_offset, 1, self.num_columns)
+
+        for header_cell in self.cells:
+            abs_row = start_row + header_cell.row
+            cell = worksheet.cell(row=abs_row, column=header_cell.col)
+            cell.value = header_cell.value
+            cell.font = self.font
+            cell.alignment = self.alignment
+            cell.border = self.border
+            if self.fill:
+                cell.fill = self.fill
+
+            if header_cell.rowspan > 1 or header_cell.colspan > 1:
+                worksheet.merge_cells(
+                    start_row=abs_row,
+                    start_column=header_cell.col,
+                    end_row=abs_row + header_cell.rowspan - 1,
+                    end_column=header_cell.col + header_cell.colspan - 1
+                )
+        return self.header_info(start_row)
+
+    def stamp(self, worksheet: Worksheet, start_row: int) -> Dict[str, Any]:
+        """
+        Writes the header at start_row by copying the first rendering made in this workbook
+        (rendering it now if there is none). start_row must be on freshly inserted rows.
+        """
+        workbook = worksheet.parent
+        stamped_cells = self._stamps.get(workbook)
+        if stamped_cells is None:
+            header_info = self.write(worksheet, start_row)
+            self._stamps[workbook] = self._record(worksheet, start_row)
+            return header_info
+
+        unmerge_overlapping(worksheet, start_row, start_row + self.last_row_offset, 1, self.num_columns)
+        # Register the merges first; the recorded styles written below already carry their borders
+        merged_cells = merge_index(worksheet)
+        for header_cell in self.cells:
+            if header_cell.rowspan > 1 or header_cell.colspan > 1:
+                abs_row = start_row + header_cell.row
+                merged_cells.add(MergedCellRange(worksheet, (
+                    f"{_coord(abs_row, header_cell.col)}:"
+                    f"{_coord(abs_row + header_cell.rowspan - 1, header_cell.col + header_cell.colspan - 1)}")))
+
+        worksheet_cells = worksheet._cells
+        for stamped in stamped_cells:
+            abs_row = start_row + stamped.row
+            if stamped.merged:
+                cell = MergedCell(worksheet, row=abs_row, column=stamped.col)
+                worksheet_cells[(abs_row, stamped.col)] = cell
+            else:
+                cell = worksheet.cell(row=abs_row, column=stamped.col)
+                cell.value = stamped.value
+            cell._style = copy(stamped.style)
+        return self.header_info(start_row)
+
+    def _record(self, worksheet: Worksheet, start_row: int) -> List[_StampedCell]:
+        """Snapshots the cells a write() at start_row produced."""
+        coords: Dict[Tuple[int, int], None] = {}
+        for header_cell in self.cells:
+            for r in range(header_cell.row, header_cell.row + max(header_cell.rowspan, 1)):
+                for c in range(header_cell.col, header_cell.col + max(header_cell.colspan, 1)):
+                    coords[(r, c)] = None
+
+        recorded = []
+        for r, c in coords:
+            cell = worksheet._cells.get((start_row + r, c))
+            if cell is None:
+                continue
+            merged = isinstance(cell, MergedCell)
+            recorded.append(_StampedCell(r, c, merged, None if merged else cell.value, copy(cell._style)))
+        return recorded
+
+
+def _coord(row: int, col: int) -> str:
+    return f"{get_column_letter(col)}{row}"
+
+
+_compiled_blocks: Dict[Tuple[int, int], Tuple[list, Optional[dict], HeaderBlock]] = {}
+_MAX_COMPILED_BLOCKS = 64
+
+
+def compile_header_block(header_layout_config: List[Dict[str, Any]], sheet_styling_config: Optional[Dict[str, Any]] = None) -> HeaderBlock:
+    """
+    Returns the HeaderBlock for a header layout and styling config, compiling it on first use.
+    Memoized by identity (configs are loaded once and not modified while generating).
+    """
+    key = (id(header_layout_config), id(sheet_styling_config))
+    entry = _compiled_blocks.get(key)
+    if entry is not None and entry[0] is header_layout_config and entry[1] is sheet_styling_config:
+        return entry[2]
+    block = HeaderBlock(header_layout_config, sheet_styling_config)
+    if len(_compiled_blocks) >= _MAX_COMPILED_BLOCKS:
+        _compiled_blocks.clear()
+    # The configs are kept alongside so their ids cannot be reused while cached
+    _compiled_blocks[key] = (header_layout_config, sheet_styling_config, block)
+    return block
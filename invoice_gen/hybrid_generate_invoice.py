@@ -11,9 +11,12 @@ from openpyxl.workbook import Workbook
 
 # --- Import Reusable and New Utilities ---
 import text_replace_utils
+import template_catalog
 import invoice_utils
 import packing_list_utils
 import merge_utils
+import invoice_data_io
+from merge_index import merge_index
 
 # Helper function to copy sheets (remains unchanged)
 def copy_sheet_between_workbooks(source_sheet: Worksheet, target_workbook: Workbook) -> Worksheet:
@@ -32,6 +35,7 @@ def copy_sheet_between_workbooks(source_sheet: Worksheet, target_workbook: Workb
                 new_cell.number_format = cell.number_format
                 new_cell.protection = copy(cell.protection)
                 new_cell.alignment = copy(cell.alignment)
+    merge_index(target_sheet) # Indexed duplicate checks keep this loop linear
     for merge_range in source_sheet.merged_cells.ranges:
         target_sheet.merge_cells(str(merge_range))
     for col_letter, dim in source_sheet.column_dimensions.items():
@@ -95,7 +99,7 @@ def derive_paths(input_data_path_str: str, template_dir_str: str, config_dir_str
             print("Error: One or more paths (input file, template dir, config dir) not found.")
             return None
         
-        template_name_part = re.sub(r'(_data|_input|_pkl)$', '', input_data_path.stem, flags=re.IGNORECASE)
+        template_name_part = re.sub(r'(_data|_input|_pkl)$', '', invoice_data_io.data_file_stem(input_data_path), flags=re.IGNORECASE)
         print(f"Derived template name part: '{template_name_part}'")
         
         for prefix in [template_name_part, (re.match(r'^([a-zA-Z]+)', template_name_part) or [''])[0]]:
@@ -122,21 +126,22 @@ def derive_paths(input_data_path_str: str, template_dir_str: str, config_dir_str
         print(f"Error deriving file paths: {e}"); return None
 
 def load_json_file(file_path: Path, file_type: str) -> dict:
-    """Loads and parses a JSON file (data or config)."""
+    """Loads and parses a JSON file (data or config). A .json.gz path is read as compact columnar data."""
     print(f"Loading {file_type} from: {file_path}")
     try:
-        with open(file_path, 'r', encoding='utf-8') as f: return json.load(f)
-    except (FileNotFoundError, json.JSONDecodeError) as e:
+        return invoice_data_io.load_data_file(file_path)
+    except (FileNotFoundError, ValueError, OSError) as e:
         print(f"FATAL ERROR: Could not load or parse {file_type} file {file_path}. Error: {e}"); sys.exit(1)
 
 
 def main():
     """Main function to orchestrate hybrid invoice generation."""
     parser = argparse.ArgumentParser(description="Generate invoice documents from a JSON data file.")
-    parser.add_argument("input_data_file", help="Path to the input JSON data file. Filename determines template/config.")
+    parser.add_argument("input_data_file", help="Path to the input JSON (.json or compact .json.gz) data file. Filename determines template/config.")
     parser.add_argument("-o", "--outputdir", default=".", help="Output directory for the generated Excel files.")
     parser.add_argument("-t", "--templatedir", default="./TEMPLATE", help="Directory for template files.")
     parser.add_argument("-c", "--configdir", default="./config", help="Directory for config files.")
+    parser.add_argument("--write-only", action="store_true", help="Stream packing-list sheets to their files in write-only mode (bounded memory for very long lists). A sheet can also opt in with \"write_only\": true in its config.")
     args = parser.parse_args()
 
     print("--- Starting Hybrid Invoice Generation ---")
@@ -144,7 +149,7 @@ def main():
     paths = derive_paths(args.input_data_file, args.templatedir, args.configdir)
     if not paths: sys.exit(1)
 
-    po_number = paths['data'].stem
+    po_number = invoice_data_io.data_file_stem(paths['data'])
     output_dir = Path(args.outputdir)
     output_dir.mkdir(parents=True, exist_ok=True)
 
@@ -159,6 +164,8 @@ def main():
     try:
         print(f"Loading template from '{paths['template']}'...")
         template_workbook = openpyxl.load_workbook(paths['template'])
+        # Copied sheets keep the template's coordinates, so its catalogued text cells apply
+        template_text_cells = template_catalog.template_text_cells(paths['template'], 50, 20)
         sheets_to_process_config = config.get("sheets_to_process", {})
 
         for sheet_name, sheet_config in sheets_to_process_config.items():
@@ -174,9 +181,14 @@ def main():
             print(f"--- Processing Content for: '{sheet_name}' ---")
             process_type = sheet_config.get("type")
 
+            # --- THIS IS THE KEY LINE FOR THE FILENAME ---
+            # It creates the filename as "{Sheet Name} {PO Number}.xlsx"
+            sheet_output_path = output_dir / f"{sheet_name} {po_number}.xlsx"
+            streamed = False
+
             if process_type == "summary":
                 print(f"Processing '{sheet_name}' as summary (text replacement).")
-                text_replace_utils.find_and_replace(output_workbook, sheet_config.get("replacements", []), 50, 20, invoice_data)
+                text_replace_utils.find_and_replace(output_workbook, sheet_config.get("replacements", []), 50, 20, invoice_data, template_text_cells)
 
             elif process_type == "packing_list":
                 print(f"Processing '{sheet_name}' as a packing list.")
@@ -184,30 +196,30 @@ def main():
                 # --- REVISION ---
                 # First, perform the standard text replacement for any placeholders on the sheet.
                 print(" -> Step 1: Performing text replacement for placeholders...")
-                text_replace_utils.find_and_replace(output_workbook, sheet_config.get("replacements", []), 50, 20, invoice_data)
+                text_replace_utils.find_and_replace(output_workbook, sheet_config.get("replacements", []), 50, 20, invoice_data, template_text_cells)
 
                 # Second, continue with the detailed packing list table generation.
                 print(" -> Step 2: Generating detailed packing list table...")
                 start_row = sheet_config.get("start_row", 1)
-                merges_to_restore = merge_utils.store_original_merges(output_workbook, [sheet_name])
                 rows_to_add = packing_list_utils.calculate_rows_to_generate(invoice_data, sheet_config)
-                if rows_to_add > 0:
-                    print(f"    -> Inserting {rows_to_add} rows at row {start_row}...")
-                    merge_utils.force_unmerge_from_row_down(worksheet, start_row)
-                    worksheet.insert_rows(start_row, amount=rows_to_add)
-                
-                packing_list_utils.generate_full_packing_list(worksheet, start_row, invoice_data, sheet_config)
-                merge_utils.find_and_restore_merges_heuristic(output_workbook, merges_to_restore, [sheet_name])
+                if args.write_only or sheet_config.get("write_only"):
+                    # The copied sheet is only the source of the template rows; the output is streamed
+                    print(f"    -> Streaming {rows_to_add} generated rows at row {start_row} to '{sheet_output_path}' (write-only)...")
+                    packing_list_utils.stream_packing_list(worksheet, sheet_output_path, start_row, rows_to_add, invoice_data, sheet_config)
+                    streamed = True
+                else:
+                    if rows_to_add > 0:
+                        print(f"    -> Inserting {rows_to_add} rows at row {start_row}...")
+                        merge_utils.insert_rows(worksheet, start_row, rows_to_add)
+
+                    packing_list_utils.generate_full_packing_list(worksheet, start_row, invoice_data, sheet_config)
             
             else:
                 print(f"Warning: Unknown process type '{process_type}' for sheet '{sheet_name}'. Skipping.")
 
-            # --- THIS IS THE KEY LINE FOR THE FILENAME ---
-            # It creates the filename as "{Sheet Name} {PO Number}.xlsx"
-            sheet_output_path = output_dir / f"{sheet_name} {po_number}.xlsx"
-            
-            print(f"\n--- Saving final workbook to '{sheet_output_path}' ---")
-            output_workbook.save(sheet_output_path)
+            if not streamed:
+                print(f"\n--- Saving final workbook to '{sheet_output_path}' ---")
+                output_workbook.save(sheet_output_path)
             output_workbook.close()
             print(f"Processing complete for sheet '{sheet_name}'.")
 
@@ -0,0 +1,216 @@
+# invoice_data_io.py
+# Readers for the invoice data files produced by create_json/main.py and Second_Layer(main).py.
+# Loads plain JSON or the compact columnar format (selected by extension) and decodes the
+# aggregation maps ('standard_aggregation_results' and 'custom_aggregation_results') into
+# the tuple-keyed dictionaries used by invoice_utils.
+
+import ast
+import datetime
+import gzip
+import json
+import re
+from collections.abc import Mapping
+from decimal import Decimal
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+# Must match AGGREGATION_RECORDS_FORMAT / AGGREGATION_RECORDS_VERSION in create_json/main.py
+AGGREGATION_RECORDS_FORMAT = "aggregation_records"
+AGGREGATION_RECORDS_VERSION = 1
+AGGREGATION_SECTIONS = ("standard_aggregation_results", "custom_aggregation_results")
+
+# Must match COMPACT_SUFFIX / COMPACT_FORMAT / COMPACT_VERSION in create_json/compact_format.py
+COMPACT_SUFFIX = ".json.gz"
+COMPACT_FORMAT = "invoice_data_columnar"
+COMPACT_VERSION = 1
+COLUMN_MARKER = "$column"
+
+# Legacy format: Decimal('...') inside a repr'd tuple key
+_LEGACY_DECIMAL_PATTERN = re.compile(r"Decimal\('(-?\d*\.?\d+)'\)")
+
+AggregationKey = Tuple[Any, ...]
+
+
+def is_compact_path(path: Union[str, Path]) -> bool:
+    """True if path names a compact data file (selected by the '.json.gz' extension)."""
+    return str(path).lower().endswith(COMPACT_SUFFIX)
+
+
+def data_file_stem(path: Union[str, Path]) -> str:
+    """File name without its data extension: 'X.json' and 'X.json.gz' both give 'X'."""
+    path = Path(path)
+    if is_compact_path(path):
+        return path.name[:-len(COMPACT_SUFFIX)]
+    return path.stem
+
+
+def _decode_column(obj: Dict[str, Any]) -> Any:
+    """
+    json object_hook: turns a typed column back into the list plain JSON would hold
+    (each Decimal as its str()). Other objects are returned unchanged.
+    """
+    kind = obj.get(COLUMN_MARKER)
+    if kind is None:
+        return obj
+    if kind != "decimal":
+        raise ValueError(f"Unsupported column type {kind!r} in compact data.")
+    coefficients = obj["coefficients"]
+    exponents = obj.get("exponents")
+    if exponents is None:
+        exponent = obj["exponent"]
+        # Decimal parsed from text is exact; str() restores the original representation
+        return [None if c is None else str(Decimal(f"{c}E{exponent}")) for c in coefficients]
+    return [None if c is None else str(Decimal(f"{c}E{e}")) for c, e in zip(coefficients, exponents)]
+
+
+def load_compact(path: Union[str, Path]) -> Dict[str, Any]:
+    """
+    Reads a compact (.json.gz) data file and returns the same dictionary that
+    json.load would return for the equivalent .json file.
+
+    Raises:
+        ValueError: If the file is not in a supported compact format/version.
+    """
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        wrapped = json.load(f, object_hook=_decode_column)
+    if not isinstance(wrapped, dict) or wrapped.get("format") != COMPACT_FORMAT:
+        raise ValueError(f"'{path}' is not a {COMPACT_FORMAT} file.")
+    version = wrapped.get("version")
+    if version != COMPACT_VERSION:
+        raise ValueError(f"Unsupported {COMPACT_FORMAT} version {version!r} in '{path}' (supported: {COMPACT_VERSION}).")
+    return wrapped["data"]
+
+
+def load_data_file(path: Union[str, Path]) -> Any:
+    """Loads a .json or compact .json.gz data file, chosen by extension."""
+    if is_compact_path(path):
+        return load_compact(path)
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def is_aggregation_records(section: Any) -> bool:
+    """True if an aggregation section uses the versioned record-list encoding."""
+    return isinstance(section, dict) and section.get("format") == AGGREGATION_RECORDS_FORMAT and isinstance(section.get("records"), list)
+
+
+def _price_to_float(price: Any) -> Any:
+    """Unit price as float (the key type invoice_utils expects); None and unparsable values are kept as-is."""
+    if price is None:
+        return None
+    try:
+        return float(price)
+    except (TypeError, ValueError):
+        return price
+
+
+def decode_aggregation_records(section: Dict[str, Any], mode: str) -> Dict[AggregationKey, Dict[str, Any]]:
+    """
+    Decodes a record-list aggregation section:
+        {"format": "aggregation_records", "version": 1,
+         "records": [{"po", "item", "price", "description", "sqft_sum", "amount_sum"}, ...]}
+    into {(po, item, price, description): {'sqft_sum', 'amount_sum'}}.
+    PO and item become strings; in 'standard' mode the price becomes a float.
+
+    Raises:
+        ValueError: On an unsupported version or a malformed record.
+    """
+    version = section.get("version")
+    if version != AGGREGATION_RECORDS_VERSION:
+        raise ValueError(f"Unsupported {AGGREGATION_RECORDS_FORMAT} version {version!r} (supported: {AGGREGATION_RECORDS_VERSION}).")
+    convert_price = mode == "standard"
+    decoded: Dict[AggregationKey, Dict[str, Any]] = {}
+    for index, record in enumerate(section["records"]):
+        try:
+            price = record["price"]
+            key = (str(record["po"]), str(record["item"]), _price_to_float(price) if convert_price else price, record["description"])
+            decoded[key] = {"sqft_sum": record["sqft_sum"], "amount_sum": record["amount_sum"]}
+        except (KeyError, TypeError) as e:
+            raise ValueError(f"Malformed {mode} aggregation record #{index}: {record!r} ({type(e).__name__}: {e})") from e
+    return decoded
+
+
+def decode_legacy_aggregation_keys(section: Dict[str, Any], mode: str) -> Dict[AggregationKey, Dict[str, Any]]:
+    """
+    Decodes the legacy encoding, where each key is the repr of the tuple key,
+    e.g. "('PO1', 'ITEM', Decimal('1.23'), None)". Keys that cannot be parsed are
+    reported and skipped.
+    """
+    decoded: Dict[AggregationKey, Dict[str, Any]] = {}
+    conversion_errors = 0
+    min_length = 3 if mode == "standard" else 2
+    for key_str, value_dict in section.items():
+        processed_key_str = key_str # Initialize for error message
+        try:
+            # Replace Decimal('...') with the quoted number so only literals remain
+            processed_key_str = _LEGACY_DECIMAL_PATTERN.sub(r"'\1'", key_str)
+            key_tuple = ast.literal_eval(processed_key_str)
+            if not isinstance(key_tuple, tuple):
+                raise TypeError(f"evaluated to {type(key_tuple).__name__}, not tuple")
+            if len(key_tuple) >= min_length:
+                # PO and Item as strings; in standard mode the unit price becomes a float
+                final_key_list: List[Any] = [str(key_tuple[0]), str(key_tuple[1])]
+                if mode == "standard":
+                    final_key_list.append(_price_to_float(key_tuple[2]))
+                    final_key_list.extend(key_tuple[3:])
+                else:
+                    final_key_list.extend(key_tuple[2:])
+            else:
+                print(f"Warning: {mode} aggregation key tuple '{key_tuple}' does not have expected length >= {min_length}. Using original items.")
+                final_key_list = list(key_tuple)
+            decoded[tuple(final_key_list)] = value_dict
+        except (ValueError, SyntaxError, NameError, TypeError) as e:
+            print(f"Warning: Could not convert {mode} aggregation key string '{key_str}' (processed: '{processed_key_str}') to tuple: {e}")
+            conversion_errors += 1
+    if conversion_errors:
+        print(f"Warning: {conversion_errors} of {len(section)} legacy {mode} aggregation key(s) could not be converted and were skipped.")
+    return decoded
+
+
+def decode_aggregation_sections(invoice_data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Replaces 'standard_aggregation_results' and 'custom_aggregation_results' in
+    invoice_data (in place) with tuple-keyed dictionaries. Both the record-list
+    encoding and the legacy repr-string keys are accepted; sections that are
+    already tuple-keyed are left as they are.
+    """
+    for section_name in AGGREGATION_SECTIONS:
+        section = invoice_data.get(section_name)
+        mode = section_name.split("_", 1)[0]
+        if isinstance(section, dict) and section and all(isinstance(key, tuple) for key in section):
+            continue
+        if is_aggregation_records(section):
+            invoice_data[section_name] = decode_aggregation_records(section, mode)
+            print(f"DEBUG: Decoded {len(invoice_data[section_name])} '{section_name}' record(s).")
+        elif isinstance(section, dict):
+            invoice_data[section_name] = decode_legacy_aggregation_keys(section, mode)
+            print(f"DEBUG: Converted {len(invoice_data[section_name])} legacy '{section_name}' key(s) to tuples.")
+    return invoice_data
+
+
+def to_json_shape(obj: Any) -> Any:
+    """
+    Returns a copy of obj shaped as json.load would return it after create_json wrote
+    it: Decimal -> str, date/datetime -> ISO string, tuples/sets/table columns -> lists,
+    non-string keys -> str. Tuple keys (decoded aggregation maps) are kept.
+    """
+    if isinstance(obj, Mapping):
+        return {key if isinstance(key, (str, tuple)) else str(key): to_json_shape(value) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple, set)):
+        return [to_json_shape(item) for item in obj]
+    if isinstance(obj, Decimal):
+        return str(obj)
+    if isinstance(obj, (datetime.datetime, datetime.date)):
+        return obj.isoformat()
+    if hasattr(obj, "to_list"): # create_json table.Column
+        return [to_json_shape(item) for item in obj.to_list()]
+    return obj
+
+
+def prepare_invoice_data(invoice_data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Brings invoice data handed over in memory (create_json's run_invoice_automation
+    result) or loaded from a file to the form the generators use: a fresh JSON-shaped
+    copy with decoded aggregation sections. The input is not modified.
+    """
+    return decode_aggregation_sections(to_json_shape(invoice_data))
@@ -9,6 +9,10 @@ from typing import List, Dict, Any, Optional, Tuple, Union
 from decimal import Decimal
 from decimal import Decimal, InvalidOperation
 import merge_utils
+import style_utils
+from merge_index import merge_index, unmerge_overlapping
+from render_plan import RenderPlan, apply_render_plan
+from header_block import compile_header_block
 
 # --- Constants for Styling ---
 thin_side = Side(border_style="thin", color="000000")
@@ -37,31 +41,7 @@ def unmerge_row(worksheet: Worksheet, row_num: int, num_cols: int):
     """
     if row_num <= 0:
         return
-    merged_ranges_copy = list(worksheet.merged_cells.ranges) # Copy ranges before modification
-    merged_ranges_to_remove = []
-
-    # Identify ranges that overlap with the target row
-    for merged_range in merged_ranges_copy:
-        # Check if the range's row span includes the target row_num
-        # And if the range's column span overlaps with columns 1 to num_cols
-        overlap = (merged_range.min_row <= row_num <= merged_range.max_row and
-                   max(merged_range.min_col, 1) <= min(merged_range.max_col, num_cols))
-        if overlap:
-            merged_ranges_to_remove.append(str(merged_range))
-
-    if merged_ranges_to_remove:
-        for range_str in merged_ranges_to_remove:
-            try:
-                worksheet.unmerge_cells(range_str)
-            except KeyError:
-                # Range might have been removed by unmerging an overlapping one
-                pass
-            except Exception as unmerge_err:
-                # Log or handle other potential errors if needed
-                pass
-    else:
-        # No overlapping merges found for this row
-        pass
+    unmerge_overlapping(worksheet, row_num, row_num, 1, num_cols)
 
 
 def unmerge_block(worksheet: Worksheet, start_row: int, end_row: int, num_cols: int):
@@ -75,33 +55,7 @@ def unmerge_block(worksheet: Worksheet, start_row: int, end_row: int, num_cols:
     """
     if start_row <= 0 or end_row < start_row:
         return
-    merged_ranges_copy = list(worksheet.merged_cells.ranges) # Copy ranges before modification
-    merged_ranges_to_remove = []
-
-    # Identify ranges that overlap with the target block
-    for merged_range in merged_ranges_copy:
-        mr_min_row, mr_min_col, mr_max_row, mr_max_col = merged_range.bounds
-        row_overlap = max(mr_min_row, start_row) <= min(mr_max_row, end_row)
-        col_overlap = max(mr_min_col, 1) <= min(mr_max_col, num_cols)
-
-        if row_overlap and col_overlap:
-            range_str = str(merged_range)
-            if range_str not in merged_ranges_to_remove: # Avoid duplicates
-                merged_ranges_to_remove.append(range_str)
-
-    if merged_ranges_to_remove:
-        for range_str in merged_ranges_to_remove:
-            try:
-                worksheet.unmerge_cells(range_str)
-            except KeyError:
-                # Range might have been removed by unmerging an overlapping one
-                pass
-            except Exception as unmerge_err:
-                # Log or handle other potential errors if needed
-                pass
-    else:
-        # No overlapping merges found in this block
-        pass
+    unmerge_overlapping(worksheet, start_row, end_row, 1, num_cols)
 
 
 def safe_unmerge_block(worksheet: Worksheet, start_row: int, end_row: int, num_cols: int):
@@ -112,19 +66,8 @@ def safe_unmerge_block(worksheet: Worksheet, start_row: int, end_row: int, num_c
     if start_row <= 0 or end_row < start_row:
         return
 
-    # Only process merges that actually intersect with our target range
-    for merged_range in list(worksheet.merged_cells.ranges):
-        # Check if this merge intersects our target range
-        if (merged_range.min_row <= end_row and
-            merged_range.max_row >= start_row and
-            merged_range.min_col <= num_cols and
-            merged_range.max_col >= 1):
-            try:
-                worksheet.unmerge_cells(merged_range.coord)
-            except (KeyError, ValueError, AttributeError):
-                # Ignore errors if the range is somehow invalid or already unmerged
-                continue
-
+    # Only merges that actually intersect the target range are touched
+    unmerge_overlapping(worksheet, start_row, end_row, 1, num_cols)
     return True
 
 
@@ -219,21 +162,7 @@ def apply_row_merges(worksheet: Worksheet, row_num: int, num_cols: int, merge_ru
         merge_range_str = f"{get_column_letter(start_col)}{row_num}:{get_column_letter(end_col)}{row_num}"
         try:
             # --- Pre-Unmerge Overlapping Cells ---
-            merges_to_clear = []
-            current_merged_ranges = list(worksheet.merged_cells.ranges) # Work on a copy
-            for merged_range in current_merged_ranges:
-                # Check if the existing merge overlaps with the target row and column range
-                if merged_range.min_row <= row_num <= merged_range.max_row:
-                    if max(merged_range.min_col, start_col) <= min(merged_range.max_col, end_col):
-                        range_to_remove_str = str(merged_range)
-                        if range_to_remove_str not in merges_to_clear:
-                            merges_to_clear.append(range_to_remove_str)
-            if merges_to_clear:
-                for r_str in merges_to_clear:
-                    try: worksheet.unmerge_cells(r_str)
-                    except KeyError: pass
-                    except Exception as unmerge_err_inner: pass # Log?
-            # --- End Pre-Unmerge ---
+            unmerge_overlapping(worksheet, row_num, row_num, start_col, end_col)
 
             worksheet.merge_cells(start_row=row_num, start_column=start_col, end_row=row_num, end_column=end_col)
             # Apply alignment to the top-left cell of the merged range
@@ -247,6 +176,23 @@ def apply_row_merges(worksheet: Worksheet, row_num: int, num_cols: int, merge_ru
             # Log or handle other merge errors
             pass
 
+def _resolve_number_format(column_id: str, configured_format: Optional[str], current_format: Optional[str], value: Any, fob_mode: Optional[bool] = False) -> Optional[str]:
+    """
+    Number format a styled cell should get, or None to keep current_format.
+    Text-formatted cells are never changed; PCS columns always use the configured format.
+    """
+    if current_format == FORMAT_TEXT:
+        return None
+    if column_id in ['col_pcs', 'col_qty_pcs']:
+        return configured_format or None
+    # Non-PCS columns follow FOB mode logic
+    if configured_format:
+        return FORMAT_NUMBER_COMMA_SEPARATED2 if fob_mode else configured_format
+    if current_format == FORMAT_GENERAL or current_format is None:
+        if isinstance(value, float): return FORMAT_NUMBER_COMMA_SEPARATED2
+        if isinstance(value, int): return FORMAT_NUMBER_COMMA_SEPARATED1
+    return None
+
 def _apply_cell_style(cell, column_id: Optional[str], sheet_styling_config: Optional[Dict[str, Any]] = None, fob_mode: Optional[bool] = False):
     """
     Applies font, alignment, and number format to a cell based on a column ID.
@@ -255,42 +201,22 @@ def _apply_cell_style(cell, column_id: Optional[str], sheet_styling_config: Opti
         return
 
     try:
-        # Get styling configurations using ID-based keys
-        default_font_cfg = sheet_styling_config.get("default_font", {})
-        default_align_cfg = sheet_styling_config.get("default_alignment", {})
-        column_styles = sheet_styling_config.get("column_id_styles", {}) # <-- Uses "column_id_styles"
-
-        # Find column-specific style rules if the ID matches
-        col_specific_style = column_styles.get(column_id, {})
+        # Prebuilt font/alignment/number format for this column ID (default_font and
+        # default_alignment merged with "column_id_styles"), shared by every cell of the column
+        column_style = style_utils.compile_styles(sheet_styling_config).column(column_id)
 
         # --- Apply Font ---
-        final_font_cfg = default_font_cfg.copy()
-        final_font_cfg.update(col_specific_style.get("font", {}))
-        if final_font_cfg:
-            cell.font = Font(**{k: v for k, v in final_font_cfg.items() if v is not None})
+        if column_style.font is not None:
+            cell.font = column_style.font
 
         # --- Apply Alignment ---
-        final_align_cfg = default_align_cfg.copy()
-        final_align_cfg.update(col_specific_style.get("alignment", {}))
-        if final_align_cfg:
-            cell.alignment = Alignment(**{k: v for k, v in final_align_cfg.items() if v is not None})
+        if column_style.alignment is not None:
+            cell.alignment = column_style.alignment
             
         # --- Apply Number Format ---
-        number_format = col_specific_style.get("number_format")
-        
-        # PCS always uses config format, never forced format
-        if column_id in ['col_pcs', 'col_qty_pcs']:
-            if number_format and cell.number_format != FORMAT_TEXT:
-                cell.number_format = number_format
-        else:
-            # Non-PCS columns follow FOB mode logic
-            if number_format and cell.number_format != FORMAT_TEXT and not fob_mode:
-                cell.number_format = number_format
-            elif number_format and cell.number_format != FORMAT_TEXT and fob_mode:
-                cell.number_format = FORMAT_NUMBER_COMMA_SEPARATED2
-            elif cell.number_format != FORMAT_TEXT and (cell.number_format == FORMAT_GENERAL or cell.number_format is None):
-                if isinstance(cell.value, float): cell.number_format = FORMAT_NUMBER_COMMA_SEPARATED2
-                elif isinstance(cell.value, int): cell.number_format = FORMAT_NUMBER_COMMA_SEPARATED1
+        number_format = _resolve_number_format(column_id, column_style.number_format, cell.number_format, cell.value, fob_mode)
+        if number_format is not None:
+            cell.number_format = number_format
 
     except Exception as style_err:
         print(f"Error applying cell style for ID {column_id}: {style_err}")
@@ -361,7 +287,7 @@ def write_grand_total_weight_summary(
 
     # --- Insert and unmerge rows (no changes here) ---
     try:
-        worksheet.insert_rows(start_row, amount=2)
+        merge_utils.insert_rows(worksheet, start_row, 2)
         unmerge_row(worksheet, start_row, num_columns)
         unmerge_row(worksheet, start_row + 1, num_columns)
     except Exception as insert_err:
@@ -419,120 +345,39 @@ def write_grand_total_weight_summary(
 def write_header(worksheet: Worksheet, start_row: int, header_layout_config: List[Dict[str, Any]],
                  sheet_styling_config: Optional[Dict[str, Any]] = None
                  ) -> Optional[Dict[str, Any]]:
-    
+    """
+    Writes the header_to_write layout at start_row (values, header font/alignment/border/fill
+    and merges) and returns its header_info. The layout is parsed once per config.
+    """
     if not header_layout_config or start_row <= 0:
         return None
-    
-    merge_utils.force_unmerge_from_row_down(worksheet, start_row)
-
-
-    # Determine header dimensions from the layout config
-    num_header_rows = max(cell.get('row', 0) for cell in header_layout_config) + 1
-    num_columns = max(cell.get('col', 0) + cell.get('colspan', 1) for cell in header_layout_config)
-    end_row = start_row + num_header_rows - 1
-
-    # Get header styling from config
-    header_font_to_apply = bold_font
-    header_alignment_to_apply = center_alignment
-    header_border_to_apply = thin_border
-    header_background_fill_to_apply = None # Default is no fill
-
-    # --- NEW: Code to parse header styling from the config ---
-    if sheet_styling_config:
-        # Get font from config
-        header_font_cfg = sheet_styling_config.get("header_font")
-        if header_font_cfg and isinstance(header_font_cfg, dict):
-            try:
-                header_font_to_apply = Font(**header_font_cfg)
-            except TypeError:
-                pass # Keep default on error
-
-        # Get alignment from config
-        header_align_cfg = sheet_styling_config.get("header_alignment")
-        if header_align_cfg and isinstance(header_align_cfg, dict):
-            try:
-                header_alignment_to_apply = Alignment(**header_align_cfg)
-            except TypeError:
-                pass # Keep default on error
-        
-        # Get background fill from config
-        header_fill_cfg = sheet_styling_config.get("header_pattern_fill")
-        if header_fill_cfg and isinstance(header_fill_cfg, dict):
-            try:
-                # Create a PatternFill object from the config dictionary
-                header_background_fill_to_apply = PatternFill(**header_fill_cfg)
-            except TypeError:
-                # This could happen if config keys don't match PatternFill arguments
-                print(f"Warning: Invalid parameters in header_pattern_fill config: {header_fill_cfg}")
-                pass # Keep fill as None on error
-    # --- END NEW CODE ---
 
     try:
-        # 1. Unmerge the entire target area first
-        unmerge_block(worksheet, start_row, end_row, num_columns)
-
-        column_map_by_text = {}
-        column_map_by_id = {}
-
-        # 2. Loop through the explicit layout configuration
-        for cell_config in header_layout_config:
-            # Get cell properties from the config object
-            relative_row = cell_config.get('row', 0)
-            relative_col = cell_config.get('col', 0)
-            text_to_write = cell_config.get('text')
-            cell_id = cell_config.get('id')
-            rowspan = cell_config.get('rowspan', 1)
-            colspan = cell_config.get('colspan', 1)
-
-            # Calculate absolute position on the worksheet
-            abs_row = start_row + relative_row
-            abs_col = 1 + relative_col # openpyxl is 1-based
-
-            # 3. Write value and apply style to the top-left cell
-            cell = worksheet.cell(row=abs_row, column=abs_col)
-            cell.value = text_to_write
-            cell.font = header_font_to_apply
-            cell.alignment = header_alignment_to_apply
-            cell.border = header_border_to_apply
-            
-            # This line now applies the fill object we created from the config
-            if header_background_fill_to_apply:
-                cell.fill = header_background_fill_to_apply
-
-            # 4. Populate the ID and Text maps
-            if cell_id:
-                column_map_by_id[cell_id] = abs_col
-            if text_to_write:
-                column_map_by_text[str(text_to_write).strip()] = abs_col
-
-            # 5. Apply merges if needed
-            if rowspan > 1 or colspan > 1:
-                end_merge_row = abs_row + rowspan - 1
-                end_merge_col = abs_col + colspan - 1
-                worksheet.merge_cells(
-                    start_row=abs_row,
-                    start_column=abs_col,
-                    end_row=end_merge_row,
-                    end_column=end_merge_col
-                )
-
-        return {
-            'first_row_index': start_row,
-            'second_row_index': end_row, # The last row of the entire header block
-            'column_map': column_map_by_text,
-            'column_id_map': column_map_by_id,
-            'num_columns': num_columns
-        }
-
+        return compile_header_block(header_layout_config, sheet_styling_config).write(worksheet, start_row)
     except Exception as e:
         print(f"Error in write_header during layout processing: {e}")
         traceback.print_exc()
         return None
 
+
+def stamp_header(worksheet: Worksheet, start_row: int, header_layout_config: List[Dict[str, Any]],
+                 sheet_styling_config: Optional[Dict[str, Any]] = None
+                 ) -> Optional[Dict[str, Any]]:
+    """
+    Like write_header, for headers repeated above every table of a multi-table block:
+    the header is rendered once per workbook and copied to each later table.
+    start_row must be on freshly inserted rows.
+    """
+    if not header_layout_config or start_row <= 0:
+        return None
+
+    try:
+        return compile_header_block(header_layout_config, sheet_styling_config).stamp(worksheet, start_row)
     except Exception as e:
-        print(f"Error in write_header during layout processing: {e}")
+        print(f"Error in stamp_header during layout processing: {e}")
         traceback.print_exc()
         return None
+
 def merge_contiguous_cells_by_id(
     worksheet: Worksheet,
     start_row: int,
@@ -542,33 +387,15 @@ def merge_contiguous_cells_by_id(
 ):
     """
     Finds and merges contiguous vertical cells within a column that have the same value.
-    This is called AFTER all data has been written to the sheet.
+    This reads the column back from the sheet; fill_invoice_data plans these merges
+    from the values it writes instead (see plan_data_rows).
     """
     col_idx = column_id_map.get(col_id_to_merge)
     if not col_idx or start_row >= end_row:
         return
 
-    current_merge_start_row = start_row
-    value_to_match = worksheet.cell(row=start_row, column=col_idx).value
-
-    for row_idx in range(start_row + 1, end_row + 2):
-        cell_value = worksheet.cell(row=row_idx, column=col_idx).value if row_idx <= end_row else object()
-        if cell_value != value_to_match:
-            if row_idx - 1 > current_merge_start_row:
-                if value_to_match is not None and str(value_to_match).strip():
-                    try:
-                        worksheet.merge_cells(
-                            start_row=current_merge_start_row,
-                            start_column=col_idx,
-                            end_row=row_idx - 1,
-                            end_column=col_idx
-                        )
-                    except Exception as e:
-                        print(f"Could not merge cells for ID {col_id_to_merge} from row {current_merge_start_row} to {row_idx - 1}. Error: {e}")
-            
-            current_merge_start_row = row_idx
-            if row_idx <= end_row:
-                value_to_match = cell_value
+    values = [worksheet.cell(row=r, column=col_idx).value for r in range(start_row, end_row + 1)]
+    merge_utils.apply_vertical_runs(worksheet, col_idx, start_row, merge_utils.plan_vertical_runs(values, skip_blank_text=True))
 
 
 def find_footer(worksheet: Worksheet, footer_rules: Dict[str, Any]) -> Optional[Dict[str, Any]]:
@@ -605,11 +432,7 @@ def find_footer(worksheet: Worksheet, footer_rules: Dict[str, Any]) -> Optional[
                     cell = worksheet.cell(row=r_idx, column=c_idx)
                     # If it's a merged cell, only check the top-left origin cell of the merge range
                     if isinstance(cell, openpyxl.cell.cell.MergedCell):
-                        is_origin = False
-                        for merged_range in worksheet.merged_cells.ranges:
-                            if merged_range.min_row == r_idx and merged_range.min_col == c_idx:
-                                is_origin = True; break
-                        if not is_origin: continue # Skip if not the top-left cell
+                        if merge_index(worksheet).starting_at(r_idx, c_idx) is None: continue # Skip if not the top-left cell
                     cell_value_str = str(cell.value) if cell.value is not None else ""
                 except IndexError: continue # Should not happen with max_column check, but safety first
                 found = False
@@ -878,10 +701,9 @@ def apply_explicit_data_cell_merges_by_id(
 
         try:
             # Unmerge any existing ranges in the target area
-            for mc_range in list(worksheet.merged_cells.ranges):
+            for mc_range in merge_index(worksheet).overlapping(row_num, row_num, start_col_idx, end_col_idx):
                 if mc_range.min_row == row_num and mc_range.max_row == row_num:
-                    if mc_range.min_col <= end_col_idx and mc_range.max_col >= start_col_idx:
-                        worksheet.unmerge_cells(str(mc_range))
+                    worksheet.unmerge_cells(str(mc_range))
             
             # Apply the new merge
             worksheet.merge_cells(start_row=row_num, start_column=start_col_idx,
@@ -963,6 +785,10 @@ def prepare_data_rows(
         num_data_rows_from_source = len(fob_data)
         id_to_data_key_map = {"col_po": "combined_po", "col_item": "combined_item", "col_desc": "combined_description", "col_qty_sf": "total_sqft", "col_amount": "total_amount"}
         price_col_idx = column_id_map.get("col_unit_price")
+        # Fallback rule per column ID, looked up once instead of per empty cell (first rule wins)
+        rules_by_id = {}
+        for rule in dynamic_mapping_rules.values():
+            rules_by_id.setdefault(rule.get("id"), rule)
         
         for row_key in sorted(fob_data.keys()):
             row_value_dict = fob_data.get(row_key, {})
@@ -979,12 +805,7 @@ def prepare_data_rows(
                     if col_id == "col_desc":
                         dynamic_desc_used = True
                 else:
-                    mapping_rule_for_id = {}
-                    for rule in dynamic_mapping_rules.values():
-                        if rule.get("id") == col_id:
-                            mapping_rule_for_id = rule
-                            break
-                    _apply_fallback(row_dict, target_col_idx, mapping_rule_for_id, fob_mode)
+                    _apply_fallback(row_dict, target_col_idx, rules_by_id.get(col_id, {}), fob_mode)
 
             if price_col_idx:
                 row_dict[price_col_idx] = {"type": "formula", "template": "{col_ref_1}{row}/{col_ref_0}{row}", "inputs": ["col_qty_sf", "col_amount"]}
@@ -1481,16 +1302,9 @@ def _style_row_before_footer(
     except Exception as e:
         print(f"Warning: Could not set row height for row {row_num}. Error: {e}")
 
-    # --- START: Refactored Logic ---
-    # Define the two border styles needed for this row
-    thin_side = Side(border_style="thin", color="000000")
-    
-    # Style 1: Full border for all columns except the first
-    full_thin_border = Border(left=thin_side, right=thin_side, top=thin_side, bottom=thin_side)
-    
-    # Style 2: Side-only border for the first column
-    side_only_border = Border(left=thin_side, right=thin_side)
-    # --- END: Refactored Logic ---
+    # Full border for all columns except the first, which gets side borders only
+    full_thin_border = style_utils.full_grid_border
+    side_only_border = style_utils.sides_only_border
 
     # Iterate through each column of the row to apply cell-level styles
     for c_idx in range(1, num_columns + 1):
@@ -1516,6 +1330,162 @@ def _style_row_before_footer(
 
 
 
+def plan_data_rows(
+    data_start_row: int,
+    num_rows: int,
+    data_rows_prepared: List[Dict[int, Any]],
+    pallet_counts_for_rows: List[int],
+    num_columns: int,
+    column_id_map: Dict[str, int],
+    col1_index: int,
+    static_col1_values: List[Any],
+    local_chunk_pallets: int,
+    apply_special_border_rule: bool = False,
+    sheet_styling_config: Optional[Dict[str, Any]] = None,
+    data_cell_merging_rules: Optional[Dict[str, Any]] = None,
+    vertical_merge_ids: Optional[List[str]] = None,
+    fob_mode: Optional[bool] = False,
+) -> RenderPlan:
+    """
+    Compiles the data rows of a table into a RenderPlan without touching the worksheet:
+    the value, style and border of every cell, the explicit per-row merges from
+    data_cell_merging_rules, the vertical merges of equal adjacent values in the
+    vertical_merge_ids columns and the "data_default" row height.
+
+    Data rows are freshly inserted, so every cell is planned as starting from the General format.
+    """
+    plan = RenderPlan()
+    if num_rows <= 0:
+        return plan
+
+    idx_to_id_map = {v: k for k, v in column_id_map.items()}
+    no_col_idx = column_id_map.get("col_no")
+    pallet_info_col_idx = column_id_map.get("col_pallet")
+    num_static_labels = len(static_col1_values)
+    force_text_format_ids = sheet_styling_config.get("force_text_format_ids", []) if sheet_styling_config else []
+    grid_column_ids = sheet_styling_config.get("column_ids_with_full_grid", []) if sheet_styling_config else []
+
+    # --- Per-column styling, resolved once for all rows ---
+    column_styles = {}
+    for c_idx in range(1, num_columns + 1):
+        column_id = idx_to_id_map.get(c_idx)
+        if sheet_styling_config and column_id:
+            try:
+                column_styles[c_idx] = style_utils.compile_styles(sheet_styling_config).column(column_id)
+            except Exception as style_err:
+                print(f"Error applying cell style for ID {column_id}: {style_err}")
+
+    # --- Explicit horizontal merges, resolved once for all rows ---
+    merge_spans = {} # start column -> end column
+    for col_id, rule_details in (data_cell_merging_rules or {}).items():
+        colspan_to_apply = rule_details.get("rowspan")
+        if not isinstance(colspan_to_apply, int) or colspan_to_apply <= 1:
+            continue
+        start_col_idx = column_id_map.get(col_id)
+        if not start_col_idx:
+            print(f"Warning: Could not find column for merge rule with ID '{col_id}'.")
+            continue
+        end_col_idx = min(start_col_idx + colspan_to_apply - 1, num_columns)
+        if start_col_idx < end_col_idx:
+            merge_spans[start_col_idx] = end_col_idx
+    covered_cols = {c for start_col_idx, end_col_idx in merge_spans.items() for c in range(start_col_idx + 1, end_col_idx + 1)}
+
+    # --- Values of the vertically merged columns, collected while planning ---
+    vertical_values: Dict[int, List[Any]] = {}
+    for col_id in vertical_merge_ids or []:
+        col_idx = column_id_map.get(col_id)
+        if col_idx and col_idx not in vertical_values:
+            vertical_values[col_idx] = []
+
+    data_row_height = None
+    row_heights_cfg = sheet_styling_config.get("row_heights") if sheet_styling_config else None
+    if isinstance(row_heights_cfg, dict) and row_heights_cfg.get("data_default") is not None:
+        try:
+            data_row_height = float(row_heights_cfg["data_default"])
+        except (ValueError, TypeError):
+            pass # Ignore invalid height values
+    if data_row_height is not None and data_row_height <= 0:
+        data_row_height = None
+
+    row_pallet_index = 0
+    for i in range(num_rows):
+        target_row = data_start_row + i
+        row_data_dict = data_rows_prepared[i] if i < len(data_rows_prepared) else {}
+        is_last_data_row = (i == num_rows - 1)
+
+        current_row_pallet_count = pallet_counts_for_rows[i] if i < len(pallet_counts_for_rows) else 0
+        if current_row_pallet_count is not None and current_row_pallet_count > 0:
+            row_pallet_index += 1
+
+        for c_idx in range(1, num_columns + 1):
+            current_id = idx_to_id_map.get(c_idx)
+
+            # --- Value ---
+            if i < num_static_labels and c_idx == col1_index:
+                value_to_write = static_col1_values[i]
+            else:
+                prepared_value = row_data_dict.get(c_idx)
+                if isinstance(prepared_value, dict) and prepared_value.get("type") == "formula":
+                    formula_template = prepared_value.get("template")
+                    formula_params = {'row': target_row}
+                    valid_inputs = True
+                    for idx, input_id in enumerate(prepared_value.get("inputs", [])):
+                        input_col_idx = column_id_map.get(input_id)
+                        if input_col_idx:
+                            formula_params[f'col_ref_{idx}'] = get_column_letter(input_col_idx)
+                        else:
+                            valid_inputs = False; break
+                    if valid_inputs and formula_template:
+                        value_to_write = f"={formula_template.format(**formula_params)}"
+                    else:
+                        value_to_write = "#REF!"
+                elif c_idx == no_col_idx:
+                    value_to_write = i + 1
+                elif c_idx == pallet_info_col_idx:
+                    value_to_write = f"{row_pallet_index}-{local_chunk_pallets}"
+                else:
+                    value_to_write = prepared_value
+
+            # --- Style ---
+            font = alignment = None
+            number_format = FORMAT_TEXT if current_id in force_text_format_ids else None
+            column_style = column_styles.get(c_idx)
+            if column_style is not None:
+                font, alignment = column_style.font, column_style.alignment
+                resolved_format = _resolve_number_format(current_id, column_style.number_format,
+                                                         number_format or FORMAT_GENERAL, value_to_write, fob_mode)
+                if resolved_format is not None:
+                    number_format = resolved_format
+
+            if apply_special_border_rule and c_idx == col1_index:
+                border = style_utils.side_border(top=(i == 0))
+            elif current_id and current_id in grid_column_ids:
+                border = thin_border
+            else:
+                border = style_utils.side_border(top=(i == 0), bottom=is_last_data_row)
+
+            plan.add_cell(target_row, c_idx, value_to_write, plan.style_id(font, alignment, border, number_format))
+            if c_idx in vertical_values:
+                # A cell inside a horizontal merge reads back as empty, so it never merges vertically
+                vertical_values[c_idx].append(None if c_idx in covered_cols else value_to_write)
+
+            # The merged anchor keeps its column font and number format, centered with a full grid
+            end_col_idx = merge_spans.get(c_idx)
+            if end_col_idx is not None:
+                plan.add_merge(target_row, c_idx, target_row, end_col_idx,
+                               plan.style_id(font, center_alignment, thin_border, number_format))
+
+        if data_row_height is not None:
+            plan.set_row_height(target_row, data_row_height)
+
+    # Vertical merges go after the horizontal ones; their anchors keep the style they get when merged
+    for col_idx, values in vertical_values.items():
+        for first, last in merge_utils.plan_vertical_runs(values, skip_blank_text=True):
+            plan.add_merge(data_start_row + first, col_idx, data_start_row + last, col_idx)
+
+    return plan
+
+
 def fill_invoice_data(
     worksheet: Worksheet,
     sheet_name: str,
@@ -1548,7 +1518,7 @@ def fill_invoice_data(
 
     # --- Initialize Variables --- (Keep existing initializations)
     actual_rows_to_process = 0; data_rows_prepared = []; col1_index = 1; num_static_labels = 0
-    static_column_header_name = None; data_row_indices_written = [];
+    static_column_header_name = None
     columns_to_grid = []
     desc_col_idx = None
     local_chunk_pallets = 0
@@ -1720,7 +1690,7 @@ def fill_invoice_data(
         if data_source_type in ['aggregation', 'fob_aggregation', "custom_aggregation"]:
             if total_rows_to_insert > 0:
                 try:
-                    worksheet.insert_rows(data_writing_start_row, amount=total_rows_to_insert)
+                    merge_utils.insert_rows(worksheet, data_writing_start_row, total_rows_to_insert)
                     # Unmerge the block covering the inserted rows *before* the footer starts
                     safe_unmerge_block(worksheet, data_writing_start_row, footer_row_final - 1, num_columns)
                     print("Rows inserted and unmerged successfully.")
@@ -1750,151 +1720,33 @@ def fill_invoice_data(
             # --- Create a reverse map from index to ID for easy lookups inside the loop ---
             idx_to_id_map = {v: k for k, v in col_id_map.items()}
 
-            # --- Get column indices directly using their stable IDs ---
-            no_col_idx = col_id_map.get("col_no")
-            pallet_info_col_idx = col_id_map.get("col_pallet")
-            
-            # Get the list of column IDs that need to be formatted as text
-            force_text_format_ids = sheet_styling_config.get("force_text_format_ids", []) if sheet_styling_config else []
-            
-            # Get the list of column IDs that should have a full grid border
-            grid_column_ids = sheet_styling_config.get("column_ids_with_full_grid", []) if sheet_styling_config else []
-
-            row_pallet_index = 0
-            
-            # --- Main Data-Writing Loop ---
-            for i in range(actual_rows_to_process):
-                target_row = data_start_row + i
-                data_row_indices_written.append(target_row)
-                row_data_dict = data_rows_prepared[i] if i < len(data_rows_prepared) else {}
-                is_last_data_row = (i == actual_rows_to_process - 1)
-
-                # --- Pallet Count Logic (remains the same) ---
-                current_row_pallet_count = pallet_counts_for_rows[i] if i < len(pallet_counts_for_rows) else 0
-                if current_row_pallet_count is not None and current_row_pallet_count > 0:
-                    row_pallet_index += 1
-                display_pallet_order = row_pallet_index
-                
-                # --- Cell Filling and Styling Loop ---
-                for c_idx in range(1, num_columns + 1):
-                    cell = worksheet.cell(row=target_row, column=c_idx)
-                    current_id = idx_to_id_map.get(c_idx)
-                    value_to_write = None
-
-                    # --- Priority 1: Handle Initial Static Label Column ---
-                    if i < num_static_labels and c_idx == col1_index:
-                        cell.value = initial_static_col1_values[i]
-                    
-                    # --- Priority 2: Handle Regular Data Rows ---
-                    else:
-                        # Get the value that was prepared by the "kitchen"
-                        prepared_value = row_data_dict.get(c_idx)
-                        value_to_write = None
-
-                        # First, check if the prepared value is a formula hint
-                        if isinstance(prepared_value, dict) and prepared_value.get("type") == "formula":
-                            rule = prepared_value
-                            formula_template = rule.get("template")
-                            input_ids = rule.get("inputs", [])
-                            formula_params = {'row': target_row}
-                            valid_inputs = True
-                            for idx, input_id in enumerate(input_ids):
-                                input_col_idx = col_id_map.get(input_id)
-                                if input_col_idx:
-                                    formula_params[f'col_ref_{idx}'] = get_column_letter(input_col_idx)
-                                else:
-                                    valid_inputs = False; break
-                            
-                            if valid_inputs and formula_template:
-                                value_to_write = f"={formula_template.format(**formula_params)}"
-                            else:
-                                value_to_write = "#REF!"
-                        
-                        # If not a hint, check for your original special columns
-                        elif c_idx == no_col_idx:
-                            value_to_write = i + 1
-                        elif c_idx == pallet_info_col_idx:
-                            value_to_write = f"{display_pallet_order}-{local_chunk_pallets}"
-
-                        # If none of the above, it's just plain data
-                        else:
-                            value_to_write = prepared_value
-                        
-                        # Finally, write the chosen value to the cell once
-                        cell.value = value_to_write
-                    # --- Apply Cell Styling and Formatting ---
-                    if current_id in force_text_format_ids:
-                        cell.number_format = FORMAT_TEXT
-                    
-                    _apply_cell_style(cell, current_id, sheet_styling_config, fob_mode)
-
-                # --- Apply Border Rules for the entire row ---
-                for c_idx_border in range(1, num_columns + 1):
-                    cell_to_border = worksheet.cell(row=target_row, column=c_idx_border)
-                    border_id = idx_to_id_map.get(c_idx_border)
-                    
-                    apply_grid = border_id and border_id in grid_column_ids
-                    
-                    top_b = thin_side if i == 0 else (thin_side if apply_grid else None)
-                    bottom_b = thin_side if is_last_data_row else (thin_side if apply_grid else None)
-                    
-                    if apply_special_border_rule and c_idx_border == col1_index:
-                        cell_to_border.border = Border(left=thin_side, right=thin_side, top=(thin_side if i == 0 else None), bottom=None)
-                    elif apply_grid:
-                        cell_to_border.border = thin_border
-                    else:
-                        cell_to_border.border = Border(left=thin_side, right=thin_side, top=top_b, bottom=bottom_b)
-
-                # --- Apply explicit cell merging for this row ---
-                if data_cell_merging_rules:
-                    apply_explicit_data_cell_merges_by_id(
-                        worksheet=worksheet,
-                        row_num=target_row,
-                        column_id_map=col_id_map,
-                        num_total_columns=num_columns,
-                        merge_rules_data_cells=data_cell_merging_rules,
-                        sheet_styling_config=sheet_styling_config,
-                        fob_mode=fob_mode
-                    )
+            # Equal adjacent values are merged vertically in the pallet and HS columns, and in the
+            # description column when the layout used fallback/static descriptions
+            vertical_merge_ids = ["col_pallet", "col_hs"] if dynamic_desc_used else ["col_desc", "col_pallet", "col_hs"]
+
+            # --- Write the data rows: compile them into a render plan, then apply it in one sweep ---
+            data_plan = plan_data_rows(
+                data_start_row=data_start_row,
+                num_rows=actual_rows_to_process,
+                data_rows_prepared=data_rows_prepared,
+                pallet_counts_for_rows=pallet_counts_for_rows,
+                num_columns=num_columns,
+                column_id_map=col_id_map,
+                col1_index=col1_index,
+                static_col1_values=initial_static_col1_values,
+                local_chunk_pallets=local_chunk_pallets,
+                apply_special_border_rule=apply_special_border_rule,
+                sheet_styling_config=sheet_styling_config,
+                data_cell_merging_rules=data_cell_merging_rules,
+                vertical_merge_ids=vertical_merge_ids,
+                fob_mode=fob_mode
+            )
+            apply_render_plan(worksheet, data_plan)
 
         except Exception as fill_data_err:
             print(f"Error during data filling loop: {fill_data_err}\n{traceback.format_exc()}")
             return False, footer_row_final + 1, data_start_row, data_end_row, 0
 
-    # Merge Description Column if the layout used fallback/static data
-        if not dynamic_desc_used and data_start_row > 0 and data_end_row > data_start_row:
-            desc_col_id = "col_desc" 
-            if col_id_map.get(desc_col_id):
-                merge_contiguous_cells_by_id(
-                    worksheet=worksheet,
-                    start_row=data_start_row,
-                    end_row=data_end_row,
-                    col_id_to_merge=desc_col_id,
-                    column_id_map=col_id_map
-                )
-
-        # Always try to merge the Pallet Info Column if it exists
-        if data_start_row > 0 and data_end_row > data_start_row:
-            pallet_col_id = "col_pallet" 
-            if col_id_map.get(pallet_col_id):
-                merge_contiguous_cells_by_id(
-                    worksheet=worksheet,
-                    start_row=data_start_row,
-                    end_row=data_end_row,
-                    col_id_to_merge=pallet_col_id,
-                    column_id_map=col_id_map
-                )
-        if data_start_row > 0 and data_end_row > data_start_row:
-            pallet_col_id = "col_hs" 
-            if col_id_map.get(pallet_col_id):
-                merge_contiguous_cells_by_id(
-                    worksheet=worksheet,
-                    start_row=data_start_row,
-                    end_row=data_end_row,
-                    col_id_to_merge=pallet_col_id,
-                    column_id_map=col_id_map
-                )
-
 # --- Fill Row Before Footer ---
         if add_blank_before_footer and row_before_footer_idx > 0:
             try:
@@ -1957,8 +1809,8 @@ def fill_invoice_data(
             except Exception as footer_merge_err:
                  print(f"Warning: Error applying footer merges: {footer_merge_err}")
 
-        # --- Apply Row Heights --- (Keep existing)
-        apply_row_heights(worksheet=worksheet, sheet_styling_config=sheet_styling_config, header_info=header_info, data_row_indices=data_row_indices_written, footer_row_index=footer_row_final, row_after_header_idx=row_after_header_idx, row_before_footer_idx=row_before_footer_idx)
+        # --- Apply Row Heights --- (Data row heights were set by the render plan)
+        apply_row_heights(worksheet=worksheet, sheet_styling_config=sheet_styling_config, header_info=header_info, data_row_indices=[], footer_row_index=footer_row_final, row_after_header_idx=row_after_header_idx, row_before_footer_idx=row_before_footer_idx)
 
         # --- Finalization --- (Keep existing)
         next_available_row_final = footer_row_final + 1
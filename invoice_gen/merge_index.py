@@ -0,0 +1,127 @@
+# merge_index.py
+# Row-bucketed index over a worksheet's merged ranges.
+#
+# openpyxl keeps merged ranges in worksheet.merged_cells, a plain set wrapped in a
+# MultiCellRange: every "which merges touch rows X..Y" question is a linear scan, and
+# so is the duplicate check inside every merge_cells() call. Packing lists with many
+# tables carry hundreds of merges and ask that question per footer, spacer and table.
+#
+# merge_index(worksheet) swaps worksheet.merged_cells for an IndexedMergedCells, a
+# drop-in MultiCellRange subclass. Worksheet.merge_cells/unmerge_cells go through its
+# add()/remove(), so the index stays current whoever merges or unmerges afterwards.
+# Only the membership set is indexed: code that moves a range in place (CellRange.shift)
+# must remove() it first and add() it back, or call rebuild().
+
+from typing import Dict, Iterable, List, Optional, Set
+
+from openpyxl.worksheet.cell_range import CellRange, MultiCellRange
+from openpyxl.worksheet.worksheet import Worksheet
+
+# Rows per bucket. Most merges are one row high, so a range usually lives in one bucket.
+BUCKET_ROWS = 32
+
+
+class IndexedMergedCells(MultiCellRange):
+    """MultiCellRange that also files each range under the row buckets it covers."""
+
+    def __init__(self, ranges=set()):
+        super().__init__(ranges)
+        self._buckets: Dict[int, Set[CellRange]] = {}
+        self.rebuild()
+
+    def rebuild(self):
+        """Re-files every range; needed only after ranges were modified in place."""
+        self._buckets = {}
+        for cell_range in self.ranges:
+            self._file(cell_range)
+
+    def _file(self, cell_range: CellRange):
+        for bucket in range(cell_range.min_row // BUCKET_ROWS, cell_range.max_row // BUCKET_ROWS + 1):
+            self._buckets.setdefault(bucket, set()).add(cell_range)
+
+    def _unfile(self, cell_range: CellRange):
+        for bucket in range(cell_range.min_row // BUCKET_ROWS, cell_range.max_row // BUCKET_ROWS + 1):
+            members = self._buckets.get(bucket)
+            if members is not None:
+                members.discard(cell_range)
+                if not members:
+                    del self._buckets[bucket]
+
+    def _candidates(self, min_row: int, max_row: Optional[int]) -> Set[CellRange]:
+        first_bucket = min_row // BUCKET_ROWS
+        if max_row is None:
+            buckets: Iterable[int] = [b for b in self._buckets if b >= first_bucket]
+        else:
+            buckets = range(first_bucket, max_row // BUCKET_ROWS + 1)
+        found: Set[CellRange] = set()
+        for bucket in buckets:
+            members = self._buckets.get(bucket)
+            if members:
+                found.update(members)
+        return found
+
+    def overlapping(self, min_row: int, max_row: Optional[int] = None,
+                    min_col: int = 1, max_col: Optional[int] = None) -> List[CellRange]:
+        """
+        Merged ranges sharing at least one cell with rows min_row..max_row and
+        columns min_col..max_col (None = unbounded), ordered by position.
+        """
+        matches = [
+            r for r in self._candidates(min_row, max_row)
+            if r.max_row >= min_row and (max_row is None or r.min_row <= max_row)
+            and r.max_col >= min_col and (max_col is None or r.min_col <= max_col)
+        ]
+        matches.sort(key=lambda r: (r.min_row, r.min_col))
+        return matches
+
+    def starting_at(self, row: int, column: int) -> Optional[CellRange]:
+        """The merged range whose top-left cell is (row, column), if any."""
+        for cell_range in self._candidates(row, row):
+            if cell_range.min_row == row and cell_range.min_col == column:
+                return cell_range
+        return None
+
+    # --- MultiCellRange overrides: keep the buckets in step with the set ---
+
+    def __contains__(self, coord):
+        if isinstance(coord, str):
+            coord = CellRange(coord)
+        return any(coord <= r for r in self._candidates(coord.min_row, coord.max_row))
+
+    def add(self, coord):
+        cr = coord
+        if isinstance(coord, str):
+            cr = CellRange(coord)
+        elif not isinstance(coord, CellRange):
+            raise ValueError("You can only add CellRanges")
+        if cr not in self:
+            self.ranges.add(cr)
+            self._file(cr)
+
+    def remove(self, coord):
+        if not isinstance(coord, CellRange):
+            coord = CellRange(coord)
+        self.ranges.remove(coord)
+        self._unfile(coord)
+
+
+def merge_index(worksheet: Worksheet) -> IndexedMergedCells:
+    """Returns the worksheet's merge index, installing it on first use."""
+    merged_cells = worksheet.merged_cells
+    if not isinstance(merged_cells, IndexedMergedCells):
+        merged_cells = IndexedMergedCells(merged_cells.ranges)
+        worksheet.merged_cells = merged_cells
+    return merged_cells
+
+
+def unmerge_overlapping(worksheet: Worksheet, min_row: int, max_row: Optional[int] = None,
+                        min_col: int = 1, max_col: Optional[int] = None) -> int:
+    """Unmerges every merged range overlapping the given block. Returns how many were removed."""
+    removed = 0
+    for cell_range in merge_index(worksheet).overlapping(min_row, max_row, min_col, max_col):
+        try:
+            worksheet.unmerge_cells(cell_range.coord)
+            removed += 1
+        except (KeyError, ValueError):
+            pass # Already gone
+    return removed
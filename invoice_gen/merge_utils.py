@@ -1,198 +1,84 @@
-import openpyxl
-import traceback
+import re
 from openpyxl.worksheet.worksheet import Worksheet
 from openpyxl.styles import Alignment
-from openpyxl.utils import range_boundaries, get_column_letter, column_index_from_string
-# from openpyxl.worksheet.dimensions import RowDimension # Not strictly needed for access
-from typing import Dict, List, Optional, Tuple, Any
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+from merge_index import merge_index
 
-center_alignment = Alignment(horizontal='center', vertical='center')# --- store_original_merges FILTERED to ignore merges ABOVE row 16 ---
-def store_original_merges(workbook: openpyxl.Workbook, sheet_names: List[str]) -> Dict[str, List[Tuple[int, Any, Optional[float]]]]:
-    """
-    Stores the HORIZONTAL span (colspan), the value of the top-left cell,
-    and the height of the starting row for merged ranges in specified sheets,
-    ASSUMING all merges are only 1 row high AND **start at row 16 or below**.
-    Merges starting above row 16 (row < 16) are ignored.
-    WARNING: Does NOT store starting coordinates... (rest of docstring unchanged)
+center_alignment = Alignment(horizontal='center', vertical='center')
 
-    Args: (args unchanged)
+# A range reference qualified with a sheet name, e.g. 'Packing list'!$A$1:$J$41 or Invoice!B5
+_SHEET_REFERENCE_RE = re.compile(r"(?:'((?:[^']|'')+)'|([A-Za-z_][\w.]*))!(\$?[A-Z]{1,3}\$?\d+(?::\$?[A-Z]{1,3}\$?\d+)?)")
+_CELL_ROW_RE = re.compile(r"(\$?[A-Z]{1,3}\$?)(\d+)")
 
-    Returns:
-        A dictionary where keys are sheet names and values are lists of
-        tuples: (col_span, top_left_cell_value, row_height).
-        row_height will be None if the original row had default height.
-    """
-    original_merges = {}
-    print("\nStoring original merge horizontal spans, top-left values, and row heights (NO coordinates)...")
-    print("  (Ignoring merges that start above row 16)") # Updated filter info
-    for sheet_name in sheet_names:
-        if sheet_name in workbook.sheetnames:
-            worksheet: Worksheet = workbook[sheet_name] # Type hint for clarity
-            merges_data = []
-            merged_ranges_copy = list(worksheet.merged_cells.ranges)
-            skipped_above_16_count = 0 # Counter for this filter
-
-            for merged_range in merged_ranges_copy:
-                min_col, min_row, max_col, max_row = merged_range.bounds
-
-                # --- Check 1: Skip if multi-row ---
-                if max_row != min_row:
-                    # print(f"  Skipping merge {merged_range.coord} on sheet '{sheet_name}' - it spans multiple rows ({min_row} to {max_row}).")
-                    continue
-
-                # ***** NEW CHECK 2: Skip if merge starts ABOVE row 16 *****
-                if min_row < 16:
-                    # print(f"  Skipping merge {merged_range.coord} on sheet '{sheet_name}' - starts at row {min_row} (above row 16).") # Keep commented unless needed
-                    skipped_above_16_count += 1
-                    continue
-                # ***** END NEW CHECK *****
-
-                # --- If not skipped, proceed to get span, height, value ---
-                col_span = max_col - min_col + 1
-                row_height = None # Default to None
-                try:
-                    # Get Row Height
-                    row_dim = worksheet.row_dimensions[min_row]
-                    row_height = row_dim.height
-                    # print(f"    DEBUG Store: Sheet='{sheet_name}', MergeCoord='{merged_range.coord}', StartRow={min_row}, Storing Height={row_height} (Type: {type(row_height)})")
-
-                    # Get Value
-                    top_left_value = worksheet.cell(row=min_row, column=min_col).value
-
-                    # Store Data (span, value, height)
-                    merges_data.append((col_span, top_left_value, row_height))
-
-                except KeyError:
-                     print(f"    Warning: Could not find row dimension for row {min_row} on sheet '{sheet_name}' while getting height. Storing height as None.")
-                     try:
-                         top_left_value = worksheet.cell(row=min_row, column=min_col).value
-                     except Exception as val_e:
-                         print(f"    Warning: Also failed to get value for merge at ({min_row},{min_col}) on sheet '{sheet_name}'. Storing value as None. Error: {val_e}")
-                         top_left_value = None
-                     merges_data.append((col_span, top_left_value, None))
-
-                except Exception as e:
-                    print(f"    Warning: Could not get value/height for merge starting at ({min_row},{min_col}) on sheet '{sheet_name}'. Storing value/height as None. Error: {e}")
-                    merges_data.append((col_span, None, None))
-
-            original_merges[sheet_name] = merges_data
-            print(f"  Stored {len(original_merges[sheet_name])} horizontal merge span/value/height entries for sheet '{sheet_name}'.")
-            # Report skipped count for this filter
-            if skipped_above_16_count > 0:
-                print(f"    (Skipped {skipped_above_16_count} merges starting above row 16)")
-        else:
-             print(f"  Warning: Sheet '{sheet_name}' specified but not found during merge storage.")
-             original_merges[sheet_name] = []
-    return original_merges
-
-# --- find_and_restore_merges_heuristic remains unchanged (still searches bottom-up, applies stored value/height) ---
-def find_and_restore_merges_heuristic(workbook: openpyxl.Workbook,
-                                      stored_merges: Dict[str, List[Tuple[int, Any, Optional[float]]]],
-                                      processed_sheet_names: List[str],
-                                      search_range_str: str = "A16:H200"):
+
+def _shift_range_rows(range_ref: str, idx: int, amount: int) -> str:
+    """Shifts every row number >= idx in a range like $A$1:$G$30 by amount."""
+    def shift(match):
+        row = int(match.group(2))
+        return f"{match.group(1)}{row + amount if row >= idx else row}"
+    return _CELL_ROW_RE.sub(shift, range_ref)
+
+
+def _shift_sheet_references(text: str, sheet_title: str, idx: int, amount: int) -> str:
+    """Shifts the rows of every reference in text that points at sheet_title."""
+    def shift(match):
+        name = match.group(1).replace("''", "'") if match.group(1) is not None else match.group(2)
+        if name != sheet_title:
+            return match.group(0)
+        return match.group(0)[:match.start(3) - match.start(0)] + _shift_range_rows(match.group(3), idx, amount)
+    return _SHEET_REFERENCE_RE.sub(shift, text)
+
+
+def insert_rows(worksheet: Worksheet, idx: int, amount: int = 1):
     """
-    Attempts to restore merges based on stored HORIZONTAL spans, values, and row heights
-    by searching for the value within a specified range (default A16:H200).
-    This version is silent, with no detailed logging.
+    Inserts rows like Worksheet.insert_rows, but keeps the sheet layout attached to its rows.
 
-    WARNING: This is a HEURISTIC approach... (rest of docstring unchanged)
+    openpyxl only moves cells; this also shifts, in one pass over each:
+      - merged ranges starting at or below idx (ranges spanning idx grow by amount),
+      - row dimensions (heights, hidden flags) at or below idx,
+      - the print area and defined names that reference this sheet.
 
-    Args: (args unchanged)
+    Args:
+        worksheet: The openpyxl Worksheet object to modify.
+        idx: The 1-based row index before which the new rows are inserted.
+        amount: The number of rows to insert.
     """
-    print("Starting merge restoration process...")
-
-    # These counters are still used by the logic but are no longer printed.
-    restored_count = 0
-    failed_count = 0
-    skipped_count = 0
-    skipped_duplicate_value_count = 0
-
-    # --- Define search boundaries (critical errors are still reported) ---
-    try:
-        search_min_col, search_min_row, search_max_col, search_max_row = range_boundaries(search_range_str)
-    except TypeError as te:
-        print(f"Error processing search range '{search_range_str}'. Check openpyxl version compatibility or range format. Internal error: {te}")
-        traceback.print_exc()
+    if amount <= 0:
         return
-    except Exception as e:
-        print(f"Error: Invalid search range string '{search_range_str}'. Cannot proceed with restoration. Error: {e}")
-        return
-
-    # --- Loop through sheets ---
-    for sheet_name in processed_sheet_names:
-        if sheet_name in workbook.sheetnames and sheet_name in stored_merges:
-            worksheet: Worksheet = workbook[sheet_name]
-            original_merges_data = stored_merges[sheet_name]
-            successfully_restored_values_on_sheet = set()
-
-            # --- Loop through stored merge info ---
-            for col_span, stored_value, stored_height in original_merges_data:
-
-                if col_span <= 1:
-                    skipped_count += 1
-                    continue
-
-                if stored_value in successfully_restored_values_on_sheet:
-                    skipped_duplicate_value_count += 1
-                    continue
-
-                found = False
-                # --- Search range loop - ROW SEARCH REVERSED ---
-                for r in range(search_max_row, search_min_row - 1, -1):
-                    for c in range(search_min_col, search_max_col + 1):
-                        current_cell = worksheet.cell(row=r, column=c)
-                        current_val = current_cell.value
-
-                        if current_val == stored_value:
-                            start_row, start_col = r, c
-                            end_row = start_row
-                            end_col = start_col + col_span - 1
-
-                            # --- Proactively unmerge any conflicting ranges ---
-                            merged_ranges_copy = list(worksheet.merged_cells.ranges)
-                            for existing_merge in merged_ranges_copy:
-                                rows_overlap = (existing_merge.min_row <= end_row) and (existing_merge.max_row >= start_row)
-                                cols_overlap = (existing_merge.min_col <= end_col) and (existing_merge.max_col >= start_col)
-
-                                if rows_overlap and cols_overlap:
-                                    try:
-                                        worksheet.unmerge_cells(str(existing_merge))
-                                    except Exception:
-                                        # Fails silently as requested
-                                        pass
-
-                            # --- Apply the new merge, Row Height, AND Value ---
-                            try:
-                                worksheet.merge_cells(start_row=start_row, start_column=start_col, end_row=end_row, end_column=end_col)
-
-                                if stored_height is not None:
-                                    try:
-                                        worksheet.row_dimensions[start_row].height = stored_height
-                                    except Exception:
-                                        # Fails silently
-                                        pass
-
-                                top_left_cell_to_set = worksheet.cell(row=start_row, column=start_col)
-                                top_left_cell_to_set.value = stored_value
-
-                                successfully_restored_values_on_sheet.add(stored_value)
-                                restored_count += 1
-                                found = True
-                                break
-
-                            except Exception:
-                                failed_count += 1
-                                found = True
-                                break
-
-                    if found:
-                        break
-
-                if not found:
-                    if stored_value not in successfully_restored_values_on_sheet:
-                        failed_count += 1
-
-    print("Merge restoration process finished.")
+    worksheet.insert_rows(idx, amount=amount)
+
+    # Merged ranges: the cells (including MergedCell placeholders) already moved with insert_rows.
+    # Bottom-up, so a range is never re-added onto one that has not moved yet.
+    index = merge_index(worksheet)
+    for merged_range in reversed(index.overlapping(idx)):
+        if merged_range.min_row >= idx:
+            index.remove(merged_range)
+            merged_range.shift(row_shift=amount)
+            index.add(merged_range)
+        else:
+            # Spans the insertion point: grow it over the new rows, as Excel does.
+            # Its lower cells have already moved, so drop it directly instead of unmerge_cells.
+            index.remove(merged_range)
+            worksheet.merge_cells(start_row=merged_range.min_row, start_column=merged_range.min_col,
+                                  end_row=merged_range.max_row + amount, end_column=merged_range.max_col)
+
+    # Row dimensions, moved bottom-up so no row overwrites one that still has to move
+    row_dimensions = worksheet.row_dimensions
+    for row_idx in sorted((r for r in row_dimensions if r >= idx), reverse=True):
+        dimension = row_dimensions.pop(row_idx)
+        dimension.index = row_idx + amount
+        row_dimensions[row_idx + amount] = dimension
+
+    # Print area and defined names
+    print_area = worksheet.print_area
+    if print_area:
+        worksheet.print_area = [_shift_range_rows(match.group(3), idx, amount)
+                                for match in _SHEET_REFERENCE_RE.finditer(print_area)]
+    workbook = worksheet.parent
+    for defined_names in (workbook.defined_names, worksheet.defined_names):
+        for defined_name in defined_names.values():
+            if defined_name.value:
+                defined_name.value = _shift_sheet_references(defined_name.value, worksheet.title, idx, amount)
 
 
 def force_unmerge_from_row_down(worksheet: Worksheet, start_row: int):
@@ -209,12 +95,9 @@ def force_unmerge_from_row_down(worksheet: Worksheet, start_row: int):
     """
     print(f"--- Selectively unmerging cells from row {start_row} downwards on sheet '{worksheet.title}' ---")
     
-    # Create a copy of the list to avoid issues while modifying it
-    all_merged_ranges = list(worksheet.merged_cells.ranges)
     unmerged_count = 0
-    
-    for merged_range in all_merged_ranges:
-        # The key condition: only unmerge if the merge starts in the target zone.
+    # Only merges that start in the target zone; the index hands back a list, so unmerging is safe
+    for merged_range in merge_index(worksheet).overlapping(start_row):
         if merged_range.min_row >= start_row:
             try:
                 worksheet.unmerge_cells(str(merged_range))
@@ -269,9 +152,54 @@ def apply_row_merges(worksheet: Worksheet, row_num: int, num_cols: int, merge_ru
             continue
 
 
+def plan_vertical_runs(values: Sequence[Any], skip_blank_text: bool = False) -> List[Tuple[int, int]]:
+    """
+    Run-length groups of a column's values, computed before (or without) reading the sheet.
+
+    Args:
+        values: The column's values, top to bottom.
+        skip_blank_text: Also leave out runs of whitespace-only text.
+
+    Returns:
+        (first, last) offsets into values of every run of 2+ equal adjacent values,
+        leaving out runs of None.
+    """
+    runs = []
+    first = 0
+    while first < len(values):
+        value_to_match = values[first]
+        last = first
+        while last + 1 < len(values) and values[last + 1] == value_to_match:
+            last += 1
+        if last > first and value_to_match is not None and not (skip_blank_text and not str(value_to_match).strip()):
+            runs.append((first, last))
+        first = last + 1
+    return runs
+
+
+def apply_vertical_runs(worksheet: Worksheet, col: int, start_row: int, runs: Iterable[Tuple[int, int]],
+                        anchor_alignment: Optional[Alignment] = None) -> int:
+    """
+    Merges each planned run (offsets from start_row) in one column, one merge per run.
+    Returns how many merges were made.
+    """
+    merged = 0
+    for first, last in runs:
+        try:
+            worksheet.merge_cells(start_row=start_row + first, start_column=col,
+                                  end_row=start_row + last, end_column=col)
+            if anchor_alignment is not None:
+                worksheet.cell(row=start_row + first, column=col).alignment = anchor_alignment
+            merged += 1
+        except Exception as e:
+            print(f"Could not merge column {col} from row {start_row + first} to {start_row + last}. Error: {e}")
+    return merged
+
+
 def merge_vertical_cells_in_range(worksheet: Worksheet, scan_col: int, start_row: int, end_row: int):
     """
     Scans a single column and merges adjacent cells that have the same value.
+    When the values are still in memory, plan_vertical_runs + apply_vertical_runs avoid the re-read.
 
     Args:
         worksheet: The openpyxl Worksheet object.
@@ -282,39 +210,5 @@ def merge_vertical_cells_in_range(worksheet: Worksheet, scan_col: int, start_row
     if not all(isinstance(i, int) and i > 0 for i in [scan_col, start_row, end_row]) or start_row >= end_row:
         return
 
-    row_idx = start_row
-    while row_idx < end_row:
-        start_of_merge_row = row_idx
-        cell_to_match = worksheet.cell(row=start_of_merge_row, column=scan_col)
-        value_to_match = cell_to_match.value
-
-        # Skip merging for empty cells
-        if value_to_match is None:
-            row_idx += 1
-            continue
-
-        # Scan downwards to find how many cells match
-        end_of_merge_row = start_of_merge_row
-        for next_row_idx in range(start_of_merge_row + 1, end_row + 1):
-            next_cell = worksheet.cell(row=next_row_idx, column=scan_col)
-            if next_cell.value == value_to_match:
-                end_of_merge_row = next_row_idx
-            else:
-                break  # Stop when a different value is found
-
-        # If a sequence of 2 or more was found, perform the merge
-        if end_of_merge_row > start_of_merge_row:
-            try:
-                worksheet.merge_cells(
-                    start_row=start_of_merge_row,
-                    start_column=scan_col,
-                    end_row=end_of_merge_row,
-                    end_column=scan_col
-                )
-                # Apply center alignment to the merged cell
-                cell_to_match.alignment = center_alignment
-            except Exception:
-                pass  # Fails silently
-
-        # Move the main index past the just-scanned range
-        row_idx = end_of_merge_row + 1
\ No newline at end of file
+    values = [worksheet.cell(row=r, column=scan_col).value for r in range(start_row, end_row + 1)]
+    apply_vertical_runs(worksheet, scan_col, start_row, plan_vertical_runs(values), center_alignment)
@@ -1,9 +1,14 @@
 import invoice_utils
 import style_utils
 import merge_utils
+import openpyxl
+from copy import copy
+from header_block import compile_header_block
+from streaming_sheet import StreamingSheet
 from openpyxl.worksheet.worksheet import Worksheet
 from openpyxl.utils import get_column_letter
-from typing import Dict, List, Tuple
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Union
 from openpyxl.styles import Font, Alignment, Border, Side
 
 
@@ -37,9 +42,29 @@ def calculate_rows_to_generate(packing_list_data: dict, sheet_config: dict) -> i
     print(f"  Calculated that {total_generated_rows} rows will be generated.")
     return total_generated_rows
 
-def generate_full_packing_list(worksheet: Worksheet, start_row: int, packing_list_data: dict, sheet_config: dict):
+def packing_list_column_widths(sheet_config: dict) -> Dict[str, float]:
+    """The configured column widths (styling.column_id_widths, keyed by header text) by column letter."""
+    header_to_write = sheet_config.get("header_to_write", [])
+    styling_config = sheet_config.get("styling", {})
+    widths = styling_config.get("column_id_widths", {})
+    if not widths or not header_to_write:
+        return {}
+    column_id_map = compile_header_block(header_to_write, styling_config).column_id_map
+    col_map_text = {item['text']: item['id'] for item in header_to_write if 'text' in item and 'id' in item}
+    letters = {}
+    for text, width in widths.items():
+        if col_id := col_map_text.get(text):
+            if col_idx := column_id_map.get(col_id):
+                letters[get_column_letter(col_idx)] = width
+    return letters
+
+def generate_full_packing_list(worksheet: Worksheet, start_row: int, packing_list_data: dict, sheet_config: dict,
+                               stream: Optional[StreamingSheet] = None):
     """
     Generates the entire packing list content, including headers, data, and footers.
+
+    With a stream, worksheet is the stream's scratch sheet: each finished block (header,
+    data row, footer...) is flushed to the write-only output as soon as it is written.
     """
     write_pointer_row = start_row
     all_data_ranges: List[Tuple[int, int]] = []
@@ -50,6 +75,7 @@ def generate_full_packing_list(worksheet: Worksheet, start_row: int, packing_lis
     header_to_write = sheet_config.get("header_to_write", [])
     footer_config = sheet_config.get("footer_configurations", {})
     styling_config = sheet_config.get("styling", {})
+    row_heights_cfg = styling_config.get("row_heights", {})
     mappings = sheet_config.get("mappings", {})
     data_map = mappings.get("data_map", {})
     static_col_values = mappings.get("initial_static", {}).get("values", [])
@@ -62,9 +88,10 @@ def generate_full_packing_list(worksheet: Worksheet, start_row: int, packing_lis
         table_data = raw_data[table_key]
         num_data_rows = len(table_data.get('net', []))
         
-        header_info = invoice_utils.write_header(worksheet, write_pointer_row, header_to_write, styling_config)
+        header_info = invoice_utils.stamp_header(worksheet, write_pointer_row, header_to_write, styling_config)
         all_header_infos.append(header_info)
         write_pointer_row = header_info.get('second_row_index', write_pointer_row) + 1
+        if stream: stream.flush(write_pointer_row, row_heights_cfg.get('header'))
         col_map = header_info.get('column_id_map', {})
         num_columns = header_info.get('num_columns', 1)
         static_col_idx = col_map.get(mappings.get("initial_static", {}).get("column_header_id"))
@@ -75,10 +102,11 @@ def generate_full_packing_list(worksheet: Worksheet, start_row: int, packing_lis
         # Define keys that should be converted to a numeric format
         keys_to_convert_to_numeric = {'net', 'amount', 'price'}
 
+        table_rows = []
         for r_idx in range(num_data_rows):
-            current_row = write_pointer_row + r_idx
+            row_values = {}
             if static_col_idx and r_idx < len(static_col_values):
-                worksheet.cell(row=current_row, column=static_col_idx).value = static_col_values[r_idx]
+                row_values[static_col_idx] = static_col_values[r_idx]
             
             for data_key, mapping_info in data_map.items():
                 if col_idx := col_map.get(mapping_info.get("id")):
@@ -89,39 +117,54 @@ def generate_full_packing_list(worksheet: Worksheet, start_row: int, packing_lis
                         if data_key in keys_to_convert_to_numeric and isinstance(value, str):
                             try:
                                 # Remove commas and convert to float
-                                numeric_value = float(value.replace(',', ''))
-                                worksheet.cell(row=current_row, column=col_idx).value = numeric_value
+                                value = float(value.replace(',', ''))
                             except (ValueError, TypeError):
-                                # If conversion fails, write the original value
-                                worksheet.cell(row=current_row, column=col_idx).value = value
-                        else:
-                            # Write the original value for all other fields
-                            worksheet.cell(row=current_row, column=col_idx).value = value
+                                pass # If conversion fails, write the original value
+                        row_values[col_idx] = value
+            table_rows.append(row_values)
 
-            for c_idx in range(1, num_columns + 1):
-                cell = worksheet.cell(row=current_row, column=c_idx)
-                style_context = {
-                    "col_id": idx_to_id_map.get(c_idx), "col_idx": c_idx,
-                    "static_col_idx": static_col_idx, "row_index": r_idx,
-                    "num_data_rows": num_data_rows
-                }
-                style_utils.apply_cell_style(cell, styling_config, style_context)
+        # The vertical merges are planned from the values before writing, so a stream can
+        # apply them as the rows go out
+        vertical_merge_ids = mappings.get("vertical_merge_on_id", [])
+        vertical_runs = {}
+        if vertical_merge_ids:
+            print(f"Applying vertical merges for table '{table_key}'...")
+            for col_id in vertical_merge_ids:
+                if col_idx := col_map.get(col_id):
+                    vertical_runs[col_idx] = merge_utils.plan_vertical_runs([row_values.get(col_idx) for row_values in table_rows])
+        if stream:
+            for col_idx, runs in vertical_runs.items():
+                stream.add_vertical_runs(col_idx, data_start_row, runs, merge_utils.center_alignment)
+
+        # Data cell styles depend only on the column: the first row is styled, the rest copy its style arrays
+        row_styles = None
+        for r_idx, row_values in enumerate(table_rows):
+            current_row = write_pointer_row + r_idx
+            for col_idx, value in row_values.items():
+                worksheet.cell(row=current_row, column=col_idx).value = value
+
+            if row_styles is None:
+                row_styles = []
+                for c_idx in range(1, num_columns + 1):
+                    cell = worksheet.cell(row=current_row, column=c_idx)
+                    style_context = {
+                        "col_id": idx_to_id_map.get(c_idx), "col_idx": c_idx,
+                        "static_col_idx": static_col_idx, "row_index": r_idx,
+                        "num_data_rows": num_data_rows
+                    }
+                    style_utils.apply_cell_style(cell, styling_config, style_context)
+                    row_styles.append(copy(cell._style))
+            else:
+                for c_idx, style in enumerate(row_styles, 1):
+                    worksheet.cell(row=current_row, column=c_idx)._style = copy(style)
+            if stream: stream.flush(current_row + 1, row_heights_cfg.get('data_default'))
         
         write_pointer_row += num_data_rows
         all_data_ranges.append((data_start_row, write_pointer_row - 1))
 
-        data_end_row = write_pointer_row - 1
-        vertical_merge_ids = mappings.get("vertical_merge_on_id", [])
-        if vertical_merge_ids:
-            print(f"Applying vertical merges for table '{table_key}'...")
-            for col_id_to_merge in vertical_merge_ids:
-                if col_idx := col_map.get(col_id_to_merge):
-                    merge_utils.merge_vertical_cells_in_range(
-                        worksheet=worksheet,
-                        scan_col=col_idx,
-                        start_row=data_start_row,
-                        end_row=data_end_row
-                    )
+        if not stream:
+            for col_idx, runs in vertical_runs.items():
+                merge_utils.apply_vertical_runs(worksheet, col_idx, data_start_row, runs, merge_utils.center_alignment)
 
         # Write Pre-Footer Row and apply styling to the ENTIRE row
         pre_footer_config = footer_config.get("pre_footer_row")
@@ -152,6 +195,7 @@ def generate_full_packing_list(worksheet: Worksheet, start_row: int, packing_lis
                 worksheet.row_dimensions[write_pointer_row].height = data_row_height
             
             write_pointer_row += 1
+            if stream: stream.flush(write_pointer_row)
 
         # WRITE MAIN FOOTER
         pallet_count = len(table_data.get('pallet_count', []))
@@ -186,9 +230,11 @@ def generate_full_packing_list(worksheet: Worksheet, start_row: int, packing_lis
         merge_utils.apply_row_merges(worksheet, write_pointer_row, num_columns, footer_merge_rules)
         all_footer_rows.append(write_pointer_row)
         write_pointer_row += 1
+        if stream: stream.flush(write_pointer_row, row_heights_cfg.get('footer'))
 
         if i < num_tables - 1:
             write_pointer_row += 1
+            if stream: stream.flush(write_pointer_row)
 
     # --- AFTER LOOP ---
     if num_tables > 1:
@@ -225,12 +271,48 @@ def generate_full_packing_list(worksheet: Worksheet, start_row: int, packing_lis
         grand_total_merge_rules = footer_config.get("grand_total_merge_rules")
         merge_utils.apply_row_merges(worksheet, write_pointer_row, num_columns, grand_total_merge_rules)
         all_footer_rows.append(write_pointer_row)
+        if stream: stream.flush(write_pointer_row + 1, row_heights_cfg.get('footer'))
 
     # --- FINAL STYLING ---
+    # A stream has already written the heights with each block, and takes the widths up front
+    if stream:
+        return
     style_utils.apply_row_heights(worksheet, styling_config, all_header_infos, all_data_ranges, all_footer_rows)
-    widths = styling_config.get("column_id_widths", {})
-    col_map_text = {item['text']: item['id'] for item in header_to_write if 'text' in item and 'id' in item}
-    for text, width in widths.items():
-        if col_id := col_map_text.get(text):
-            if col_idx := all_header_infos[0]['column_id_map'].get(col_id):
-                worksheet.column_dimensions[get_column_letter(col_idx)].width = width
\ No newline at end of file
+    for col_letter, width in packing_list_column_widths(sheet_config).items():
+        worksheet.column_dimensions[col_letter].width = width
+
+
+def stream_packing_list(template_sheet: Worksheet, output_path: Union[str, Path], start_row: int, rows_to_add: int,
+                        packing_list_data: dict, sheet_config: dict):
+    """
+    Write-only counterpart of insert_rows + generate_full_packing_list + save: streams
+    template_sheet (a full-mode copy of the template sheet, placeholders already replaced)
+    to output_path with the packing list written over rows_to_add new rows at start_row.
+    Only the block being written is held in memory, however many rows the tables have.
+    """
+    workbook = openpyxl.Workbook(write_only=True)
+    stream = StreamingSheet(workbook, template_sheet.title)
+
+    for col_letter, dim in template_sheet.column_dimensions.items():
+        stream.set_column(col_letter, dim.width, dim.hidden)
+    for col_letter, width in packing_list_column_widths(sheet_config).items():
+        stream.set_column(col_letter, width)
+
+    # Template merges move or grow with the inserted rows, as in merge_utils.insert_rows
+    for merged_range in template_sheet.merged_cells.ranges:
+        if merged_range.min_row >= start_row:
+            stream.add_merge(f"{get_column_letter(merged_range.min_col)}{merged_range.min_row + rows_to_add}:"
+                             f"{get_column_letter(merged_range.max_col)}{merged_range.max_row + rows_to_add}")
+        elif merged_range.max_row >= start_row:
+            stream.add_merge(f"{get_column_letter(merged_range.min_col)}{merged_range.min_row}:"
+                             f"{get_column_letter(merged_range.max_col)}{merged_range.max_row + rows_to_add}")
+        else:
+            stream.add_merge(str(merged_range))
+
+    stream.copy_rows(template_sheet, 1, start_row - 1)
+    generate_full_packing_list(stream.scratch, start_row, packing_list_data, sheet_config, stream)
+    stream.flush(start_row + rows_to_add)
+
+    last_template_row = max([template_sheet.max_row, *template_sheet.row_dimensions.keys()])
+    stream.copy_rows(template_sheet, start_row, last_template_row, rows_to_add)
+    workbook.save(output_path)
\ No newline at end of file
@@ -0,0 +1,105 @@
+# render_plan.py
+# A compiled description of a block of worksheet output, applied in one ordered sweep.
+#
+# Building the plan (deciding every value, style, merge and height) is kept apart from
+# writing it, so the two phases cost and profile separately: plan building is plain
+# Python over config + data, applying is the only part that touches openpyxl.
+#
+# Cells are stored as flat parallel arrays (row, column, value, style id). Style ids
+# index an interned table of (font, alignment, border, number_format) built from the
+# shared objects in style_utils, so a plan holds a handful of styles however many
+# cells it covers. None in a style field means "leave the cell's current value".
+
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from openpyxl.styles import Alignment, Border, Font
+from openpyxl.worksheet.worksheet import Worksheet
+
+from merge_index import merge_index
+
+
+class CellStyle(NamedTuple):
+    font: Optional[Font]
+    alignment: Optional[Alignment]
+    border: Optional[Border]
+    number_format: Optional[str]
+
+
+class MergeRun(NamedTuple):
+    min_row: int
+    min_col: int
+    max_row: int
+    max_col: int
+    anchor_style_id: Optional[int] # Style given to the top-left cell once merged (None: keep it as merged)
+
+
+class RenderPlan:
+    """Cells, merges and row heights to write, in the order they are applied."""
+
+    def __init__(self):
+        self.rows: List[int] = []
+        self.cols: List[int] = []
+        self.values: List[Any] = []
+        self.style_ids: List[int] = []
+        self.styles: List[CellStyle] = []
+        self.merges: List[MergeRun] = []
+        self.row_heights: Dict[int, float] = {}
+        self._style_lookup: Dict[Tuple[int, int, int, Optional[str]], int] = {}
+
+    def style_id(self, font: Optional[Font] = None, alignment: Optional[Alignment] = None,
+                 border: Optional[Border] = None, number_format: Optional[str] = None) -> int:
+        """Interns a style. Style objects are compared by identity (they are shared, prebuilt objects)."""
+        key = (id(font), id(alignment), id(border), number_format)
+        style_id = self._style_lookup.get(key)
+        if style_id is None:
+            style_id = len(self.styles)
+            self.styles.append(CellStyle(font, alignment, border, number_format))
+            self._style_lookup[key] = style_id
+        return style_id
+
+    def add_cell(self, row: int, col: int, value: Any, style_id: int):
+        self.rows.append(row)
+        self.cols.append(col)
+        self.values.append(value)
+        self.style_ids.append(style_id)
+
+    def add_merge(self, min_row: int, min_col: int, max_row: int, max_col: int, anchor_style_id: Optional[int] = None):
+        self.merges.append(MergeRun(min_row, min_col, max_row, max_col, anchor_style_id))
+
+    def set_row_height(self, row: int, height: float):
+        self.row_heights[row] = height
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+
+def _apply_style(cell, style: CellStyle):
+    if style.font is not None: cell.font = style.font
+    if style.alignment is not None: cell.alignment = style.alignment
+    if style.border is not None: cell.border = style.border
+    if style.number_format is not None: cell.number_format = style.number_format
+
+
+def apply_render_plan(worksheet: Worksheet, plan: RenderPlan):
+    """Writes a plan: every cell in plan order, then the merges, then the row heights."""
+    styles = plan.styles
+    for row, col, value, style_id in zip(plan.rows, plan.cols, plan.values, plan.style_ids):
+        cell = worksheet.cell(row=row, column=col)
+        cell.value = value
+        _apply_style(cell, styles[style_id])
+
+    for run in plan.merges:
+        try:
+            # Replace any single-row merge already covering the target cells
+            for merged_range in merge_index(worksheet).overlapping(run.min_row, run.max_row, run.min_col, run.max_col):
+                if merged_range.min_row == run.min_row and merged_range.max_row == run.max_row:
+                    worksheet.unmerge_cells(str(merged_range))
+            worksheet.merge_cells(start_row=run.min_row, start_column=run.min_col,
+                                  end_row=run.max_row, end_column=run.max_col)
+            if run.anchor_style_id is not None:
+                _apply_style(worksheet.cell(row=run.min_row, column=run.min_col), styles[run.anchor_style_id])
+        except Exception as e:
+            print(f"Error applying merge at row {run.min_row}, columns {run.min_col}-{run.max_col}: {e}")
+
+    for row, height in plan.row_heights.items():
+        worksheet.row_dimensions[row].height = height
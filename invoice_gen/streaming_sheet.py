@@ -0,0 +1,225 @@
+# streaming_sheet.py
+# A write-only worksheet fed in row order, for sheets too long to build in memory.
+#
+# openpyxl's write-only mode appends rows straight to the output file, but each row must be
+# complete when it is appended and rows can only go forward. StreamingSheet lets the
+# regular full-mode helpers (stamp_header, write_footer_row, apply_row_merges,
+# style_utils.apply_cell_style...) keep doing the rendering: they write one block at a time
+# (a header, a data row, a footer) into a small scratch worksheet, and flush() moves the
+# finished rows, their heights and their merges to the output, then drops them. The scratch
+# sheet therefore only ever holds the block being written.
+#
+# Styles are converted once per distinct scratch style (the output gets a prebuilt style
+# array), and template rows are copied from their source sheet with copy_rows().
+#
+# Vertical merges can span thousands of data rows, so they are not rendered in the scratch
+# sheet: add_vertical_runs() registers them up front and flush() gives each flushed cell the
+# state the merge leaves it in (centered anchor; covered cells blank with the merge's edge
+# borders, as MergedCellRange.format does).
+
+from copy import copy
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import openpyxl
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.cell.cell import MergedCell
+from openpyxl.styles import Alignment, Border
+from openpyxl.utils import get_column_letter
+from openpyxl.workbook import Workbook
+from openpyxl.worksheet.worksheet import Worksheet
+
+from merge_index import merge_index
+
+
+def _covered_cell_border(anchor_border: Border, top: bool, left: bool, right: bool, bottom: bool) -> Border:
+    """The border a covered cell of a merge gets: the anchor's sides on the merge edges it lies on."""
+    border = Border()
+    for name, on_edge in (("top", top), ("left", left), ("right", right), ("bottom", bottom)):
+        side = getattr(anchor_border, name)
+        if not on_edge or (side and side.style is None):
+            continue
+        border += Border(**{name: side})
+    return border
+
+
+class _VerticalRuns:
+    """The planned vertical merges of one column, consumed top to bottom as rows are flushed."""
+
+    def __init__(self, col: int, start_row: int, runs: Iterable[Tuple[int, int]], anchor_alignment: Optional[Alignment]):
+        self.col = col
+        self.runs = [(start_row + first, start_row + last) for first, last in runs]
+        self.anchor_alignment = anchor_alignment
+        self.position = 0
+        self.covered_style: Dict[bool, Any] = {} # Style array of a covered cell, by "is on the bottom row"
+        # Memo of the restyles, by the scratch cell's style array
+        self.anchor_styles: Dict[Tuple[int, ...], Tuple[Any, Dict[bool, Any]]] = {}
+
+    def run_at(self, row: int) -> Optional[Tuple[int, int]]:
+        while self.position < len(self.runs) and self.runs[self.position][1] < row:
+            self.position += 1
+        if self.position < len(self.runs) and self.runs[self.position][0] <= row:
+            return self.runs[self.position]
+        return None
+
+    @property
+    def done(self) -> bool:
+        return self.position >= len(self.runs)
+
+
+class StreamingSheet:
+    """A write-only output worksheet plus the scratch worksheet its rows are rendered in."""
+
+    def __init__(self, workbook: Workbook, title: str):
+        self.worksheet = workbook.create_sheet(title=title)
+        self._scratch_book = openpyxl.Workbook()
+        self.scratch: Worksheet = self._scratch_book.active
+        self.scratch.title = title
+        self.next_row = 1 # Next row of the output to be written
+        self._vertical_runs: List[_VerticalRuns] = []
+        # Per source workbook: scratch/template style array -> output style array
+        self._styles: Dict[int, Dict[Tuple[int, ...], Any]] = {}
+
+    def set_column(self, col_letter: str, width: Optional[float] = None, hidden: bool = False):
+        """Column widths go out with the first row, so set them all before writing any."""
+        if self.next_row > 1:
+            raise ValueError(f"Column '{col_letter}' set after rows were written to '{self.worksheet.title}'.")
+        dimension = self.worksheet.column_dimensions[col_letter]
+        if width is not None:
+            dimension.width = width
+        if hidden:
+            dimension.hidden = True
+
+    def add_merge(self, range_string: str):
+        """Registers a merged range of the output (its cells are written as they come)."""
+        merge_index(self.worksheet).add(range_string) # Indexed, so long sheets don't pay a scan per merge
+
+    def add_vertical_runs(self, col: int, start_row: int, runs: Iterable[Tuple[int, int]],
+                          anchor_alignment: Optional[Alignment] = None):
+        """The write-only counterpart of merge_utils.apply_vertical_runs; call it before flushing the rows."""
+        column_runs = _VerticalRuns(col, start_row, runs, anchor_alignment)
+        for first, last in column_runs.runs:
+            self.add_merge(f"{get_column_letter(col)}{first}:{get_column_letter(col)}{last}")
+        if not column_runs.done:
+            self._vertical_runs.append(column_runs)
+
+    # --- Writing rows ---
+
+    def _output_style(self, cell) -> Any:
+        """The output style array equivalent to a source cell's style, built once per distinct style."""
+        source_styles = self._styles.setdefault(id(cell.parent.parent), {})
+        key = tuple(cell._style)
+        style = source_styles.get(key)
+        if style is None:
+            converted = WriteOnlyCell(self.worksheet)
+            converted.font = copy(cell.font)
+            converted.border = copy(cell.border)
+            converted.fill = copy(cell.fill)
+            converted.number_format = cell.number_format
+            converted.protection = copy(cell.protection)
+            converted.alignment = copy(cell.alignment)
+            style = source_styles[key] = converted._style
+        return style
+
+    def _append(self, target_row: int, cells: Dict[int, Any], height: Optional[float] = None, hidden: bool = False):
+        """Appends the output row target_row (blank rows fill any gap) from {column: source cell}."""
+        if target_row < self.next_row:
+            raise ValueError(f"Row {target_row} of '{self.worksheet.title}' has already been written.")
+        while self.next_row < target_row:
+            self.worksheet.append([])
+            self.next_row += 1
+
+        row = [None] * max(cells, default=0)
+        for col, cell in cells.items():
+            if cell.value is None and not cell.has_style:
+                continue
+            output_cell = WriteOnlyCell(self.worksheet, None if isinstance(cell, MergedCell) else cell.value)
+            if cell.has_style:
+                output_cell._style = copy(self._output_style(cell))
+            row[col - 1] = output_cell
+
+        # Row attributes are read when the row is appended, so they are set just for it
+        row_dimensions = self.worksheet.row_dimensions
+        if height is not None:
+            row_dimensions[target_row].height = height
+        if hidden:
+            row_dimensions[target_row].hidden = True
+        self.worksheet.append(row)
+        row_dimensions.pop(target_row, None)
+        self.next_row += 1
+
+    def copy_rows(self, source: Worksheet, first_row: int, last_row: int, row_shift: int = 0):
+        """
+        Writes rows first_row..last_row of a full-mode sheet (values, styles, heights) at
+        row + row_shift. Merges are not copied; register them with add_merge().
+        """
+        if last_row < first_row:
+            return
+        source_rows: Dict[int, Dict[int, Any]] = {}
+        for (row, col), cell in source._cells.items():
+            if first_row <= row <= last_row:
+                source_rows.setdefault(row, {})[col] = cell
+        for row in range(first_row, last_row + 1):
+            dimension = source.row_dimensions.get(row)
+            self._append(row + row_shift, source_rows.get(row, {}),
+                         dimension.height if dimension else None, bool(dimension and dimension.hidden))
+
+    def flush(self, upto_row: int, height: Optional[float] = None):
+        """
+        Writes every scratch row before upto_row to the output and removes it from the scratch
+        sheet, with its merges (which must end before upto_row). height, if given, is set on
+        each flushed row that has no height of its own.
+        """
+        if upto_row <= self.next_row:
+            return
+        scratch = self.scratch
+        scratch_rows: Dict[int, Dict[int, Any]] = {}
+        for coord in [coord for coord in scratch._cells if coord[0] < upto_row]:
+            scratch_rows.setdefault(coord[0], {})[coord[1]] = scratch._cells.pop(coord)
+
+        merged_cells = merge_index(scratch)
+        for merged_range in merged_cells.overlapping(self.next_row, upto_row - 1):
+            if merged_range.max_row >= upto_row:
+                raise ValueError(f"Merge {merged_range} of '{scratch.title}' continues past row {upto_row - 1}.")
+            merged_cells.remove(merged_range)
+            self.add_merge(str(merged_range))
+
+        for row in range(self.next_row, upto_row):
+            cells = scratch_rows.get(row, {})
+            for column_runs in self._vertical_runs:
+                self._apply_vertical_run(column_runs, row, cells)
+            dimension = scratch.row_dimensions.pop(row, None)
+            row_height = dimension.height if dimension and dimension.height is not None else height
+            self._append(row, cells, row_height, bool(dimension and dimension.hidden))
+        self._vertical_runs = [column_runs for column_runs in self._vertical_runs if not column_runs.done]
+
+    def _apply_vertical_run(self, column_runs: _VerticalRuns, row: int, cells: Dict[int, Any]):
+        """Turns a scratch cell into what merging its column's run leaves in its place."""
+        run = column_runs.run_at(row)
+        if run is None:
+            return
+        col = column_runs.col
+        first, last = run
+        if row == first:
+            anchor = cells.get(col)
+            if anchor is None:
+                anchor = cells[col] = self.scratch.cell(row=row, column=col)
+                del self.scratch._cells[(row, col)]
+            key = tuple(anchor._style)
+            memo = column_runs.anchor_styles.get(key)
+            if memo is None:
+                # Data rows are styled per column, so the run's end cell carries the anchor's own border
+                anchor.border = anchor.border + Border(right=anchor.border.right, bottom=anchor.border.bottom)
+                if column_runs.anchor_alignment is not None:
+                    anchor.alignment = column_runs.anchor_alignment
+                covered_style = {}
+                for on_bottom in (False, True):
+                    covered = MergedCell(self.scratch, row=row, column=col)
+                    covered.border = _covered_cell_border(anchor.border, False, True, True, on_bottom)
+                    covered_style[on_bottom] = copy(covered._style)
+                memo = column_runs.anchor_styles[key] = (copy(anchor._style), covered_style)
+            anchor._style = copy(memo[0])
+            column_runs.covered_style = memo[1]
+        else:
+            covered = MergedCell(self.scratch, row=row, column=col)
+            covered._style = copy(column_runs.covered_style[row == last])
+            cells[col] = covered
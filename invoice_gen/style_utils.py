@@ -1,7 +1,77 @@
 # style_utils.py
 from openpyxl.worksheet.worksheet import Worksheet
 from openpyxl.styles import Alignment, Border, Side, Font
-from typing import Dict, Any, Optional, List, Tuple
+from typing import Dict, Any, Optional, List, NamedTuple, Tuple
+
+# --- Prebuilt borders, keyed by row role (which of top/bottom are drawn; sides always are) ---
+thin_side = Side(border_style="thin", color="000000")
+_SIDE_BORDERS = {
+    (top, bottom): Border(left=thin_side, right=thin_side,
+                          top=thin_side if top else None, bottom=thin_side if bottom else None)
+    for top in (False, True) for bottom in (False, True)
+}
+full_grid_border = _SIDE_BORDERS[(True, True)]
+sides_only_border = _SIDE_BORDERS[(False, False)]
+
+
+def side_border(top: bool = False, bottom: bool = False) -> Border:
+    """The shared thin border with left/right sides and, optionally, top and bottom."""
+    return _SIDE_BORDERS[(bool(top), bool(bottom))]
+
+
+class ColumnStyle(NamedTuple):
+    font: Optional[Font]
+    alignment: Optional[Alignment]
+    number_format: Optional[str]
+
+
+class CompiledStyles:
+    """
+    A sheet's 'styling' config turned into prebuilt style objects, one ColumnStyle per
+    column id (default_font/default_alignment merged with column_id_styles). Cells are
+    assigned these shared objects instead of building a new Font/Alignment per cell.
+    """
+
+    def __init__(self, styling_config: Dict[str, Any]):
+        self._default_font_cfg = styling_config.get("default_font", {})
+        self._default_align_cfg = styling_config.get("default_alignment", {})
+        self._column_styles = styling_config.get("column_id_styles", {})
+        self._columns: Dict[str, ColumnStyle] = {}
+
+    def column(self, col_id: str) -> ColumnStyle:
+        compiled = self._columns.get(col_id)
+        if compiled is None:
+            col_specific_style = self._column_styles.get(col_id, {})
+            font_cfg = {**self._default_font_cfg, **col_specific_style.get("font", {})}
+            align_cfg = {**self._default_align_cfg, **col_specific_style.get("alignment", {})}
+            compiled = ColumnStyle(
+                font=Font(**{k: v for k, v in font_cfg.items() if v is not None}) if font_cfg else None,
+                alignment=Alignment(**{k: v for k, v in align_cfg.items() if v is not None}) if align_cfg else None,
+                number_format=col_specific_style.get("number_format"),
+            )
+            self._columns[col_id] = compiled
+        return compiled
+
+
+_compiled_styles: Dict[int, Tuple[dict, CompiledStyles]] = {}
+_MAX_COMPILED_STYLES = 64
+
+
+def compile_styles(styling_config: Dict[str, Any]) -> CompiledStyles:
+    """
+    Returns the CompiledStyles for a styling config, compiling it on first use.
+    Memoized by identity (configs are loaded once and not modified while generating).
+    """
+    entry = _compiled_styles.get(id(styling_config))
+    if entry is not None and entry[0] is styling_config:
+        return entry[1]
+    compiled = CompiledStyles(styling_config)
+    if len(_compiled_styles) >= _MAX_COMPILED_STYLES:
+        _compiled_styles.clear()
+    # The config is kept alongside so its id cannot be reused while cached
+    _compiled_styles[id(styling_config)] = (styling_config, compiled)
+    return compiled
+
 
 def apply_cell_style(cell: Worksheet.cell, styling_config: dict, context: dict):
     """
@@ -16,38 +86,28 @@ def apply_cell_style(cell: Worksheet.cell, styling_config: dict, context: dict):
 
     # --- 1. Apply Font, Alignment, and Number Formats ---
     if col_id and styling_config:
-        default_font_cfg = styling_config.get("default_font", {})
-        default_align_cfg = styling_config.get("default_alignment", {})
-        column_styles = styling_config.get("column_id_styles", {})
-        col_specific_style = column_styles.get(col_id, {})
-        
-        final_font_cfg = {**default_font_cfg, **col_specific_style.get("font", {})}
-        if final_font_cfg: cell.font = Font(**final_font_cfg)
-        
-        final_align_cfg = {**default_align_cfg, **col_specific_style.get("alignment", {})}
-        if final_align_cfg: cell.alignment = Alignment(**final_align_cfg)
-        
-        if "number_format" in col_specific_style:
-            cell.number_format = col_specific_style["number_format"]
+        column_style = compile_styles(styling_config).column(col_id)
+        if column_style.font is not None: cell.font = column_style.font
+        if column_style.alignment is not None: cell.alignment = column_style.alignment
+        if column_style.number_format is not None:
+            cell.number_format = column_style.number_format
 
     # --- 2. Apply Conditional Borders ---
-    thin_side = Side(border_style="thin", color="000000")
-    
     # Special handling for the pre-footer row
     if is_pre_footer:
         if col_idx == static_col_idx:
-            cell.border = Border(left=thin_side, right=thin_side)
+            cell.border = sides_only_border
         else:
-            cell.border = Border(left=thin_side, right=thin_side, top=thin_side, bottom=thin_side)
+            cell.border = full_grid_border
         return
 
     # UPDATED: Simplified logic for main data rows
     if col_idx == static_col_idx:
         # The static column ONLY ever gets side borders.
-        cell.border = Border(left=thin_side, right=thin_side)
+        cell.border = sides_only_border
     elif col_idx: 
         # All other columns get a full grid.
-        cell.border = Border(left=thin_side, right=thin_side, top=thin_side, bottom=thin_side)
+        cell.border = full_grid_border
 
 
 def apply_row_heights(worksheet: Worksheet, styling_config: dict, headers: List[dict], data_ranges: List[Tuple[int, int]], footer_rows: List[int]):
@@ -0,0 +1,251 @@
+# template_bloat.py
+# Reports what makes invoice templates large and writes slimmed, layout-equivalent copies.
+#
+# Report (per template): package parts by size, embedded media with their pixel size and
+# displayed size (effective DPI), duplicate media, cell styles (cellXfs) that no cell uses,
+# formatted-but-empty rows below the last value ("phantom rows"), and broken defined names.
+#
+# Slimming only rewrites embedded images; every other part is copied byte for byte, so
+# cells, styles, merges, anchors and print settings are unchanged:
+#   - PNG images are re-encoded losslessly with maximum compression (JPEGs are left alone).
+#   - With --max-image-dpi, images stored at a higher resolution than they are displayed
+#     at (largest anchor extent) are resampled down to that DPI; the anchors keep their size.
+# The load and save time of the original and slimmed copy is measured with openpyxl.
+#
+# Usage:
+#   python template_bloat.py TEMPLATE                       # report only
+#   python template_bloat.py TEMPLATE -o TEMPLATE_slim      # report + write slimmed copies
+#   python template_bloat.py TEMPLATE/MT.xlsx -o out --max-image-dpi 150
+
+import argparse
+import hashlib
+import io
+import posixpath
+import re
+import sys
+import time
+import zipfile
+import xml.etree.ElementTree as ET
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import openpyxl
+
+try:
+    from PIL import Image
+except ImportError: # Pillow is optional; without it media are reported but not slimmed
+    Image = None
+
+EMU_PER_INCH = 914400
+TIMING_REPEATS = 5
+
+_NS = {
+    "xdr": "http://schemas.openxmlformats.org/drawingml/2006/spreadsheetDrawing",
+    "a": "http://schemas.openxmlformats.org/drawingml/2006/main",
+    "r": "http://schemas.openxmlformats.org/officeDocument/2006/relationships",
+    "rel": "http://schemas.openxmlformats.org/package/2006/relationships",
+    "main": "http://schemas.openxmlformats.org/spreadsheetml/2006/main",
+}
+_CELL_STYLE_PATTERN = re.compile(rb'<c\b[^>]*?\bs="(\d+)"')
+_ROW_PATTERN = re.compile(rb'<row\b([^>]*?)(?:/>|>(.*?)</row>)', re.S)
+_ROW_NUMBER_PATTERN = re.compile(rb'\br="(\d+)"')
+_VALUE_PATTERN = re.compile(rb'<(?:v|is|f)\b')
+
+
+def _rels_path(part: str) -> str:
+    directory, name = posixpath.split(part)
+    return posixpath.join(directory, "_rels", name + ".rels")
+
+
+def _resolve_target(part: str, target: str) -> str:
+    if target.startswith("/"):
+        return target.lstrip("/")
+    return posixpath.normpath(posixpath.join(posixpath.dirname(part), target))
+
+
+def _image_display_extents(archive: zipfile.ZipFile) -> Dict[str, Tuple[int, int]]:
+    """Largest displayed (cx, cy) in EMU for every media part referenced by a drawing."""
+    extents: Dict[str, Tuple[int, int]] = {}
+    names = set(archive.namelist())
+    for part in names:
+        if not (part.startswith("xl/drawings/") and part.endswith(".xml")) or _rels_path(part) not in names:
+            continue
+        targets = {rel.get("Id"): _resolve_target(part, rel.get("Target", ""))
+                   for rel in ET.fromstring(archive.read(_rels_path(part))).findall("rel:Relationship", _NS)}
+        for pic in ET.fromstring(archive.read(part)).iter(f"{{{_NS['xdr']}}}pic"):
+            blip = pic.find(".//a:blip", _NS)
+            ext = pic.find("xdr:spPr/a:xfrm/a:ext", _NS)
+            if blip is None or ext is None:
+                continue
+            media = targets.get(blip.get(f"{{{_NS['r']}}}embed"))
+            if media:
+                cx, cy = int(ext.get("cx", 0)), int(ext.get("cy", 0))
+                previous = extents.get(media, (0, 0))
+                extents[media] = (max(previous[0], cx), max(previous[1], cy))
+    return extents
+
+
+def analyze_template(path: Path) -> Dict[str, Any]:
+    """Collects the size breakdown and bloat indicators of one .xlsx template."""
+    report: Dict[str, Any] = {"file": str(path), "size": path.stat().st_size}
+    with zipfile.ZipFile(path) as archive:
+        infos = archive.infolist()
+        report["parts"] = sorted(((i.filename, i.compress_size) for i in infos), key=lambda p: -p[1])
+        extents = _image_display_extents(archive)
+
+        media, digests = [], {}
+        for info in infos:
+            if not info.filename.startswith("xl/media/"):
+                continue
+            data = archive.read(info.filename)
+            entry = {"part": info.filename, "bytes": len(data), "pixels": None, "dpi": None}
+            if Image is not None:
+                try:
+                    with Image.open(io.BytesIO(data)) as image:
+                        entry["pixels"] = image.size
+                except Exception:
+                    pass
+            cx, cy = extents.get(info.filename, (0, 0))
+            if entry["pixels"] and cx:
+                entry["dpi"] = round(entry["pixels"][0] / (cx / EMU_PER_INCH))
+            media.append(entry)
+            digests.setdefault(hashlib.sha256(data).hexdigest(), []).append(info.filename)
+        report["media"] = media
+        report["duplicate_media"] = [parts for parts in digests.values() if len(parts) > 1]
+
+        styles = archive.read("xl/styles.xml")
+        cell_xfs = ET.fromstring(styles).find("main:cellXfs", _NS)
+        xf_count = len(cell_xfs) if cell_xfs is not None else 0
+        used_styles, phantom_rows = {0}, 0
+        for name in archive.namelist():
+            if not re.match(r"xl/worksheets/sheet\d+\.xml$", name):
+                continue
+            sheet_xml = archive.read(name)
+            used_styles.update(int(s) for s in _CELL_STYLE_PATTERN.findall(sheet_xml))
+            rows = [(int(_ROW_NUMBER_PATTERN.search(attrs).group(1)), bool(body and _VALUE_PATTERN.search(body)))
+                    for attrs, body in _ROW_PATTERN.findall(sheet_xml) if _ROW_NUMBER_PATTERN.search(attrs)]
+            last_value_row = max((number for number, has_value in rows if has_value), default=0)
+            phantom_rows += sum(1 for number, has_value in rows if number > last_value_row)
+        report["cell_styles"] = xf_count
+        report["unused_cell_styles"] = len(set(range(xf_count)) - used_styles)
+        report["phantom_rows"] = phantom_rows
+
+        workbook_xml = ET.fromstring(archive.read("xl/workbook.xml"))
+        defined_names = workbook_xml.findall("main:definedNames/main:definedName", _NS)
+        report["defined_names"] = len(defined_names)
+        report["broken_defined_names"] = [d.get("name") for d in defined_names if "#REF!" in (d.text or "")]
+    return report
+
+
+def _slim_image(data: bytes, extent: Optional[Tuple[int, int]], max_dpi: Optional[int]) -> Optional[bytes]:
+    """Smaller encoding of a PNG/JPEG (resampled to max_dpi at its displayed size), or None."""
+    with Image.open(io.BytesIO(data)) as image:
+        image_format = image.format
+        if image_format not in ("PNG", "JPEG"):
+            return None
+        image.load()
+        info = {key: image.info[key] for key in ("icc_profile", "gamma", "srgb", "dpi") if key in image.info}
+        resampled = False
+        if max_dpi and extent and extent[0]:
+            target_width = round(extent[0] / EMU_PER_INCH * max_dpi)
+            if target_width < image.width:
+                target_height = max(1, round(image.height * target_width / image.width))
+                image = image.resize((target_width, target_height), Image.LANCZOS)
+                resampled = True
+        if image_format == "JPEG" and not resampled:
+            return None # Re-encoding a JPEG is lossy; only worth it after resampling
+        buffer = io.BytesIO()
+        if image_format == "PNG":
+            image.save(buffer, format="PNG", optimize=True, **info)
+        else:
+            image.save(buffer, format="JPEG", quality=90, optimize=True, **info)
+    slimmed = buffer.getvalue()
+    return slimmed if len(slimmed) < len(data) else None
+
+
+def slim_template(path: Path, output_path: Path, max_dpi: Optional[int] = None) -> List[Tuple[str, int, int]]:
+    """
+    Writes a copy of the template to output_path with smaller embedded images.
+    All other parts are copied unchanged. Returns (part, old bytes, new bytes) per rewritten image.
+    """
+    rewritten = []
+    with zipfile.ZipFile(path) as source:
+        extents = _image_display_extents(source)
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        with zipfile.ZipFile(output_path, "w") as target:
+            for info in source.infolist():
+                data = source.read(info.filename)
+                if Image is not None and info.filename.startswith("xl/media/"):
+                    slimmed = _slim_image(data, extents.get(info.filename), max_dpi)
+                    if slimmed is not None:
+                        rewritten.append((info.filename, len(data), len(slimmed)))
+                        data = slimmed
+                target.writestr(info, data, compress_type=info.compress_type)
+    return rewritten
+
+
+def time_load_and_save(path: Path) -> Tuple[float, float]:
+    """Best-of-N seconds for openpyxl.load_workbook and for saving the loaded workbook."""
+    load_times, save_times = [], []
+    for _ in range(TIMING_REPEATS):
+        start = time.perf_counter(); workbook = openpyxl.load_workbook(path); load_times.append(time.perf_counter() - start)
+        start = time.perf_counter(); workbook.save(io.BytesIO()); save_times.append(time.perf_counter() - start)
+        workbook.close()
+    return min(load_times), min(save_times)
+
+
+def print_report(report: Dict[str, Any]):
+    print(f"\n=== {Path(report['file']).name}: {report['size'] / 1024:.1f} KB ===")
+    print("  Largest parts: " + ", ".join(f"{name} {size / 1024:.1f} KB" for name, size in report["parts"][:3]))
+    for entry in report["media"]:
+        pixels = "x".join(map(str, entry["pixels"])) if entry["pixels"] else "?"
+        dpi = f", {entry['dpi']} dpi as displayed" if entry["dpi"] else ""
+        print(f"  Media {entry['part']}: {entry['bytes'] / 1024:.1f} KB, {pixels} px{dpi}")
+    for parts in report["duplicate_media"]:
+        print(f"  Duplicate media: {', '.join(parts)}")
+    print(f"  Cell styles: {report['cell_styles']} ({report['unused_cell_styles']} unused)")
+    print(f"  Phantom rows (formatted, below the last value): {report['phantom_rows']}")
+    broken = report["broken_defined_names"]
+    print(f"  Defined names: {report['defined_names']}" + (f" ({len(broken)} broken: {', '.join(broken)})" if broken else ""))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Report template bloat and write slimmed, layout-equivalent copies.")
+    parser.add_argument("inputs", nargs="+", help="Template .xlsx files and/or directories of templates.")
+    parser.add_argument("-o", "--output-dir", default=None, help="Write slimmed copies here (same file names). Report only if omitted.")
+    parser.add_argument("--max-image-dpi", type=int, default=None, help="Resample images stored above this DPI (at their displayed size) down to it.")
+    args = parser.parse_args()
+
+    templates: List[Path] = []
+    for entry in map(Path, args.inputs):
+        templates.extend(sorted(entry.glob("*.xlsx")) if entry.is_dir() else [entry])
+    templates = [t for t in templates if not t.name.startswith("~$")]
+    if not templates:
+        print("Error: No templates found."); sys.exit(1)
+    if args.output_dir and Image is None:
+        print("Warning: Pillow is not installed; images cannot be slimmed.")
+
+    total_before = total_after = 0
+    for template in templates:
+        print_report(analyze_template(template))
+        if not args.output_dir:
+            continue
+        output_path = Path(args.output_dir) / template.name
+        if output_path.resolve() == template.resolve():
+            print("  Skipped: output would overwrite the template."); continue
+        rewritten = slim_template(template, output_path, args.max_image_dpi)
+        for part, old_size, new_size in rewritten:
+            print(f"  Slimmed {part}: {old_size / 1024:.1f} KB -> {new_size / 1024:.1f} KB")
+        before, after = template.stat().st_size, output_path.stat().st_size
+        total_before += before; total_after += after
+        load_before, save_before = time_load_and_save(template)
+        load_after, save_after = time_load_and_save(output_path)
+        print(f"  Written {output_path}: {before / 1024:.1f} KB -> {after / 1024:.1f} KB")
+        print(f"  Load {load_before * 1000:.0f} ms -> {load_after * 1000:.0f} ms, save {save_before * 1000:.0f} ms -> {save_after * 1000:.0f} ms"
+              f" (saved {(load_before + save_before - load_after - save_after) * 1000:.0f} ms per generation)")
+    if args.output_dir:
+        print(f"\nTotal: {total_before / 1024:.1f} KB -> {total_after / 1024:.1f} KB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+# template_cache.py
+# Keeps parsed template workbooks ready to clone, so per-invoice generation does not
+# re-parse the template XML (several templates are > 500KB because of embedded images).
+#
+# A parsed workbook is held as a pickled snapshot; every load returns an independent
+# clone (pickle.loads is ~10x faster than openpyxl.load_workbook). Entries are keyed by
+# (resolved path, mtime, size), so an edited template is re-parsed automatically.
+# With a snapshot directory, snapshots are also persisted to disk for cold starts.
+# Snapshot files are pickles: only point snapshot_dir at a directory you control.
+
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple, Union
+
+import openpyxl
+
+# Bump when the snapshot layout changes; part of every snapshot's validity check.
+SNAPSHOT_FORMAT_VERSION = 1
+SNAPSHOT_SUFFIX = ".wbsnap"
+DEFAULT_MAX_ENTRIES = 16
+
+TemplateKey = Tuple[str, int, int]
+
+
+class TemplateSnapshot:
+    """A parsed template workbook in pickled form. Cheap to send to worker processes."""
+    __slots__ = ('data', 'source')
+
+    def __init__(self, data: bytes, source: str):
+        self.data = data
+        self.source = source
+
+    def clone(self) -> Any:
+        """Returns a new, independent openpyxl Workbook."""
+        workbook = pickle.loads(self.data)
+        _rebind_dimension_factories(workbook)
+        return workbook
+
+    def __getstate__(self):
+        return (self.data, self.source)
+
+    def __setstate__(self, state):
+        self.data, self.source = state
+
+
+def _rebind_dimension_factories(workbook: Any):
+    """
+    Row/column DimensionHolders are defaultdict subclasses whose default_factory
+    (ws._add_row / ws._add_column) does not survive pickling; without it, touching
+    a new row's or column's dimensions raises KeyError.
+    """
+    for worksheet in workbook.worksheets:
+        if hasattr(worksheet, "row_dimensions"):
+            worksheet.row_dimensions.default_factory = worksheet._add_row
+            worksheet.column_dimensions.default_factory = worksheet._add_column
+
+
+def template_key(template_path: Union[str, Path]) -> TemplateKey:
+    """(resolved path, mtime in ns, size) of a template file."""
+    path = Path(template_path).resolve()
+    stat = path.stat()
+    return (str(path), stat.st_mtime_ns, stat.st_size)
+
+
+class TemplateCache:
+    """
+    In-memory LRU of template snapshots, optionally backed by snapshot files in
+    snapshot_dir (one file per template path, overwritten when the template changes).
+
+    Counters (see stats()):
+        hits            served from memory
+        misses          not in memory (then loaded from a disk snapshot or parsed)
+        snapshot_loads  misses served from a disk snapshot
+        parses          misses that had to parse the template with openpyxl
+    """
+
+    def __init__(self, snapshot_dir: Optional[Union[str, Path]] = None, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.snapshot_dir = Path(snapshot_dir) if snapshot_dir else None
+        self.max_entries = max(1, max_entries)
+        self._entries: "OrderedDict[TemplateKey, TemplateSnapshot]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "snapshot_loads": 0, "parses": 0}
+        if self.snapshot_dir:
+            self.snapshot_dir.mkdir(parents=True, exist_ok=True)
+
+    def _snapshot_file(self, key: TemplateKey) -> Optional[Path]:
+        if not self.snapshot_dir:
+            return None
+        return self.snapshot_dir / (hashlib.sha256(key[0].encode("utf-8")).hexdigest()[:32] + SNAPSHOT_SUFFIX)
+
+    @staticmethod
+    def _snapshot_meta(key: TemplateKey) -> Tuple[Any, ...]:
+        return (SNAPSHOT_FORMAT_VERSION, openpyxl.__version__) + key
+
+    def _read_snapshot_file(self, key: TemplateKey) -> Optional[TemplateSnapshot]:
+        snapshot_file = self._snapshot_file(key)
+        if snapshot_file is None or not snapshot_file.is_file():
+            return None
+        try:
+            with open(snapshot_file, "rb") as f:
+                meta, data = pickle.load(f)
+            if meta != self._snapshot_meta(key):
+                return None # Template changed (or different openpyxl); re-parse and overwrite
+            snapshot = TemplateSnapshot(data, key[0])
+            snapshot.clone() # Validate before trusting it
+            return snapshot
+        except Exception as e:
+            print(f"Warning: Ignoring unreadable template snapshot '{snapshot_file}': {e}")
+            return None
+
+    def _write_snapshot_file(self, key: TemplateKey, snapshot: TemplateSnapshot):
+        snapshot_file = self._snapshot_file(key)
+        if snapshot_file is None:
+            return
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=str(self.snapshot_dir), suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    pickle.dump((self._snapshot_meta(key), snapshot.data), f, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(tmp_path, snapshot_file)
+            except BaseException:
+                if os.path.exists(tmp_path): os.remove(tmp_path)
+                raise
+        except OSError as e:
+            print(f"Warning: Could not write template snapshot '{snapshot_file}': {e}")
+
+    def get_snapshot(self, template_path: Union[str, Path]) -> TemplateSnapshot:
+        """Returns the snapshot for template_path, loading or parsing it on a miss."""
+        key = template_key(template_path)
+        with self._lock:
+            snapshot = self._entries.get(key)
+            if snapshot is not None:
+                self._entries.move_to_end(key)
+                self._counters["hits"] += 1
+                return snapshot
+            self._counters["misses"] += 1
+
+        snapshot = self._read_snapshot_file(key)
+        if snapshot is not None:
+            source = "snapshot_loads"
+        else:
+            workbook = openpyxl.load_workbook(key[0])
+            snapshot = TemplateSnapshot(pickle.dumps(workbook, protocol=pickle.HIGHEST_PROTOCOL), key[0])
+            self._write_snapshot_file(key, snapshot)
+            source = "parses"
+
+        with self._lock:
+            self._counters[source] += 1
+            # Drop entries for older versions of the same template
+            for stale_key in [k for k in self._entries if k[0] == key[0] and k != key]:
+                del self._entries[stale_key]
+            self._entries[key] = snapshot
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return snapshot
+
+    def load_workbook(self, template_path: Union[str, Path]) -> Any:
+        """Returns a fresh Workbook for template_path (a clone; safe to modify)."""
+        return self.get_snapshot(template_path).clone()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._counters, entries=len(self._entries))
+
+    def clear(self):
+        """Drops the in-memory entries (snapshot files are kept) and resets the counters."""
+        with self._lock:
+            self._entries.clear()
+            for name in self._counters: self._counters[name] = 0
+
+
+_default_cache = TemplateCache()
+
+
+def get_template_cache() -> TemplateCache:
+    """The process-wide cache used by generate_invoice."""
+    return _default_cache
+
+
+def configure_template_cache(snapshot_dir: Optional[Union[str, Path]] = None, max_entries: int = DEFAULT_MAX_ENTRIES) -> TemplateCache:
+    """
+    Replaces the process-wide cache, e.g. to persist snapshots under snapshot_dir.
+    Calling it again with the same settings keeps the existing cache (and its entries).
+    """
+    global _default_cache
+    wanted_dir = Path(snapshot_dir) if snapshot_dir else None
+    if _default_cache.snapshot_dir != wanted_dir or _default_cache.max_entries != max(1, max_entries):
+        _default_cache = TemplateCache(snapshot_dir, max_entries)
+    return _default_cache
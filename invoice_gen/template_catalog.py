@@ -0,0 +1,256 @@
+# template_catalog.py
+# Facts about each template workbook, computed once per template version and persisted
+# next to the templates (TEMPLATE/.template_catalog.json), so request paths stop
+# re-opening and re-scanning templates to rediscover them:
+#   incoterm      first DAP/FCA/CIP found in the active sheet's top rows (generate page)
+#   sheets        name, visibility, merged ranges, [[PLACEHOLDER]] coordinates and the
+#                 coordinates of every text cell in the replacement window (find_and_replace)
+#   config        the matching <name>_config.json and each sheet's configured start_row
+#
+# An entry is keyed by template name (file stem) and is rebuilt when the template's
+# (mtime, size) changes; its config part is refreshed on its own when the config file
+# changes. Template/config matching for data files (derive_paths) uses directory
+# listings that are re-read only when a directory's mtime changes.
+
+import json
+import os
+import re
+import tempfile
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+import template_cache
+
+CATALOG_FILENAME = ".template_catalog.json"
+# Bump when the entry layout changes; older catalog files are then rebuilt.
+CATALOG_FORMAT_VERSION = 1
+
+INCOTERMS = ["DAP", "FCA", "CIP"]
+INCOTERM_SCAN_ROWS = 50
+# Largest window any replacement task searches (FOB task: 200 rows; hybrid sheets: 20 columns)
+TEXT_SCAN_ROWS = 200
+TEXT_SCAN_COLS = 20
+_PLACEHOLDER_RE = re.compile(r"^\[\[.+\]\]$")
+
+
+def _file_stamp(path: Path) -> Optional[List[int]]:
+    """[mtime in ns, size] of a file, or None if it does not exist."""
+    try:
+        stat = path.stat()
+    except OSError:
+        return None
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def _scan_template(template_path: Path) -> Dict[str, Any]:
+    """Opens a template once and collects everything the catalog records about it."""
+    workbook = template_cache.get_template_cache().load_workbook(template_path)
+
+    incoterm = None
+    active = workbook.active
+    if active is not None:
+        for row in active.iter_rows(min_row=1, max_row=INCOTERM_SCAN_ROWS):
+            for cell in row:
+                if cell.value and isinstance(cell.value, str):
+                    incoterm = next((term for term in INCOTERMS if term in cell.value), None)
+                    if incoterm: break
+            if incoterm: break
+
+    sheets = {}
+    for worksheet in workbook.worksheets:
+        text_cells = []
+        placeholders = {}
+        # Only existing cells are read; iter_rows would create every cell of the window
+        for (row, col), cell in sorted(worksheet._cells.items()):
+            if row > TEXT_SCAN_ROWS or col > TEXT_SCAN_COLS:
+                continue
+            if isinstance(cell.value, str) and cell.value:
+                text_cells.append([row, col])
+                if _PLACEHOLDER_RE.match(cell.value.strip()):
+                    placeholders.setdefault(cell.value.strip(), cell.coordinate)
+        sheets[worksheet.title] = {
+            "state": worksheet.sheet_state,
+            "merges": sorted(str(merged) for merged in worksheet.merged_cells.ranges),
+            "placeholders": placeholders,
+            "text_cells": text_cells,
+        }
+
+    return {
+        "incoterm": incoterm,
+        "sheet_order": workbook.sheetnames,
+        "sheets": sheets,
+    }
+
+
+def _scan_config(config_path: Path) -> Dict[str, Any]:
+    """The catalog's view of a template's config: each sheet's configured start_row."""
+    start_rows = {}
+    try:
+        with open(config_path, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+        for sheet_name, sheet_mapping in (config.get("data_mapping") or {}).items():
+            if isinstance(sheet_mapping, dict) and sheet_mapping.get("start_row"):
+                start_rows[sheet_name] = sheet_mapping["start_row"]
+    except (OSError, ValueError, AttributeError) as e:
+        print(f"Warning: Could not read config '{config_path}' for the template catalog: {e}")
+    return {"file": config_path.name, "start_rows": start_rows}
+
+
+class TemplateCatalog:
+    """Per-template metadata for one template directory (and its config directory)."""
+
+    def __init__(self, template_dir: Union[str, Path], config_dir: Optional[Union[str, Path]] = None,
+                 catalog_path: Optional[Union[str, Path]] = None):
+        self.template_dir = Path(template_dir).resolve()
+        self.config_dir = Path(config_dir).resolve() if config_dir else None
+        self.catalog_path = Path(catalog_path) if catalog_path else self.template_dir / CATALOG_FILENAME
+        self._entries: Optional[Dict[str, Dict[str, Any]]] = None
+        self._listings: Dict[Path, Tuple[Optional[int], frozenset]] = {}
+        self._lock = threading.Lock()
+
+    # --- Persistence ---
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        if self._entries is None:
+            self._entries = {}
+            try:
+                with open(self.catalog_path, 'r', encoding='utf-8') as f:
+                    stored = json.load(f)
+                if stored.get("version") == CATALOG_FORMAT_VERSION:
+                    self._entries = stored.get("templates", {})
+            except FileNotFoundError:
+                pass
+            except (OSError, ValueError, AttributeError) as e:
+                print(f"Warning: Ignoring unreadable template catalog '{self.catalog_path}': {e}")
+        return self._entries
+
+    def _save(self):
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=str(self.catalog_path.parent), suffix=".tmp")
+            try:
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    json.dump({"version": CATALOG_FORMAT_VERSION, "templates": self._entries}, f)
+                os.replace(tmp_path, self.catalog_path)
+            except BaseException:
+                if os.path.exists(tmp_path): os.remove(tmp_path)
+                raise
+        except OSError as e:
+            print(f"Warning: Could not write template catalog '{self.catalog_path}': {e}")
+
+    # --- Entries ---
+
+    def entry(self, template_name: str) -> Optional[Dict[str, Any]]:
+        """The catalog entry for template '<template_name>.xlsx', (re)built if missing or stale."""
+        template_path = self.template_dir / f"{template_name}.xlsx"
+        template_stamp = _file_stamp(template_path)
+        if template_stamp is None:
+            return None
+        config_path = self.config_dir / f"{template_name}_config.json" if self.config_dir else None
+        config_stamp = _file_stamp(config_path) if config_path else None
+
+        with self._lock:
+            entries = self._load()
+            entry = entries.get(template_name)
+            changed = False
+            if entry is None or entry.get("stamp") != template_stamp:
+                print(f"Template catalog: scanning '{template_path.name}'...")
+                entry = dict(_scan_template(template_path), stamp=template_stamp, config=None, config_stamp=None)
+                entries[template_name] = entry
+                changed = True
+            if self.config_dir and entry.get("config_stamp") != config_stamp:
+                entry["config"] = _scan_config(config_path) if config_stamp else None
+                entry["config_stamp"] = config_stamp
+                changed = True
+            if changed:
+                self._save()
+            return entry
+
+    def refresh(self) -> List[str]:
+        """Brings every template in the directory up to date. Returns the template names."""
+        names = sorted(name[:-len(".xlsx")] for name in self._listing(self.template_dir)
+                       if name.endswith(".xlsx") and not name.startswith("~$"))
+        for name in names:
+            self.entry(name)
+        return names
+
+    def incoterm(self, template_name: str) -> Optional[str]:
+        entry = self.entry(template_name)
+        return entry["incoterm"] if entry else None
+
+    def sheet(self, template_name: str, sheet_name: str) -> Optional[Dict[str, Any]]:
+        entry = self.entry(template_name)
+        return entry["sheets"].get(sheet_name) if entry else None
+
+    def text_cells(self, template_name: str) -> Optional[Dict[str, List[Tuple[int, int]]]]:
+        """Per sheet, the (row, column) of every text cell in the template's replacement window."""
+        entry = self.entry(template_name)
+        if not entry:
+            return None
+        return {name: [tuple(rc) for rc in sheet["text_cells"]] for name, sheet in entry["sheets"].items()}
+
+    # --- Matching data files to templates ---
+
+    def _listing(self, directory: Path) -> frozenset:
+        """File names in directory, re-read only when the directory's mtime changes."""
+        try:
+            mtime = directory.stat().st_mtime_ns
+        except OSError:
+            return frozenset()
+        cached = self._listings.get(directory)
+        if cached is None or cached[0] != mtime:
+            cached = (mtime, frozenset(os.listdir(directory)))
+            self._listings[directory] = cached
+        return cached[1]
+
+    def resolve(self, template_name_part: str) -> Optional[Tuple[str, Path, Path]]:
+        """
+        Finds the template/config pair for a derived name: '<name>.xlsx' with '<name>_config.json',
+        else the same for the name's leading letters. Returns (match kind, template, config).
+        """
+        if not self.config_dir:
+            return None
+        templates, configs = self._listing(self.template_dir), self._listing(self.config_dir)
+        prefix_match = re.match(r'^([a-zA-Z]+)', template_name_part)
+        candidates = [("exact", template_name_part)]
+        if prefix_match:
+            candidates.append(("prefix", prefix_match.group(1)))
+        for kind, name in candidates:
+            if f"{name}.xlsx" in templates and f"{name}_config.json" in configs:
+                return kind, self.template_dir / f"{name}.xlsx", self.config_dir / f"{name}_config.json"
+        return None
+
+
+_catalogs: Dict[Path, TemplateCatalog] = {}
+_catalogs_lock = threading.Lock()
+
+
+def get_catalog(template_dir: Union[str, Path], config_dir: Optional[Union[str, Path]] = None) -> TemplateCatalog:
+    """
+    The process-wide catalog for a template directory. One catalog (and catalog file) per
+    directory: a config_dir given here is remembered for later callers that omit it.
+    """
+    key = Path(template_dir).resolve()
+    with _catalogs_lock:
+        catalog = _catalogs.get(key)
+        if catalog is None:
+            catalog = _catalogs[key] = TemplateCatalog(key, config_dir)
+        elif config_dir:
+            catalog.config_dir = Path(config_dir).resolve()
+        return catalog
+
+
+def template_text_cells(template_path: Union[str, Path], max_row: int = TEXT_SCAN_ROWS,
+                        max_col: int = TEXT_SCAN_COLS) -> Optional[Dict[str, List[Tuple[int, int]]]]:
+    """
+    Text cell coordinates per sheet for a template file, or None if they are unavailable
+    or the requested window is larger than the one the catalog records.
+    """
+    if max_row > TEXT_SCAN_ROWS or max_col > TEXT_SCAN_COLS:
+        return None
+    try:
+        template_path = Path(template_path)
+        return get_catalog(template_path.parent).text_cells(template_path.stem)
+    except Exception as e:
+        print(f"Warning: Template catalog unavailable for '{template_path}': {e}")
+        return None
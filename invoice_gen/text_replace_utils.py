@@ -1,7 +1,8 @@
 import openpyxl
 from openpyxl.worksheet.worksheet import Worksheet
 from openpyxl.cell import Cell
-from typing import List, Dict, Optional, Any
+from typing import List, Dict, Optional, Any, Tuple
+from collections import deque
 import re
 import datetime
 
@@ -84,7 +85,128 @@ def _get_nested_data(data_dict: Dict[str, Any], path: List[Any]) -> Optional[Any
     return current_level
 
 # ==============================================================================
-# SECTION 2: THE ONE REPLACEMENT ENGINE (UPDATED TO USE SMARTER DATE FUNCTION)
+# SECTION 2: RULE COMPILATION (ONE SCAN PER CELL, HOWEVER MANY RULES)
+# ==============================================================================
+
+class _SubstringAutomaton:
+    """
+    Aho-Corasick automaton over the 'find' texts of substring rules. One scan of a
+    cell's text finds every rule whose text occurs in it; only the lowest rule
+    index is kept, since the first matching rule in the list is the one applied.
+    """
+
+    def __init__(self, patterns: List[Tuple[str, int]]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._best: List[Optional[int]] = [None] # Lowest rule index ending at (or via fail links, before) each state
+
+        for pattern, rule_index in patterns:
+            state = 0
+            for char in pattern:
+                next_state = self._goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto.append({}); self._fail.append(0); self._best.append(None)
+                    self._goto[state][char] = next_state
+                state = next_state
+            self._best[state] = _lowest(self._best[state], rule_index)
+
+        # Breadth-first: fail links of shallower states are final before they are followed
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[next_state] = self._goto[fallback].get(char, 0)
+                self._best[next_state] = _lowest(self._best[next_state], self._best[self._fail[next_state]])
+                queue.append(next_state)
+
+    def first_match(self, text: str) -> Optional[int]:
+        """Lowest rule index whose pattern occurs in text, or None."""
+        goto, fail, best_at = self._goto, self._fail, self._best
+        best = None
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if best_at[state] is not None:
+                best = _lowest(best, best_at[state])
+                if best == 0:
+                    break
+        return best
+
+
+def _lowest(a: Optional[int], b: Optional[int]) -> Optional[int]:
+    if a is None: return b
+    if b is None: return a
+    return a if a < b else b
+
+
+class CompiledRules:
+    """
+    A replacement rule list prepared for matching:
+      placeholders  every 'find' text, for recording placeholder locations
+      exact         stripped cell text -> index of the first 'exact' simple rule
+      automaton     the 'substring' simple rules, matched in one scan
+      formulas      formula rules with their dependency placeholders pre-parsed
+    Rules needing invoice_data are left out when none is given (they can never apply).
+    """
+
+    def __init__(self, rules: List[Dict[str, Any]], has_invoice_data: bool):
+        self.placeholders = {rule["find"] for rule in rules if isinstance(rule.get("find"), str)}
+        self.simple_rules = [r for r in rules if "formula_template" not in r]
+        self.exact: Dict[str, int] = {}
+        substring_patterns: List[Tuple[str, int]] = []
+        for rule_index, rule in enumerate(self.simple_rules):
+            text_to_find = rule.get("find")
+            if not text_to_find or not isinstance(text_to_find, str):
+                continue
+            if "data_path" in rule and not has_invoice_data:
+                continue
+            match_mode = rule.get("match_mode", "substring")
+            if match_mode == 'exact':
+                self.exact.setdefault(text_to_find, rule_index)
+            elif match_mode == 'substring':
+                substring_patterns.append((text_to_find, rule_index))
+        self.automaton = _SubstringAutomaton(substring_patterns) if substring_patterns else None
+        self.formulas = [
+            (rule, re.findall(r'(\{\[\[.*?\]\]\})', rule["formula_template"]))
+            for rule in rules if "formula_template" in rule
+        ]
+
+    def match(self, value: str, stripped: str) -> Optional[Dict[str, Any]]:
+        """The first simple rule (in list order) matching a cell's text, or None."""
+        rule_index = self.exact.get(stripped)
+        if self.automaton is not None:
+            rule_index = _lowest(rule_index, self.automaton.first_match(value))
+        return self.simple_rules[rule_index] if rule_index is not None else None
+
+
+_compiled_rules: Dict[Tuple[int, bool], Tuple[list, CompiledRules]] = {}
+_MAX_COMPILED_RULES = 64
+
+
+def compile_rules(rules: List[Dict[str, Any]], has_invoice_data: bool = True) -> CompiledRules:
+    """
+    Returns the CompiledRules for a rule list, compiling it on first use.
+    Memoized by identity (rule lists are loaded once and not modified while generating).
+    """
+    key = (id(rules), bool(has_invoice_data))
+    entry = _compiled_rules.get(key)
+    if entry is not None and entry[0] is rules:
+        return entry[1]
+    compiled = CompiledRules(rules, has_invoice_data)
+    if len(_compiled_rules) >= _MAX_COMPILED_RULES:
+        _compiled_rules.clear()
+    # The rule list is kept alongside so its id cannot be reused while cached
+    _compiled_rules[key] = (rules, compiled)
+    return compiled
+
+# ==============================================================================
+# SECTION 3: THE ONE REPLACEMENT ENGINE (UPDATED TO USE SMARTER DATE FUNCTION)
 # ==============================================================================
 
 def find_and_replace(
@@ -92,21 +214,26 @@ def find_and_replace(
     rules: List[Dict[str, Any]],
     limit_rows: int,
     limit_cols: int,
-    invoice_data: Optional[Dict[str, Any]] = None
-):
+    invoice_data: Optional[Dict[str, Any]] = None,
+    text_cells: Optional[Dict[str, List[Tuple[int, int]]]] = None
+) -> Dict[str, str]:
     """
     A two-pass engine that handles 'exact', 'substring', and formula-based replacements.
     Pass 1: Locates all placeholders and performs simple value replacements.
     Pass 2: Uses the locations found in Pass 1 to build and apply formulas.
+    Returns the placeholder locations found (placeholder text -> cell coordinate).
+
+    text_cells (optional): per sheet title, the (row, column) of every text cell in the
+    search window, as recorded by the template catalog for an unmodified template.
+    Pass 1 then visits only those cells instead of the whole window.
     """
     print(f"\n--- Starting Find and Replace on sheets (Searching Range up to row {limit_rows}, col {limit_cols}) ---")
     
-    # NEW: A dictionary to store the cell coordinates of each placeholder.
+    # A dictionary to store the cell coordinates of each placeholder.
     placeholder_locations: Dict[str, str] = {}
     
-    # NEW: Separate rules for formulas vs. simple replacements.
-    simple_rules = [r for r in rules if "formula_template" not in r]
-    formula_rules = [r for r in rules if "formula_template" in r]
+    # The rule list, compiled once: each cell is matched against all rules in one scan
+    compiled = compile_rules(rules, bool(invoice_data))
 
     for sheet in workbook.worksheets:
         if sheet.sheet_state != 'visible':
@@ -117,51 +244,48 @@ def find_and_replace(
 
         # --- PASS 1: Find all placeholder locations and apply simple replacements ---
         print("  PASS 1: Locating placeholders and applying simple value replacements...")
-        for row in sheet.iter_rows(max_row=limit_rows, max_col=limit_cols):
-            for cell in row:
-                if not isinstance(cell.value, str) or not cell.value:
-                    continue
-
-                # First, find and store the location of ANY placeholder
-                for rule in rules:
-                    if rule.get("find") == cell.value.strip():
-                        placeholder_locations[rule["find"]] = cell.coordinate
-                        break # Found the placeholder, no need to check other rules for this cell
-
-                # Second, apply SIMPLE replacement rules
-                for rule in simple_rules:
-                    text_to_find = rule.get("find")
-                    if not text_to_find:
-                        continue
-                    
-                    match_mode = rule.get("match_mode", "substring")
-                    is_match = (match_mode == 'exact' and cell.value.strip() == text_to_find) or \
-                               (match_mode == 'substring' and text_to_find in cell.value)
-
-                    if is_match:
-                        replacement_content = None
-                        if "data_path" in rule:
-                            if not invoice_data: continue
-                            replacement_content = _get_nested_data(invoice_data, rule["data_path"])
-                        elif "replace" in rule:
-                            replacement_content = rule["replace"]
-
-                        if replacement_content is not None:
-                            print(f"    -> Applying rule for '{text_to_find}' at {cell.coordinate}...")
-                            if rule.get("is_date", False):
-                                format_cell_as_date_smarter(cell, replacement_content)
-                            elif match_mode == 'exact':
-                                cell.value = replacement_content
-                            elif match_mode == 'substring':
-                                cell.value = cell.value.replace(str(text_to_find), str(replacement_content))
-                        break
+        sheet_text_cells = text_cells.get(sheet.title) if text_cells else None
+        if sheet_text_cells is not None:
+            cells_to_search = (sheet.cell(row=r, column=c) for r, c in sheet_text_cells if r <= limit_rows and c <= limit_cols)
+        else:
+            cells_to_search = (cell for row in sheet.iter_rows(max_row=limit_rows, max_col=limit_cols) for cell in row)
+        for cell in cells_to_search:
+            if not isinstance(cell.value, str) or not cell.value:
+                continue
+
+            stripped = cell.value.strip()
+            # First, find and store the location of ANY placeholder
+            if stripped in compiled.placeholders:
+                placeholder_locations[stripped] = cell.coordinate
+
+            # Second, apply the first matching SIMPLE replacement rule
+            rule = compiled.match(cell.value, stripped)
+            if rule is None:
+                continue
+
+            text_to_find = rule["find"]
+            match_mode = rule.get("match_mode", "substring")
+            replacement_content = None
+            if "data_path" in rule:
+                replacement_content = _get_nested_data(invoice_data, rule["data_path"])
+            elif "replace" in rule:
+                replacement_content = rule["replace"]
+
+            if replacement_content is not None:
+                print(f"    -> Applying rule for '{text_to_find}' at {cell.coordinate}...")
+                if rule.get("is_date", False):
+                    format_cell_as_date_smarter(cell, replacement_content)
+                elif match_mode == 'exact':
+                    cell.value = replacement_content
+                elif match_mode == 'substring':
+                    cell.value = cell.value.replace(str(text_to_find), str(replacement_content))
 
         # --- PASS 2: Build and apply formula-based replacements ---
         print("  PASS 2: Building and applying formula replacements...")
-        if not formula_rules:
+        if not compiled.formulas:
             print("    -> No formula rules to apply.")
         
-        for rule in formula_rules:
+        for rule, dependent_placeholders in compiled.formulas:
             formula_template = rule["formula_template"]
             target_placeholder = rule["find"]
             
@@ -171,9 +295,7 @@ def find_and_replace(
                 print(f"    -> WARNING: Could not find cell for formula placeholder '{target_placeholder}'. Skipping.")
                 continue
 
-            # Find all dependent placeholders (e.g., {[[NET]]}) in the template
-            dependent_placeholders = re.findall(r'(\{\[\[.*?\]\]\})', formula_template)
-            
+            # Dependent placeholders (e.g., {[[NET]]}) were found in the template at compile time
             final_formula_str = formula_template
             all_deps_found = True
             
@@ -197,12 +319,15 @@ def find_and_replace(
                 print(f"    -> SUCCESS: Placing formula '{final_formula_str}' in cell {target_cell_coord}.")
                 sheet[target_cell_coord].value = final_formula_str
 
+    return placeholder_locations
+
 
 # ==============================================================================
-# SECTION 3: TASK-RUNNER FUNCTIONS (No changes needed here)
+# SECTION 4: TASK-RUNNER FUNCTIONS (No changes needed here)
 # ==============================================================================
 
-def run_invoice_header_replacement_task(workbook: openpyxl.Workbook, invoice_data: Dict[str, Any]):
+def run_invoice_header_replacement_task(workbook: openpyxl.Workbook, invoice_data: Dict[str, Any],
+                                        text_cells: Optional[Dict[str, List[Tuple[int, int]]]] = None):
     """Defines and runs the data-driven header replacement task."""
     print("\n--- Running Invoice Header Replacement Task (within A1:N14) ---")
     header_rules = [
@@ -218,11 +343,13 @@ def run_invoice_header_replacement_task(workbook: openpyxl.Workbook, invoice_dat
         rules=header_rules,
         limit_rows=14,
         limit_cols=14,
-        invoice_data=invoice_data
+        invoice_data=invoice_data,
+        text_cells=text_cells
     )
     print("--- Finished Invoice Header Replacement Task ---")
 
-def run_fob_specific_replacement_task(workbook: openpyxl.Workbook):
+def run_fob_specific_replacement_task(workbook: openpyxl.Workbook,
+                                      text_cells: Optional[Dict[str, List[Tuple[int, int]]]] = None):
     """Defines and runs the hardcoded, FOB-specific replacement task."""
     print("\n--- Running FOB-Specific Replacement Task (within 50x16 grid) ---")
     fob_rules = [
@@ -245,7 +372,8 @@ def run_fob_specific_replacement_task(workbook: openpyxl.Workbook):
         workbook=workbook,
         rules=fob_rules,
         limit_rows=200,
-        limit_cols=16
+        limit_cols=16,
+        text_cells=text_cells
     )
     print("--- Finished FOB-Specific Replacement Task ---")
 
@@ -1,5 +1,4 @@
 import os
-import subprocess
 import argparse
 import sys
 from pathlib import Path
@@ -13,59 +12,14 @@ import re
 # Setup basic logging for the wrapper script
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-def run_script(script_path: Path, args: List[str] = [], cwd: Optional[Path] = None, script_name: str = "") -> bool:
-    """Runs a Python script using subprocess, handling potential errors."""
-    if not script_path.is_file():
-        logging.error(f"Script not found: {script_path}")
-        return False
-
-    command = [sys.executable, str(script_path)] + args
-    script_name = script_name or script_path.name
-    logging.info(f"Running {script_name}...")
-    logging.info(f"  Command: {' '.join(command)}")
-    if cwd:
-        if not Path(cwd).is_dir():
-            logging.error(f"Working directory not found for {script_name}: {cwd}")
-            return False
-        logging.info(f"  Working Directory for {script_name}: {cwd}")
-
-    try:
-        result = subprocess.run(
-            command,
-            capture_output=True,
-            text=True,
-            check=True,
-            cwd=cwd,
-            encoding='utf-8',
-            errors='replace'
-        )
-        stdout_content = result.stdout.strip() if result.stdout else ""
-        stderr_content = result.stderr.strip() if result.stderr else ""
-
-        if stdout_content:
-            logging.info(f"{script_name} Output:\n--- START ---\n{stdout_content}\n--- END ---")
-        else:
-            logging.info(f"{script_name} produced no standard output.")
-
-        if stderr_content:
-            logging.warning(f"{script_name} Stderr:\n--- START ---\n{stderr_content}\n--- END ---")
-
-        logging.info(f"{script_name} completed successfully.")
-        return True
-
-    except subprocess.CalledProcessError as e:
-        logging.error(f"Error running {script_name} (Return Code: {e.returncode}):")
-        stdout_content = e.stdout.strip() if e.stdout else "No stdout captured."
-        stderr_content = e.stderr.strip() if e.stderr else "No stderr captured."
-        logging.error(f"Stdout:\n{stdout_content}")
-        logging.error(f"Stderr:\n{stderr_content}")
-        return False
-    except FileNotFoundError:
-        logging.error(f"Error: Could not find executable '{sys.executable}' or script '{script_path}' during execution.")
-        return False
-    except Exception as e:
-        logging.error(f"An unexpected error occurred while trying to run {script_name}: {e}")
-        return False
+def import_pipeline(create_json_dir: Path, invoice_gen_dir: Path):
+    """Makes create_json and invoice_gen importable and returns (run_invoice_automation, generate_invoice)."""
+    for module_dir in (create_json_dir, invoice_gen_dir):
+        if str(module_dir) not in sys.path:
+            sys.path.insert(0, str(module_dir))
+    from main import run_invoice_automation # create_json/main.py (this wrapper runs as __main__)
+    import generate_invoice
+    return run_invoice_automation, generate_invoice
 
 def select_excel_file() -> Optional[Path]:
     """Opens a file dialog for the user to select an Excel file."""
@@ -167,14 +121,18 @@ def main():
             logging.error(f"{name} not found at expected location: {path_to_check}")
             sys.exit(1)
 
-    # --- Step 1: Run create_json/main.py ---
-    create_json_args = [
-        "--input-excel", str(input_excel_path),
-        "--output-dir", str(data_dir) # Output JSON to CWD/data/
-    ]
+    # Both steps run in this process; the extraction result is handed to invoice generation in memory
+    run_invoice_automation, generate_invoice = import_pipeline(create_json_dir, invoice_gen_dir)
+    generate_invoice.template_cache.configure_template_cache(current_working_dir / "data" / "template_cache")
+
+    # --- Step 1: Run create_json (in-process) ---
     logging.info(f"Running JSON creation step (create_json/main.py) using input: {input_excel_path}")
-    if not run_script(create_json_script, args=create_json_args, cwd=create_json_dir, script_name="create_json"):
-        logging.error("JSON creation script failed. Aborting.")
+    invoice_data = run_invoice_automation(
+        input_excel_override=str(input_excel_path),
+        output_dir_override=str(data_dir) # Output JSON to CWD/data/
+    )
+    if invoice_data is None:
+        logging.error("JSON creation step failed. Aborting.")
         sys.exit(1)
 
     # --- Step 2: Verify JSON Output ---
@@ -190,8 +148,13 @@ def main():
     if not expected_config_path.is_file():
         logging.error(f"Expected main config file '{expected_config_path}' not found in '{config_dir}'.")
         sys.exit(1)
+    paths = generate_invoice.derive_paths(str(expected_json_path), str(template_dir), str(config_dir))
+    invoice_config = generate_invoice.load_config(paths['config']) if paths else None
+    if not invoice_config:
+        logging.error("Could not resolve the template/config for invoice generation. Aborting.")
+        sys.exit(1)
 
-    # --- Step 4: Run invoice_gen/generate_invoice.py for each mode ---
+    # --- Step 4: Generate the invoice for each mode (in-process) ---
     active_modes = []
     if args.fob:
         active_modes.append(("fob", ["--fob"]))
@@ -203,20 +166,21 @@ def main():
     all_successful_invoice_generations = True
     generated_files_info = []
 
-    for mode_name, mode_flags in active_modes:
-        logging.info(f"--- Processing {mode_name.upper()} mode for invoice generation ---")
+    # The modes are independent, so they are rendered in parallel (one worker process each)
+    logging.info(f"Running Invoice generation (invoice_gen/generate_invoice.py) for modes: {[mode_name for mode_name, _ in active_modes]}")
+    generated, failed = generate_invoice.generate_modes(invoice_data, invoice_config, paths['template'], dict(active_modes))
+
+    for mode_name, _ in active_modes:
         output_filename = f"CT&INV&PL {identifier} {mode_name.upper()}.xlsx"
         # The invoice_output_dir is now correctly set to CWD/result/<identifier>/
-        invoice_gen_args = [
-            str(expected_json_path),
-            "--output", str(invoice_output_dir / output_filename),
-            "--templatedir", str(template_dir),
-            "--configdir", str(config_dir),
-        ] + mode_flags
-
-        logging.info(f"Running Invoice generation (invoice_gen/generate_invoice.py) to create: {output_filename}")
-        if not run_script(invoice_gen_script, args=invoice_gen_args, cwd=invoice_gen_dir, script_name=f"invoice_gen ({mode_name})"):
-            logging.error(f"Invoice generation script failed for {mode_name} mode.")
+        if mode_name in failed:
+            logging.error(f"Invoice generation failed for {mode_name} mode: {failed[mode_name]}")
+            all_successful_invoice_generations = False
+            continue
+        try:
+            (invoice_output_dir / output_filename).write_bytes(generated[mode_name])
+        except OSError as e:
+            logging.error(f"Could not write {mode_name} invoice '{output_filename}': {e}")
             all_successful_invoice_generations = False
         else:
             generated_files_info.append(f"{len(generated_files_info) + 1}. {mode_name.capitalize()}: {output_filename}")
@@ -233,6 +197,7 @@ def main():
         logging.info("Generated invoice versions:")
         for line in generated_files_info:
             logging.info(f"  - {line}")
+        logging.info(f"Template cache: {generate_invoice.template_cache.get_template_cache().stats()}")
 
     elif not active_modes:
         logging.warning("--- Automation SKIPPED --- No invoice generation modes were specified or active.")
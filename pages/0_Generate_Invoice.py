@@ -36,6 +36,8 @@ try:
     DATA_DIR = PROJECT_ROOT / "data"
     JSON_OUTPUT_DIR = DATA_DIR / "invoices_to_process"
     TEMP_UPLOAD_DIR = DATA_DIR / "temp_uploads"
+    EXTRACTION_CACHE_DIR = DATA_DIR / "extraction_cache"
+    TEMPLATE_CACHE_DIR = DATA_DIR / "template_cache"
     TEMPLATE_DIR = INVOICE_GEN_DIR / "TEMPLATE"
     CONFIG_DIR = INVOICE_GEN_DIR / "config"
     DATA_DIRECTORY = DATA_DIR / 'Invoice Record'
@@ -43,13 +45,17 @@ try:
     TABLE_NAME = 'invoices'
 
     # Create necessary directories
-    for dir_path in [JSON_OUTPUT_DIR, TEMP_UPLOAD_DIR, DATA_DIRECTORY, CONFIG_DIR]:
+    for dir_path in [JSON_OUTPUT_DIR, TEMP_UPLOAD_DIR, EXTRACTION_CACHE_DIR, TEMPLATE_CACHE_DIR, DATA_DIRECTORY, CONFIG_DIR]:
         dir_path.mkdir(parents=True, exist_ok=True)
 
     # Add script directories to path for imports
     if str(CREATE_JSON_DIR) not in sys.path: sys.path.insert(0, str(CREATE_JSON_DIR))
     if str(INVOICE_GEN_DIR) not in sys.path: sys.path.insert(0, str(INVOICE_GEN_DIR))
     from main import run_invoice_automation # For High-Quality Leather
+    from generate_invoice import derive_paths, generate_modes, load_config # In-process invoice generation
+    from template_cache import configure_template_cache
+    from template_catalog import get_catalog as get_template_catalog
+    configure_template_cache(TEMPLATE_CACHE_DIR) # Parsed templates stay in memory across reruns; snapshots survive restarts
 except (ImportError, IndexError, NameError) as e:
     st.error(f"Error: Could not configure project paths or import necessary scripts. Please check your project's directory structure. Details: {e}")
     st.exception(e)
@@ -196,24 +202,12 @@ with tab1:
 
     # --- Helper Functions Specific to High-Quality Workflow ---
     def find_incoterm_from_template(identifier: str):
-        terms_to_find = ["DAP", "FCA", "CIP"]
         if not identifier: return None
         match = re.match(r'([A-Za-z]+)', identifier)
         if not match: return None
-        template_file_path = TEMPLATE_DIR / f"{match.group(1)}.xlsx"
-        if not template_file_path.exists(): return None
-        try:
-            workbook = openpyxl.load_workbook(template_file_path, read_only=True)
-            sheet = workbook.active
-            for row in sheet.iter_rows(min_row=1, max_row=50):
-                for cell in row:
-                    if cell.value and isinstance(cell.value, str):
-                        for term in terms_to_find:
-                            if term in cell.value:
-                                workbook.close(); return term
-            workbook.close()
-        except Exception: pass
-        return None
+        # DAP/FCA/CIP found in the template's top rows, scanned once per template version
+        try: return get_template_catalog(TEMPLATE_DIR, CONFIG_DIR).incoterm(match.group(1))
+        except Exception: return None
 
     def validate_json_data(json_path: Path, required_keys: list) -> list:
         if not json_path.exists():
@@ -244,7 +238,7 @@ with tab1:
             with open(temp_file_path, "wb") as f: f.write(hq_uploaded_file.getbuffer())
 
             with st.spinner("Automatically processing and validating your file..."):
-                run_invoice_automation(input_excel_override=str(temp_file_path), output_dir_override=str(JSON_OUTPUT_DIR))
+                run_invoice_automation(input_excel_override=str(temp_file_path), output_dir_override=str(JSON_OUTPUT_DIR), cache_dir=str(EXTRACTION_CACHE_DIR))
                 json_path = JSON_OUTPUT_DIR / f"{st.session_state['hq_identifier']}.json"
 
                 if not json_path.exists():
@@ -335,35 +329,30 @@ with tab1:
             with st.spinner("Generating selected invoice files..."):
                 identifier = st.session_state['hq_identifier']
                 files_to_zip = [{"name": json_path.name, "data": json_path.read_bytes()}]
+                # Template and config are resolved once; every mode reuses them and the in-memory data
+                gen_paths = derive_paths(str(json_path), str(TEMPLATE_DIR), str(CONFIG_DIR))
+                gen_config = load_config(gen_paths['config']) if gen_paths else None
+                if not gen_config: st.error(f"Could not find the template/config for '{identifier}'."); st.stop()
                 detected_term = find_incoterm_from_template(identifier)
                 modes_to_run = []
                 if gen_normal: modes_to_run.append((detected_term if detected_term else "normal", []))
                 if gen_fob: modes_to_run.append(("fob", ["--fob"]))
                 if gen_combine: modes_to_run.append(("combine", ["--custom"]))
                 
-                success_count = 0
-                with tempfile.TemporaryDirectory() as temp_dir:
-                    temp_dir_path = Path(temp_dir)
-                    for mode_name, mode_flags in modes_to_run:
-                        final_mode_name = mode_name.upper()
-                        if mode_name == 'combine':
-                            final_mode_name = f"{(detected_term or '').upper()} COMBINE".strip()
-                        
-                        output_filename = f"CT&INV&PL {identifier} {final_mode_name}.xlsx"
-                        output_path = temp_dir_path / output_filename
-                        command = [sys.executable, str(INVOICE_GEN_DIR / "generate_invoice.py"), str(json_path), "--output", str(output_path), "--templatedir", str(TEMPLATE_DIR), "--configdir", str(CONFIG_DIR)] + mode_flags
-                        
-                        # Set the environment for the subprocess to handle Unicode correctly
-                        sub_env = os.environ.copy()
-                        sub_env['PYTHONIOENCODING'] = 'utf-8'
-                        
-                        try:
-                            # Add the 'env=sub_env' parameter to the call
-                            subprocess.run(command, check=True, capture_output=True, text=True, cwd=INVOICE_GEN_DIR, encoding='utf-8', errors='replace', env=sub_env)
-                            files_to_zip.append({"name": output_filename, "data": output_path.read_bytes()})
-                            success_count += 1
-                        except subprocess.CalledProcessError as e:
-                            st.error(f"Failed to generate '{final_mode_name}' version. Error: {e.stderr}")
+                final_mode_names = {}
+                for mode_name, _ in modes_to_run:
+                    final_mode_name = mode_name.upper()
+                    if mode_name == 'combine':
+                        final_mode_name = f"{(detected_term or '').upper()} COMBINE".strip()
+                    final_mode_names[mode_name] = final_mode_name
+
+                # All selected versions render in parallel from the (overridden) data loaded above
+                generated, failed = generate_modes(data, gen_config, gen_paths['template'], dict(modes_to_run))
+                for mode_name, error in failed.items():
+                    st.error(f"Failed to generate '{final_mode_names[mode_name]}' version. Error: {error}")
+                for mode_name, workbook_bytes in generated.items():
+                    files_to_zip.append({"name": f"CT&INV&PL {identifier} {final_mode_names[mode_name]}.xlsx", "data": workbook_bytes})
+                success_count = len(generated)
             
             # Offer download
             if success_count > 0: